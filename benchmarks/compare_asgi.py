@@ -0,0 +1,128 @@
+"""
+Compares the gevent (gunicorn) deployment of the app against the
+asyncio-native entry point (husky_musher/asgi.py, under uvicorn), by load
+testing the participant redirect ("/") of each against a local fake REDCap.
+
+    poetry run python -m benchmarks.compare_asgi --latency-ms 200 --concurrency 50
+
+Requires the packages listed in husky_musher/asgi.py, and uvicorn.
+"""
+import argparse
+import json
+import os
+from typing import Dict, List
+
+from benchmarks.fake_redcap import FakeREDCap, start_server
+from benchmarks.loadgen import run_load, sign_in
+from benchmarks.servers import get_tree_memory_mb, run_gunicorn, run_uvicorn
+
+SERVERS = {
+    "gevent": run_gunicorn,
+    "asgi": run_uvicorn,
+}
+
+COLUMNS = (
+    ("mode", 8),
+    ("throughput_rps", 15),
+    ("p50_ms", 9),
+    ("p99_ms", 9),
+    ("errors", 7),
+    ("memory_mb", 10),
+)
+
+
+def format_row(result: Dict) -> str:
+    return "".join(str(result[name]).rjust(width) for name, width in COLUMNS)
+
+
+def compare(
+    modes: List[str],
+    latency_seconds: float,
+    concurrency: int,
+    duration_seconds: float,
+    warmup_seconds: float,
+    env: Dict[str, str],
+    log_file,
+) -> List[Dict]:
+    redcap = FakeREDCap(latency_seconds)
+    redcap_server = start_server(redcap)
+    env = {
+        "REDCAP_API_URL": f"http://127.0.0.1:{redcap_server.server_port}/",
+        "REDCAP_API_TOKEN": "benchmark",
+        # The identity that the mock IdP signs everyone in as
+        "IDP_ATTR_uwnetid": "benchmark",
+        **env,
+    }
+    results = []
+    try:
+        for mode in modes:
+            with SERVERS[mode](env, log_file) as (base_url, pid):
+                headers = sign_in(base_url)
+
+                def make_request(worker_id: int, iteration: int):
+                    return "/", headers
+
+                # Registers the participant before the concurrent warmup, so
+                # that only one record is created
+                run_load(base_url, make_request, 1, 0.1)
+                run_load(base_url, make_request, concurrency, warmup_seconds)
+                load = run_load(base_url, make_request, concurrency, duration_seconds)
+                result = {
+                    "mode": mode,
+                    **load.summary(),
+                    "memory_mb": get_tree_memory_mb(pid),
+                }
+            print(format_row(result), flush=True)
+            results.append(result)
+    finally:
+        redcap_server.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument(
+        "--modes", type=lambda v: v.split(","), default=list(SERVERS.keys())
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=200,
+        help="How long the fake REDCap takes to respond to each call",
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The number of gunicorn workers; uvicorn always runs one process",
+    )
+    parser.add_argument("--output", help="Also write the results as json to this file")
+    parser.add_argument(
+        "--server-log",
+        default=os.devnull,
+        help="Where to write the servers' output (default: discard it)",
+    )
+    args = parser.parse_args(argv)
+
+    print("".join(name.rjust(width) for name, width in COLUMNS), flush=True)
+    with open(args.server_log, "a") as log_file:
+        results = compare(
+            args.modes,
+            latency_seconds=args.latency_ms / 1000,
+            concurrency=args.concurrency,
+            duration_seconds=args.duration,
+            warmup_seconds=args.warmup,
+            env={"GUNICORN_MAX_WORKERS": str(args.workers)},
+            log_file=log_file,
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+A local stand-in for the REDCap API, implementing just enough of it for the
+app to run against: record export (with `filterLogic` on uw_netid, and
+`dateRangeBegin`/`dateRangeEnd`), record import (with `forceAutoNumber`),
+`surveyLink` and `surveyQueueLink`.
+
+    python -m benchmarks.fake_redcap --port 8001 --latency-ms 200 \\
+        --error-rate 0.01 --returning 100 --enrolled 1000
+
+Then run the app with REDCAP_API_URL=http://localhost:8001/.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from husky_musher.utils.redcap import REDCAP_DATETIME_FORMAT
+from husky_musher.utils.sync import get_redcap_now
+
+FILTER_NETID = re.compile(r'\[uw_netid\] = "(?P<netid>[^"]*)"')
+
+
+def returning_netid(i: int) -> str:
+    """The netid of the i-th seeded participant who has not finished enrolling."""
+    return f"returning{i}"
+
+
+def enrolled_netid(i: int) -> str:
+    """The netid of the i-th seeded participant who has finished enrolling."""
+    return f"enrolled{i}"
+
+
+class FakeREDCap:
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        error_rate: float = 0.0,
+        timezone: str = "America/Los_Angeles",
+    ):
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.timezone = timezone
+        self.records: Dict[str, Dict[str, str]] = {}
+        # When each record was last modified, on the server's clock
+        self.modified_at: Dict[str, str] = {}
+        # The number of API calls received, by operation (see `get_operation`)
+        self.calls: Counter = Counter()
+        self._next_record_id = 1
+        self._lock = threading.Lock()
+
+    def seed(self, returning: int = 0, enrolled: int = 0):
+        """
+        Adds *returning* participants who have registered but not finished
+        the enrollment survey, and *enrolled* participants who have.
+        """
+        for i in range(returning):
+            self.add_record(
+                uw_netid=returning_netid(i), enrollment_questions_complete="0"
+            )
+        for i in range(enrolled):
+            self.add_record(
+                uw_netid=enrolled_netid(i), enrollment_questions_complete="2"
+            )
+
+    @staticmethod
+    def get_operation(form: Dict[str, str]) -> str:
+        content = form.get("content", "")
+        if content == "record":
+            return "import_record" if "data" in form else "export_records"
+        return content
+
+    def record_call(self, form: Dict[str, str]):
+        with self._lock:
+            self.calls[self.get_operation(form)] += 1
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def add_record(self, **fields) -> str:
+        with self._lock:
+            record_id = str(self._next_record_id)
+            self._next_record_id += 1
+            self.records[record_id] = {**fields, "record_id": record_id}
+            self.modified_at[record_id] = self.now()
+        return record_id
+
+    def update_record(self, record_id: str, **fields):
+        with self._lock:
+            self.records[record_id].update(fields)
+            self.modified_at[record_id] = self.now()
+
+    def now(self) -> str:
+        return get_redcap_now(self.timezone).strftime(REDCAP_DATETIME_FORMAT)
+
+    def export_records(self, form: Dict[str, str]) -> List[Dict[str, str]]:
+        records = list(self.records.values())
+        match = FILTER_NETID.search(form.get("filterLogic", ""))
+        if match:
+            records = [r for r in records if r.get("uw_netid") == match["netid"]]
+        record_ids = {v for k, v in form.items() if k.startswith("records[")}
+        if record_ids:
+            records = [r for r in records if r["record_id"] in record_ids]
+        # Both are inclusive; times in this format compare as strings do
+        begin, end = form.get("dateRangeBegin"), form.get("dateRangeEnd")
+        if begin or end:
+            records = [
+                r
+                for r in records
+                if (begin or "") <= self.modified_at[r["record_id"]] <= (end or "~")
+            ]
+        fields = [f for f in form.get("fields", "").split(",") if f]
+        if fields:
+            records = [{f: r.get(f, "") for f in fields} for r in records]
+        return records
+
+    def import_records(self, form: Dict[str, str]) -> List[str]:
+        imported = json.loads(form["data"])
+        if form.get("forceAutoNumber") == "true":
+            return [
+                self.add_record(**{k: v for k, v in r.items() if k != "record_id"})
+                for r in imported
+            ]
+        with self._lock:
+            for record in imported:
+                self.records.setdefault(record["record_id"], {}).update(record)
+                self.modified_at[record["record_id"]] = self.now()
+        return [r["record_id"] for r in imported]
+
+    def handle(self, form: Dict[str, str]) -> Optional[str]:
+        """Returns the response body for the API call in *form*."""
+        content = form.get("content")
+        if content == "record" and "data" in form:
+            return json.dumps(self.import_records(form))
+        if content == "record":
+            return json.dumps(self.export_records(form))
+        if content == "surveyLink":
+            return (
+                f"https://redcap.example.edu/surveys/?s={form['record']}"
+                f"-{form['event']}-{form['instrument']}"
+            )
+        if content == "surveyQueueLink":
+            return f"https://redcap.example.edu/surveys/?sq={form['record']}"
+        return None
+
+
+def create_handler(redcap: FakeREDCap):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            form = {
+                k: v[0]
+                for k, v in parse_qs(self.rfile.read(length).decode()).items()
+            }
+            redcap.record_call(form)
+            time.sleep(redcap.latency_seconds)
+            if redcap.should_fail():
+                status, body = 500, json.dumps({"error": "Injected failure"})
+            else:
+                body = redcap.handle(form)
+                status = 200 if body is not None else 400
+            if body is None:
+                content = form.get("content")
+                body = json.dumps({"error": f"Unsupported content: {content}"})
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body.encode())))
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_server(
+    redcap: FakeREDCap, host: str = "127.0.0.1", port: int = 0
+) -> ThreadingHTTPServer:
+    """Serves *redcap* from a background thread; returns the running server."""
+    server = ThreadingHTTPServer((host, port), create_handler(redcap))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="The fraction of calls that fail with a 500, between 0 and 1",
+    )
+    parser.add_argument(
+        "--returning",
+        type=int,
+        default=0,
+        help="The number of registered participants to seed",
+    )
+    parser.add_argument(
+        "--enrolled",
+        type=int,
+        default=0,
+        help="The number of fully enrolled participants to seed",
+    )
+    args = parser.parse_args(argv)
+    redcap = FakeREDCap(args.latency_ms / 1000, args.error_rate)
+    redcap.seed(returning=args.returning, enrolled=args.enrolled)
+    server = start_server(redcap, args.host, args.port)
+    print(f"Serving a fake REDCap API at http://{args.host}:{server.server_port}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
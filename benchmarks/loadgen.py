@@ -0,0 +1,170 @@
+"""
+A small closed-loop HTTP load generator: each of `concurrency` threads keeps
+one keep-alive connection open, and sends its next request as soon as the
+previous one completes, until the duration elapses.
+
+This is deliberately dependency-free so that it can drive any local
+instance of the app; at high concurrency the generator itself can become
+the bottleneck, so keep an eye on its CPU usage.
+"""
+import http.client
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Given a worker number and iteration, returns the path to request and any
+# extra headers (for instance, a session cookie).
+RequestFactory = Callable[[int, int], Tuple[str, Dict[str, str]]]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    >>> percentile([1, 2, 3, 4], 50)
+    2.5
+    >>> percentile([1, 2, 3, 4], 100)
+    4
+    >>> percentile([], 99)
+    0.0
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.status_codes: Dict[int, int] = {}
+        self.errors = 0
+        self.duration_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, status: Optional[int]):
+        with self._lock:
+            if status is None:
+                self.errors += 1
+                return
+            self.latencies.append(latency)
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+
+    @property
+    def num_requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        if not self.duration_seconds:
+            return 0.0
+        return self.num_requests / self.duration_seconds
+
+    def summary(self) -> Dict:
+        return {
+            "requests": self.num_requests,
+            "errors": self.errors,
+            "status_codes": {str(k): v for k, v in sorted(self.status_codes.items())},
+            "throughput_rps": round(self.throughput, 1),
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 2),
+            "p90_ms": round(percentile(self.latencies, 90) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+        }
+
+
+def _connect(url) -> http.client.HTTPConnection:
+    return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+
+
+def _run_worker(
+    base_url,
+    worker_id: int,
+    make_request: RequestFactory,
+    deadline: float,
+    result: LoadResult,
+):
+    conn = _connect(base_url)
+    iteration = 0
+    while time.monotonic() < deadline:
+        path, headers = make_request(worker_id, iteration)
+        iteration += 1
+        start_time = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            result.record(time.perf_counter() - start_time, response.status)
+            if response.will_close:
+                conn.close()
+                conn = _connect(base_url)
+        except (OSError, http.client.HTTPException):
+            result.record(time.perf_counter() - start_time, None)
+            conn.close()
+            conn = _connect(base_url)
+    conn.close()
+
+
+def run_load(
+    base_url: str,
+    make_request: RequestFactory,
+    concurrency: int,
+    duration_seconds: float,
+) -> LoadResult:
+    url = urlparse(base_url)
+    result = LoadResult()
+    deadline = time.monotonic() + duration_seconds
+    threads = [
+        threading.Thread(
+            target=_run_worker,
+            args=(url, i, make_request, deadline, result),
+            daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    start_time = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.duration_seconds = time.monotonic() - start_time
+    return result
+
+
+def wait_until_ready(base_url: str, path: str = "/status", timeout: float = 30):
+    url = urlparse(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = _connect(url)
+        try:
+            conn.request("GET", path)
+            if conn.getresponse().status < 500:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.2)
+    raise TimeoutError(f"{base_url}{path} was not ready after {timeout}s")
+
+
+def sign_in(base_url: str, path: str = "/mock-saml/login") -> Dict[str, str]:
+    """
+    Signs in through the mock IdP (the app must be running with USE_MOCK_IDP),
+    and returns the headers that carry the resulting session.
+    """
+    url = urlparse(base_url)
+    conn = _connect(url)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        cookies = [
+            value.split(";", 1)[0]
+            for header, value in response.getheaders()
+            if header.lower() == "set-cookie"
+        ]
+    finally:
+        conn.close()
+    return {"Cookie": "; ".join(cookies)}
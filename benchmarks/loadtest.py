@@ -0,0 +1,320 @@
+"""
+End-to-end load test: boots the app (with USE_MOCK_IDP) against a local fake
+REDCap API (benchmarks/fake_redcap.py), drives a mix of participant traffic
+at it, and reports throughput, latency percentiles and the number of calls
+made to REDCap.
+
+    poetry run python -m benchmarks.loadtest --mix realistic --latency-ms 100
+
+Each participant type is a different pool of signed-in users:
+
+  - first-visit: users with no REDCap record yet, who get registered.
+  - returning: registered users who have not finished the enrollment survey.
+  - enrolled: users who have finished enrolling, and go to their survey queue.
+
+Pass `--save-baseline` to (over)write the baseline for the mix in
+benchmarks/baselines/, and `--compare` to compare a run to it. Pass
+`--replay` to answer REDCap calls with captured production traffic
+instead (see husky_musher/utils/recording.py).
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import threading
+from typing import Callable, Dict, List
+
+from benchmarks.fake_redcap import (
+    FakeREDCap,
+    enrolled_netid,
+    returning_netid,
+    start_server,
+)
+from benchmarks.loadgen import run_load, sign_in
+from benchmarks.servers import get_tree_memory_mb, run_gunicorn, run_uvicorn
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+SERVERS = {
+    "gevent": run_gunicorn,
+    "asgi": run_uvicorn,
+}
+
+# The share of requests made by each participant type.
+MIXES = {
+    "first-visit": {"first-visit": 1.0},
+    "returning": {"returning": 1.0},
+    "enrolled": {"enrolled": 1.0},
+    # Most traffic comes from enrolled participants returning to their
+    # survey queue; a few are signing up or finishing their enrollment.
+    "realistic": {"first-visit": 0.05, "returning": 0.15, "enrolled": 0.8},
+}
+
+# Metrics compared against the baseline, and whether higher is better.
+COMPARED_METRICS = {
+    "throughput_rps": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "upstream_calls_per_request": False,
+}
+
+
+class SessionPool:
+    """Signed-in sessions for one participant type."""
+
+    def __init__(self, sessions: List[Dict[str, str]], cycle: bool):
+        self.sessions = sessions
+        # First visits should each be made by a different user, so that pool
+        # is consumed in order (and wraps around, as returning users, once
+        # it runs out); the other pools are sampled at random.
+        self.cycle = cycle
+        self._counter = itertools.count()
+
+    @classmethod
+    def sign_in(
+        cls, base_url: str, netids: List[str], cycle: bool = False
+    ) -> "SessionPool":
+        return cls(
+            [sign_in(base_url, f"/mock-saml/login?uwnetid={n}") for n in netids],
+            cycle,
+        )
+
+    def get(self, rng: random.Random) -> Dict[str, str]:
+        if self.cycle:
+            return self.sessions[next(self._counter) % len(self.sessions)]
+        return rng.choice(self.sessions)
+
+
+class TrafficMix:
+    """A `RequestFactory` that sends each request as a participant of a type
+    chosen at random, weighted by the mix."""
+
+    def __init__(self, weights: Dict[str, float], pools: Dict[str, SessionPool]):
+        self.types = list(weights.keys())
+        self.weights = [weights[t] for t in self.types]
+        self.pools = pools
+        self._rngs: Dict[int, random.Random] = {}
+        self._lock = threading.Lock()
+
+    def _get_rng(self, worker_id: int) -> random.Random:
+        with self._lock:
+            if worker_id not in self._rngs:
+                self._rngs[worker_id] = random.Random(worker_id)
+            return self._rngs[worker_id]
+
+    def __call__(self, worker_id: int, iteration: int):
+        rng = self._get_rng(worker_id)
+        participant_type = rng.choices(self.types, self.weights)[0]
+        return "/", self.pools[participant_type].get(rng)
+
+
+def create_pools(
+    base_url: str, weights: Dict[str, float], pool_sizes: Dict[str, int]
+) -> Dict[str, SessionPool]:
+    netids: Dict[str, Callable[[int], str]] = {
+        "first-visit": lambda i: f"new{i}",
+        "returning": returning_netid,
+        "enrolled": enrolled_netid,
+    }
+    return {
+        participant_type: SessionPool.sign_in(
+            base_url,
+            [netids[participant_type](i) for i in range(pool_sizes[participant_type])],
+            cycle=participant_type == "first-visit",
+        )
+        for participant_type, weight in weights.items()
+        if weight
+    }
+
+
+def run_mix(
+    mix: str,
+    server: str,
+    redcap: FakeREDCap,
+    env: Dict[str, str],
+    pool_sizes: Dict[str, int],
+    concurrency: int,
+    duration_seconds: float,
+    warmup_seconds: float,
+    log_file,
+) -> Dict:
+    weights = MIXES[mix]
+    with SERVERS[server](env, log_file) as (base_url, pid):
+        make_request = TrafficMix(weights, create_pools(base_url, weights, pool_sizes))
+        run_load(base_url, make_request, concurrency, warmup_seconds)
+        redcap.reset_calls()
+        load = run_load(base_url, make_request, concurrency, duration_seconds)
+        memory_mb = get_tree_memory_mb(pid)
+    upstream_calls = dict(sorted(redcap.calls.items()))
+    summary = load.summary()
+    return {
+        "mix": mix,
+        **summary,
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_request": round(
+            sum(upstream_calls.values()) / max(summary["requests"], 1), 2
+        ),
+        "memory_mb": memory_mb,
+    }
+
+
+def get_baseline_path(mix: str) -> str:
+    return os.path.join(BASELINE_DIR, f"loadtest-{mix}.json")
+
+
+def compare_to_baseline(result: Dict, baseline: Dict) -> List[str]:
+    """Returns a line for each compared metric: its baseline and current value."""
+    lines = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        before, after = baseline["result"][metric], result[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        better = change >= 0 if higher_is_better else change <= 0
+        lines.append(
+            f"  {metric:>28}: {before:>10} -> {after:>10} ({change:+.1f}%"
+            f"{'' if better or not change else ', worse'})"
+        )
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument(
+        "--mix",
+        type=lambda v: v.split(","),
+        default=["realistic"],
+        help=f"A comma-separated list of: {', '.join(MIXES)}",
+    )
+    parser.add_argument("--server", choices=SERVERS.keys(), default="gevent")
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=100,
+        help="How long the fake REDCap takes to respond to each call",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="The fraction of REDCap calls that fail, between 0 and 1",
+    )
+    parser.add_argument(
+        "--records",
+        type=int,
+        default=1000,
+        help="The number of participants in the fake REDCap project; "
+        "a tenth of them have not finished enrolling",
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=100,
+        help="The number of signed-in users of each participant type. "
+        "Without REDIS_HOST, sessions are stored on disk, which keeps "
+        "at most 500 of them.",
+    )
+    parser.add_argument(
+        "--replay",
+        help="Answer REDCap calls from this capture file (see "
+        "husky_musher/utils/recording.py) instead of the fake REDCap; "
+        "calls are then not counted. Only supported with --server gevent.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1,
+        help="Multiplies the captured latencies when replaying",
+    )
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--output", help="Also write the results as json to this file")
+    parser.add_argument(
+        "--server-log",
+        default=os.devnull,
+        help="Where to write the server's output (default: discard it)",
+    )
+    args = parser.parse_args(argv)
+
+    num_returning = args.records // 10
+    pool_sizes = {
+        "first-visit": args.users,
+        "returning": min(args.users, num_returning),
+        "enrolled": min(args.users, args.records - num_returning),
+    }
+    parameters = {
+        "server": args.server,
+        "latency_ms": args.latency_ms,
+        "error_rate": args.error_rate,
+        "records": args.records,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "duration_seconds": args.duration,
+        "workers": args.workers,
+        "replay": args.replay and os.path.basename(args.replay),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+    results = []
+    for mix in args.mix:
+        # A fresh REDCap project for each mix, so that first visits in one
+        # mix do not become returning visits in the next
+        redcap = FakeREDCap(args.latency_ms / 1000, args.error_rate)
+        redcap.seed(returning=num_returning, enrolled=args.records - num_returning)
+        redcap_server = start_server(redcap)
+        env = {
+            "REDCAP_API_URL": f"http://127.0.0.1:{redcap_server.server_port}/",
+            "REDCAP_API_TOKEN": "loadtest",
+            "GUNICORN_MAX_WORKERS": str(args.workers),
+            # Sessions must outlive the test
+            "SESSION_LIFETIME_SECONDS": "3600",
+        }
+        if args.replay:
+            env["REDCAP_REPLAY_PATH"] = os.path.abspath(args.replay)
+            env["REDCAP_REPLAY_SPEED"] = str(args.replay_speed)
+        try:
+            with open(args.server_log, "a") as log_file:
+                result = run_mix(
+                    mix,
+                    args.server,
+                    redcap,
+                    env,
+                    pool_sizes,
+                    concurrency=args.concurrency,
+                    duration_seconds=args.duration,
+                    warmup_seconds=args.warmup,
+                    log_file=log_file,
+                )
+        finally:
+            redcap_server.shutdown()
+        print(json.dumps(result), flush=True)
+        results.append(result)
+
+        baseline_path = get_baseline_path(mix)
+        if args.compare and os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+            print(f"Compared to {baseline_path}:")
+            print("\n".join(compare_to_baseline(result, baseline)))
+            differences = {
+                k: v for k, v in baseline["parameters"].items() if parameters.get(k) != v
+            }
+            if differences:
+                print(f"  (the baseline was recorded with {differences})")
+        if args.save_baseline:
+            with open(baseline_path, "w") as f:
+                json.dump({"parameters": parameters, "result": result}, f, indent=2)
+                f.write("\n")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"parameters": parameters, "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
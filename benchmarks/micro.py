@@ -0,0 +1,300 @@
+"""
+Microbenchmarks for the functions that run on every request.
+
+    poetry run python -m benchmarks.micro
+    poetry run python -m benchmarks.micro --compare --threshold 10
+
+Each benchmark is calibrated to run for at least `--min-time` seconds per
+repetition, and repeated `--repeat` times with the garbage collector
+disabled; the median time per call is reported along with the fastest
+repetition and the spread. `--save-baseline` writes the results to
+benchmarks/baselines/micro.json; `--compare` runs the suite, compares it
+to that file, and exits with status 1 if any benchmark is slower than the
+baseline by more than `--threshold` percent.
+
+Comparisons use the fastest repetition, which is the least affected by
+other activity on the machine (as the timeit documentation recommends);
+still, record baselines and compare against them on the same, otherwise
+idle, machine.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import sys
+import timeit
+from typing import Callable, Dict, List
+
+from injector import Injector
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines", "micro.json"
+)
+
+# The attributes of a typical participant, as the IdP provides them
+USER_ATTRIBUTES = {
+    "uwnetid": "participant",
+    "email": "participant@uw.edu",
+    "registered_given_name": "Husky",
+    "registered_surname": "Participant",
+    "home_dept": "College of Engineering:Computer Science & Engineering",
+    "affiliations": ["member", "student", "staff"],
+}
+
+# A typical record, as returned by REDCapClient.fetch_participant
+REDCAP_RECORD = {
+    "record_id": "1234",
+    "uw_netid": "participant",
+    "eligibility_screening_complete": "2",
+    "enrollment_questions_complete": "2",
+}
+
+# A benchmark is set up by a function that is given an injector, and
+# returns the callable to time.
+BENCHMARKS: Dict[str, Callable[[Injector], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def decorator(setup: Callable[[Injector], Callable[[], object]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+@benchmark("extract_user_info")
+def bench_extract_user_info(injector: Injector):
+    from husky_musher.utils.shibboleth import extract_user_info
+
+    return lambda: extract_user_info(USER_ATTRIBUTES)
+
+
+@benchmark("extract_affiliation")
+def bench_extract_affiliation(injector: Injector):
+    from husky_musher.utils.shibboleth import extract_affiliation
+
+    return lambda: extract_affiliation(USER_ATTRIBUTES)
+
+
+@benchmark("Cache._sanitize_value[dict]")
+def bench_sanitize_value_dict(injector: Injector):
+    from husky_musher.utils.cache import Cache
+
+    return lambda: Cache._sanitize_value(REDCAP_RECORD)
+
+
+@benchmark("Cache._sanitize_value[str]")
+def bench_sanitize_value_str(injector: Injector):
+    from husky_musher.utils.cache import Cache
+
+    return lambda: Cache._sanitize_value("participant")
+
+
+@benchmark("Cache.get[load_json]")
+def bench_cache_get_json(injector: Injector):
+    from husky_musher.utils.cache import Cache
+
+    cache = injector.get(Cache)
+    cache.set("participant", REDCAP_RECORD)
+    return lambda: cache.get("participant", load_json=True)
+
+
+@benchmark("redcap_registration_complete")
+def bench_registration_complete(injector: Injector):
+    from husky_musher.utils.redcap import REDCapClient
+
+    client = injector.get(REDCapClient)
+    return lambda: client.redcap_registration_complete(REDCAP_RECORD)
+
+
+@benchmark("redcap_registration_complete[cached]")
+def bench_registration_complete_cached(injector: Injector):
+    from husky_musher.utils.redcap import REDCapClient
+
+    client = injector.get(REDCapClient)
+    client.redcap_registration_complete(REDCAP_RECORD, netid="participant")
+    return lambda: client.redcap_registration_complete(
+        REDCAP_RECORD, netid="participant"
+    )
+
+
+def create_log_record() -> logging.LogRecord:
+    return logging.LogRecord(
+        "gunicorn.error.app", logging.INFO, __file__, 1, "Hello, %s", ("world",), None
+    )
+
+
+@benchmark("JsonFormatter.format")
+def bench_json_formatter(injector: Injector):
+    from husky_musher.logging import JsonFormatter
+
+    formatter = JsonFormatter()
+    formatter.injector = injector
+    record = create_log_record()
+    return lambda: formatter.format(record)
+
+
+@benchmark("JsonFormatter.format[request]")
+def bench_json_formatter_request(injector: Injector):
+    from flask import Flask
+
+    from husky_musher.logging import JsonFormatter
+
+    formatter = JsonFormatter()
+    formatter.injector = injector
+    record = create_log_record()
+    # Left open for the rest of the run; the other benchmarks do not
+    # depend on whether there is a request
+    injector.get(Flask).test_request_context("/").push()
+    return lambda: formatter.format(record)
+
+
+@benchmark("view[/, signed out]")
+def bench_redirect_view(injector: Injector):
+    from flask import Flask
+
+    app = injector.get(Flask)
+    # As registered, after Flask-Injector; signed out, the view itself only
+    # returns a redirect, so this is mostly the cost of calling it
+    view = app.view_functions["app.render_redirect"]
+    app.test_request_context("/").push()
+    return view
+
+
+@benchmark("call_with_injection[singleton]")
+def bench_inject_singleton(injector: Injector):
+    from injector import inject
+
+    from husky_musher.utils.redcap import REDCapClient
+
+    # What a view that took a singleton as an argument, rather than from its
+    # blueprint, would pay on each request; see husky_musher/utils/injection.py
+    @inject
+    def view(client: REDCapClient):
+        pass
+
+    return lambda: injector.call_with_injection(view)
+
+
+def measure(func: Callable[[], object], repeat: int, min_time: float) -> Dict:
+    timer = timeit.Timer(func)
+    # Calibrate the number of calls per repetition, as `autorange` does
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    median = statistics.median(times)
+    return {
+        "median_ns": round(median * 1e9, 1),
+        "min_ns": round(min(times) * 1e9, 1),
+        "stdev_ns": round(statistics.stdev(times) * 1e9, 1) if repeat > 1 else 0.0,
+        "calls_per_repeat": number,
+        "repeat": repeat,
+    }
+
+
+def run(names: List[str], repeat: int, min_time: float) -> Dict[str, Dict]:
+    from husky_musher.app import create_app, create_app_injector
+
+    injector = create_app_injector()
+    # Installs the bindings that Flask-Injector adds (e.g., for the request)
+    create_app(injector)
+    results = {}
+    for name in names:
+        func = BENCHMARKS[name](injector)
+        func()
+        results[name] = measure(func, repeat, min_time)
+        print(format_result(name, results[name]), flush=True)
+    return results
+
+
+def format_result(name: str, result: Dict) -> str:
+    spread = result["stdev_ns"] / result["median_ns"] * 100 if result["median_ns"] else 0
+    return (
+        f"{name:<40} {result['median_ns']:>12,.1f} ns"
+        f"  (min {result['min_ns']:,.1f}, ±{spread:.1f}%)"
+    )
+
+
+def compare(
+    results: Dict[str, Dict], baseline: Dict[str, Dict], threshold_pct: float
+) -> List[str]:
+    """
+    Prints how each benchmark compares to its baseline, and returns the names
+    of those that are slower by more than *threshold_pct* percent.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<40} (no baseline)")
+            continue
+        before, after = baseline[name]["min_ns"], result["min_ns"]
+        change = (after - before) / before * 100
+        regressed = change > threshold_pct
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<40} {before:>12,.1f} -> {after:>12,.1f} ns ({change:+.1f}%)"
+            f"{'  SLOWER' if regressed else ''}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument(
+        "--filter", help="Only run benchmarks whose name matches this regex"
+    )
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="The minimum duration of each repetition, in seconds",
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10,
+        help="How much slower than the baseline (in percent) is a regression",
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    names = [n for n in BENCHMARKS if not args.filter or re.search(args.filter, n)]
+    results = run(names, args.repeat, args.min_time)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "results": {**baseline, **results},
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared to {args.baseline} (python {baseline['python']}):")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+            sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
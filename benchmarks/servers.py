@@ -0,0 +1,135 @@
+"""
+Helpers to boot local instances of the app for benchmarks, using the same
+entry points and configuration that are deployed.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List
+
+from benchmarks.loadgen import wait_until_ready
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_children(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, but is wrapped in parens
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def _get_memory_kb(pid: int) -> int:
+    """
+    Prefers the proportional set size (PSS), which splits pages shared
+    through copy-on-write between the processes sharing them; summing RSS
+    across preforked workers would count shared pages once per worker.
+    """
+    for path, field in (
+        (f"/proc/{pid}/smaps_rollup", "Pss:"),
+        (f"/proc/{pid}/status", "VmRSS:"),
+    ):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1])
+        except OSError:
+            continue
+    return 0
+
+
+def get_tree_memory_mb(pid: int) -> float:
+    """Memory used by a process (e.g., a gunicorn arbiter) and its children."""
+    return round(
+        sum(_get_memory_kb(p) for p in [pid, *_get_children(pid)]) / 1024, 1
+    )
+
+
+@contextmanager
+def run_server(args: List[str], env: Dict[str, str], log_file, port: int):
+    """
+    Runs `python <args>` from the repository root until the context exits;
+    yields the server's base url and pid once it is ready.
+    """
+    env = {
+        **os.environ,
+        "USE_MOCK_IDP": "1",
+        **env,
+    }
+    process = subprocess.Popen(
+        [sys.executable, *args],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url)
+        yield base_url, process.pid
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextmanager
+def run_gunicorn(env: Dict[str, str], log_file):
+    """Boots the app under gunicorn, with gevent workers (as deployed)."""
+    port = get_free_port()
+    env = {
+        "PROMETHEUS_MULTIPROC_DIR": tempfile.mkdtemp(prefix="musher-prometheus-"),
+        "GUNICORN_LOG_LEVEL": "WARNING",
+        **env,
+    }
+    args = [
+        "-m",
+        "gunicorn",
+        "-c",
+        "gunicorn.conf.py",
+        "--bind",
+        f"127.0.0.1:{port}",
+        "husky_musher.app:create_app()",
+    ]
+    with run_server(args, env, log_file, port) as server:
+        yield server
+
+
+@contextmanager
+def run_uvicorn(env: Dict[str, str], log_file):
+    """Boots the asyncio-native entry point (husky_musher/asgi.py) under uvicorn."""
+    port = get_free_port()
+    args = [
+        "-m",
+        "uvicorn",
+        "--factory",
+        "husky_musher.asgi:create_asgi_app",
+        "--port",
+        str(port),
+        "--log-level",
+        "warning",
+    ]
+    with run_server(args, env, log_file, port) as server:
+        yield server
@@ -0,0 +1,125 @@
+"""
+Sweeps gunicorn worker counts against per-worker greenlet concurrency
+(`worker_connections`), load testing a local instance of the app for each
+combination, and reports throughput, latency percentiles and memory usage.
+
+    poetry run python -m benchmarks.tune_concurrency \\
+        --workers 1,2,4 --worker-connections 10,100,1000 \\
+        --concurrency 100 --duration 20
+
+Run this on a machine (or pod) the same size as the one you are tuning for;
+pass the winning values to the deployment as GUNICORN_MAX_WORKERS and
+GUNICORN_WORKER_CONNECTIONS. See docs/operations.md.
+"""
+import argparse
+import json
+import os
+from typing import Dict, Iterable, List
+
+from benchmarks.loadgen import RequestFactory, run_load
+from benchmarks.servers import get_tree_memory_mb, run_gunicorn
+
+
+def sweep(
+    workers: Iterable[int],
+    worker_connections: Iterable[int],
+    concurrency: int,
+    duration_seconds: float,
+    warmup_seconds: float,
+    make_request: RequestFactory,
+    env: Dict[str, str],
+    log_file,
+) -> List[Dict]:
+    results = []
+    for num_workers in workers:
+        for connections in worker_connections:
+            gunicorn_env = {
+                **env,
+                "GUNICORN_MAX_WORKERS": str(num_workers),
+                "GUNICORN_WORKER_CONNECTIONS": str(connections),
+            }
+            with run_gunicorn(gunicorn_env, log_file) as (base_url, pid):
+                run_load(base_url, make_request, concurrency, warmup_seconds)
+                load = run_load(base_url, make_request, concurrency, duration_seconds)
+                result = {
+                    "workers": num_workers,
+                    "worker_connections": connections,
+                    **load.summary(),
+                    "memory_mb": get_tree_memory_mb(pid),
+                }
+            print(format_row(result), flush=True)
+            results.append(result)
+    return results
+
+
+COLUMNS = (
+    ("workers", 8),
+    ("worker_connections", 19),
+    ("throughput_rps", 15),
+    ("p50_ms", 9),
+    ("p99_ms", 9),
+    ("errors", 7),
+    ("memory_mb", 10),
+)
+
+
+def format_header() -> str:
+    return "".join(name.rjust(width) for name, width in COLUMNS)
+
+
+def format_row(result: Dict) -> str:
+    return "".join(str(result[name]).rjust(width) for name, width in COLUMNS)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--workers", type=_int_list, default=[1, 2, 4])
+    parser.add_argument(
+        "--worker-connections", type=_int_list, default=[10, 100, 1000]
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=100,
+        help="The number of simultaneous clients",
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--path", default="/status", help="The path to load test")
+    parser.add_argument(
+        "--output", help="Also write the results as json to this file"
+    )
+    parser.add_argument(
+        "--server-log",
+        default=os.devnull,
+        help="Where to write gunicorn's output (default: discard it)",
+    )
+    args = parser.parse_args(argv)
+
+    def make_request(worker_id: int, iteration: int):
+        return args.path, {}
+
+    print(format_header(), flush=True)
+    with open(args.server_log, "a") as log_file:
+        results = sweep(
+            args.workers,
+            args.worker_connections,
+            concurrency=args.concurrency,
+            duration_seconds=args.duration,
+            warmup_seconds=args.warmup,
+            make_request=make_request,
+            env={},
+            log_file=log_file,
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -2,33 +2,130 @@ from gevent import monkey
 
 monkey.patch_all()
 
+import gc  # noqa: E402
 import os  # noqa: E402
+import time  # noqa: E402
 from multiprocessing import cpu_count  # noqa: E402
 from prometheus_flask_exporter.multiprocess import (  # noqa: E402
     GunicornInternalPrometheusMetrics,
 )
 
+from husky_musher.utils.metrics import MultiprocessCompactor  # noqa: E402
+from husky_musher.utils.startup import startup_timer  # noqa: E402
+
 if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
     raise EnvironmentError("PROMETHEUS_MULTIPROC_DIR environment variable must be set!")
 
+# Dead workers' counter and histogram files are folded into a single archive
+# at most once per interval, so that scrapes don't slow down as workers recycle.
+# Set to 0 to disable compaction.
+metrics_compactor = MultiprocessCompactor(
+    os.environ["PROMETHEUS_MULTIPROC_DIR"],
+    interval_seconds=int(os.environ.get("PROMETHEUS_COMPACTION_INTERVAL_SECONDS", 300)),
+)
+
+
+preload_app = os.environ.get("FLASK_ENV") != "development"
+
+if preload_app:
+    # Objects allocated while the app is preloaded are shared with every
+    # worker through copy-on-write. Disabling collection until the app is
+    # loaded avoids leaving freed holes in those pages, and freezing them
+    # keeps workers' collections from writing to (and so copying) them.
+    # See https://docs.python.org/3/library/gc.html#gc.freeze
+    gc.disable()
+    # Timed here, by the caller, so that the app's own imports stay in the
+    # usual order; create_app logs it with the other startup phases. For a
+    # breakdown by module, run `python -X importtime -c "import husky_musher.app"`.
+    with startup_timer.phase("imports"):
+        import husky_musher.app  # noqa: F401
+
+
+def when_ready(server):
+    if preload_app:
+        gc.freeze()
+        gc.enable()
+
 
-def worker_exit(worker, server):
-    worker.log.info(f"Server {server} shutting down . . .")
+def pre_fork(server, worker):
+    if preload_app:
+        # Also freeze anything the arbiter has allocated since, so that
+        # recycled workers share as much as the first ones did.
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.boot_start_time = time.time()
+
+
+def post_worker_init(worker):
+    duration = round(time.time() - worker.boot_start_time, 3)
+    worker.log.info(f"Worker {worker.pid} booted in {duration}s")
+    # Threads don't survive a fork, so each worker starts its own; jobs that
+    # must only run once at a time coordinate through a lease in redis.
+    memory_monitor = worker.wsgi.extensions.get("memory_monitor")
+    if memory_monitor:
+        # Stops accepting requests, and exits once those in flight are
+        # served; the arbiter then starts a new worker
+        memory_monitor.recycle = lambda: setattr(worker, "alive", False)
+    worker.wsgi.extensions["background_jobs"].start()
+
+
+def worker_exit(server, worker):
+    worker.log.info(f"Worker {worker.pid} shutting down . . .")
+    # Releases the leases of the jobs this worker runs (e.g., the sync), so
+    # that another worker takes them over without waiting for them to expire
+    worker.wsgi.extensions["background_jobs"].stop()
+
+
+def available_cpus() -> int:
+    """
+    The number of CPUs this container may use. cpu_count() reports every
+    CPU on the node, regardless of the pod's CPU limit.
+    """
+    try:
+        # cgroup v2, e.g. "200000 100000" for a limit of 2 CPUs, or "max 100000"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return cpu_count()
 
 
 def max_workers():
-    default_max = 2 * cpu_count() + 1
-    return os.environ.get("GUNICORN_MAX_WORKERS", default_max)
+    # gevent workers spend most of their time waiting on REDCap, and serve
+    # up to `worker_connections` requests each at once; the sync worker
+    # formula of 2 * CPUs + 1 just adds memory and context switching. The
+    # extra worker keeps a process accepting requests while another recycles.
+    # Use `python -m benchmarks.tune_concurrency` to choose values from data.
+    default_max = available_cpus() + 1
+    return int(os.environ.get("GUNICORN_MAX_WORKERS", default_max))
 
 
 def child_exit(server, worker):
     GunicornInternalPrometheusMetrics.mark_process_dead_on_child_exit(worker.pid)
+    # The exited worker has already been removed from server.WORKERS;
+    # the arbiter itself may also have written metrics while preloading the app.
+    live_pids = {server.pid, *server.WORKERS.keys()}
+    metrics_compactor.maybe_compact(live_pids, logger=server.log)
 
 
-max_requests = 1000
+# Workers are recycled when their memory grows past WORKER_MEMORY_LIMIT_MB (see
+# husky_musher/utils/memory.py), not after a number of requests, so that they
+# keep their REDCap connections and in-process caches for as long as they're
+# healthy. GUNICORN_MAX_REQUESTS (off by default) still caps the number of
+# requests, with 10% jitter so that workers don't all restart together.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
 bind = "0.0.0.0:8000"
 worker_class = "gevent"
 workers = max_workers()
+# The maximum number of requests (greenlets) each worker serves at once
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
 loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "DEBUG")
 reload = os.environ.get("FLASK_ENV") == "development"
-preload_app = os.environ.get("FLASK_ENV") != "development"
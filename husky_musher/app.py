@@ -1,29 +1,34 @@
 import logging
 import os
-from logging.config import dictConfig
+import time
 from typing import cast
 
-import yaml
 from flask import Flask, render_template, session as flask_session
 from flask_injector import FlaskInjector, request
 from flask_session import RedisSessionInterface, Session
 from injector import Injector
 from prometheus_flask_exporter import PrometheusMetrics
-from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics
 from redis import Redis
 from werkzeug.local import LocalProxy
-from yaml import SafeLoader
 
 from husky_musher.blueprints.app import AppBlueprint
+from husky_musher.blueprints.redcap import REDCapBlueprint
 from husky_musher.blueprints.saml import MockSAMLBlueprint, SAMLBlueprint
-from husky_musher.utils.cache import MockRedis
+from husky_musher.utils.cache import Lease, MockRedis
+from husky_musher.utils.jobs import BackgroundJobs, PeriodicJob
+from husky_musher.utils.memory import (
+    MemoryMonitor,
+    WorkerAllocatedBlocksGauge,
+    WorkerMemoryGauge,
+    WorkerMemoryRecycleCounter,
+)
+from husky_musher.utils.metrics import MetricsScrapeSecondsHistogram, time_scrape
+from husky_musher.utils.probes import ProbeMiddleware, ReadinessChecks
 from husky_musher.utils.redcap import *
-
-if os.environ.get("GUNICORN_LOG_LEVEL", None):
-    MetricsClientCls = GunicornInternalPrometheusMetrics
-else:
-    MetricsClientCls = PrometheusMetrics
-
+from husky_musher.utils.shared_cache import SharedMemoryRedis
+from husky_musher.utils.startup import startup_timer
+from husky_musher.utils.static import StaticAssetMiddleware, StaticAssets
+from husky_musher.utils.sync import ParticipantSync, RecordRefreshQueue
 
 __HERE__ = os.path.dirname(os.path.abspath(__file__))
 
@@ -38,10 +43,16 @@ def configure_metrics(app_injector: FlaskInjector, settings: AppSettings):
     injector_ = app_injector.injector
     cls = PrometheusMetrics
     if os.environ.get("GUNICORN_LOG_LEVEL"):  # If gunicorn is configured and in use
+        # Only needed (and only importable without error) under gunicorn
+        from prometheus_flask_exporter.multiprocess import (
+            GunicornInternalPrometheusMetrics,
+        )
+
         cls = GunicornInternalPrometheusMetrics
     metrics = cls(
         app,
         defaults_prefix=f"{settings.app_name}_flask",
+        metrics_decorator=time_scrape(injector_.get(MetricsScrapeSecondsHistogram)),
     )
     app.metrics = metrics
     injector_.binder.bind(PrometheusMetrics, metrics, scope=singleton)
@@ -65,6 +76,59 @@ def configure_session_settings(app: Flask, settings: AppSettings):
     app.config["SESSION_KEY_PREFIX"] = f"{settings.app_name}:"
 
 
+def configure_static_assets(app: Flask, settings: AppSettings):
+    # Static files are served ahead of Flask (and so without the no-store
+    # header below) under fingerprinted names; see husky_musher/utils/static.py
+    assets = StaticAssets.load(app.static_folder, settings.static_build_dir)
+    app.wsgi_app = StaticAssetMiddleware(app.wsgi_app, assets, app.static_url_path)
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = assets.get_url_filename(values["filename"])
+
+
+def configure_probes(app: Flask, injector_: Injector):
+    # Kubernetes' probes are answered ahead of Flask, without loading
+    # sessions; see husky_musher/utils/probes.py
+    app.wsgi_app = ProbeMiddleware(app.wsgi_app, injector_.get(ReadinessChecks))
+
+
+def configure_background_jobs(app: Flask, injector_: Injector, settings: AppSettings):
+    # Jobs are started in each worker once it has forked; see gunicorn.conf.py
+    jobs = injector_.get(BackgroundJobs)
+    interval = settings.redcap_sync_interval_seconds
+    if interval and settings.redcap_api_url:
+        jobs.add(
+            PeriodicJob(
+                "participant_sync",
+                interval,
+                injector_.get(ParticipantSync).sync,
+                logger=app.logger,
+                lease=Lease(injector_.get(Cache), "participant_sync", interval * 2),
+            )
+        )
+    memory_interval = settings.worker_memory_check_interval_seconds
+    if memory_interval:
+        # Every worker checks its own memory, so there is no lease
+        memory_monitor = injector_.get(MemoryMonitor)
+        jobs.add(
+            PeriodicJob(
+                "memory_monitor",
+                memory_interval,
+                memory_monitor.check,
+                logger=app.logger,
+            )
+        )
+        app.extensions["memory_monitor"] = memory_monitor
+    app.extensions["background_jobs"] = jobs
+    # Cached records too old to upgrade are refreshed in the background,
+    # rather than while the participant waits
+    injector_.get(REDCapClient).refresh_record_later = injector_.get(
+        RecordRefreshQueue
+    ).enqueue
+
+
 def register_error_handlers(app: Flask):
     # Always include a Cache-Control: no-store header in the response so browsers
     # or intervening caches don't save pages across auth'd users.  Unlikely, but
@@ -114,9 +178,16 @@ class AppInjectorModule(Module):
                 # This helps ensure at boot that the client can connect
                 # to its redis instance, so that we don't run the risk of
                 # silently failing to set session information.
-                if not all(client.time() or not client.set("husky-musher:test", "ok")):
-                    raise ConnectionError
+                with startup_timer.phase("connect_redis"):
+                    if not all(
+                        client.time() or not client.set("husky-musher:test", "ok")
+                    ):
+                        raise ConnectionError
                 logger.info(f"Successfully connected to redis.")
+                # When the app is preloaded, this runs in the gunicorn arbiter;
+                # don't let forked workers inherit (and share) the probe's
+                # socket. Each process lazily opens its own connections.
+                client.connection_pool.disconnect()
                 return client
             except Exception as e:
                 logger.error(
@@ -126,6 +197,16 @@ class AppInjectorModule(Module):
                 )
                 raise e
 
+        if settings.shared_cache_path:
+            logger.info(f"Using the shared cache at {settings.shared_cache_path}")
+            return cast(
+                Redis,
+                SharedMemoryRedis(
+                    settings.shared_cache_path,
+                    slots=settings.shared_cache_slots,
+                    slot_bytes=settings.shared_cache_slot_bytes,
+                ),
+            )
         return cast(Redis, MockRedis())
 
     @provider
@@ -147,14 +228,69 @@ class AppInjectorModule(Module):
 
         The above example would yield something like:
         """
-        with open(os.path.join(__HERE__, "logging.yaml")) as f:
-            logger_settings = yaml.load(f.read(), SafeLoader)
-        dictConfig(logger_settings)
+        # Only needed once, at startup
+        from logging.config import dictConfig
+
+        import yaml
+
+        with startup_timer.phase("configure_logging"):
+            with open(os.path.join(__HERE__, "logging.yaml")) as f:
+                logger_settings = yaml.load(f.read(), yaml.SafeLoader)
+            dictConfig(logger_settings)
         app_logger = logging.getLogger("gunicorn.error").getChild("app")
         formatter = app_logger.handlers[0].formatter
         formatter.injector = injector
         return app_logger
 
+    @provider
+    @singleton
+    def provide_scrape_histogram(
+        self, registry: CollectorRegistry
+    ) -> MetricsScrapeSecondsHistogram:
+        return MetricsScrapeSecondsHistogram(
+            "metrics_scrape_seconds",
+            documentation="Time spent collecting metrics for a /metrics scrape",
+            registry=registry,
+        )
+
+    @provider
+    @singleton
+    def provide_worker_memory_gauge(
+        self, registry: CollectorRegistry
+    ) -> WorkerMemoryGauge:
+        return WorkerMemoryGauge(
+            "worker_memory_bytes",
+            documentation="Resident (rss) and private memory of each worker",
+            labelnames=["kind"],
+            # One series per live worker
+            multiprocess_mode="liveall",
+            registry=registry,
+        )
+
+    @provider
+    @singleton
+    def provide_worker_allocated_blocks_gauge(
+        self, registry: CollectorRegistry
+    ) -> WorkerAllocatedBlocksGauge:
+        return WorkerAllocatedBlocksGauge(
+            "worker_allocated_blocks",
+            documentation="Memory blocks allocated by the Python interpreter "
+            "of each worker",
+            multiprocess_mode="liveall",
+            registry=registry,
+        )
+
+    @provider
+    @singleton
+    def provide_worker_memory_recycle_counter(
+        self, registry: CollectorRegistry
+    ) -> WorkerMemoryRecycleCounter:
+        return WorkerMemoryRecycleCounter(
+            "worker_memory_recycles",
+            documentation="Workers replaced for going over their memory limit",
+            registry=registry,
+        )
+
     @provider
     @request
     def provide_session(self) -> LocalProxy:
@@ -167,6 +303,7 @@ class AppInjectorModule(Module):
         injector_: Injector,
         app_blueprint: AppBlueprint,
         saml_blueprint: SAMLBlueprint,
+        redcap_blueprint: REDCapBlueprint,
         logger: logging.Logger,
     ) -> Flask:
         app = Flask(__name__)
@@ -174,6 +311,7 @@ class AppInjectorModule(Module):
         app.logger = logger
         app.register_blueprint(app_blueprint)
         app.register_blueprint(saml_blueprint)
+        app.register_blueprint(redcap_blueprint)
         if settings.use_mock_idp:
             from uw_saml2 import mock, python3_saml
 
@@ -189,6 +327,10 @@ class AppInjectorModule(Module):
         configure_metrics(flask_injector, settings)
         configure_session_settings(app, settings)
         configure_session_cache(app, injector_.get(Cache), settings)
+        with startup_timer.phase("configure_static_assets"):
+            configure_static_assets(app, settings)
+        configure_background_jobs(app, injector_, settings)
+        configure_probes(app, injector_)
         register_error_handlers(app)
         return app
 
@@ -208,10 +350,19 @@ def create_app(injector_: Optional[Injector] = None):
     configuration or overrides already set up. This is helpful for
     testing.
     """
+    start_time = time.perf_counter()
     if not injector_:
         injector_ = create_app_injector()
-    return injector_.get(Flask)
+    app = injector_.get(Flask)
+    startup_timer.record("create_app", time.perf_counter() - start_time)
+    app.logger.info(
+        f"Created application in {startup_timer.phases['create_app']}s",
+        extra={"phases": startup_timer.phases, "extra_keys": {"phases"}},
+    )
+    return app
 
 
 if __name__ == "__main__":
-    create_app().run()
+    app = create_app()
+    app.extensions["background_jobs"].start()
+    app.run()
@@ -0,0 +1,269 @@
+"""
+An optional asyncio-native entry point, served by an ASGI server instead
+of gunicorn's gevent workers:
+
+    uvicorn --factory husky_musher.asgi:create_asgi_app --port 8000
+
+The participant redirect ("/"), which accounts for nearly all traffic,
+is served natively with non-blocking redis and REDCap clients. Every other
+route (sign in, admin, status, metrics) is delegated to the same Flask
+application that `create_app()` returns, so the two modes share their
+injector modules, settings, sessions and cache.
+
+Requires packages that the deployed image does not include (see
+`ASGI_REQUIREMENTS`); `create_asgi_app` fails with the list of those
+that are missing. Do not serve this with gunicorn.conf.py, which
+monkey-patches the standard library for gevent.
+"""
+import asyncio
+import importlib.util
+import json
+import logging
+import pickle
+import time
+from http.cookies import SimpleCookie
+from typing import Dict, Optional
+
+from flask import Flask, render_template
+from flask_session import RedisSessionInterface
+from injector import Injector, Module, inject, provider, singleton
+from redis import Redis
+
+from husky_musher.app import create_app, create_app_injector
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import AsyncCache, create_async_redis
+from husky_musher.utils.redcap import AsyncREDCapClient
+from husky_musher.utils.shibboleth import extract_user_info
+from husky_musher.utils.survey_links import (
+    ENROLLMENT_EVENT,
+    ENROLLMENT_INSTRUMENT,
+    PREFETCH_POLL_SECONDS,
+    SurveyLinks,
+    get_survey_link_key,
+)
+
+
+class AsyncInjectorModule(Module):
+    @provider
+    @singleton
+    def provide_async_cache(self, redis: Redis, settings: AppSettings) -> AsyncCache:
+        return AsyncCache(create_async_redis(redis, settings), settings)
+
+
+@singleton
+class AsyncSessionLoader:
+    """
+    Reads the Flask session of a request without going through Flask,
+    using the same session interface (and so the same storage) as the
+    Flask application.
+    """
+
+    @inject
+    def __init__(self, app: Flask, cache: AsyncCache, settings: AppSettings):
+        self.interface = app.session_interface
+        self.cache = cache
+        self.cookie_name = settings.session_cookie_name
+
+    def get_session_id(self, headers: Dict[bytes, bytes]) -> Optional[str]:
+        cookie = SimpleCookie(headers.get(b"cookie", b"").decode("latin-1"))
+        morsel = cookie.get(self.cookie_name)
+        return morsel.value if morsel else None
+
+    async def load(self, headers: Dict[bytes, bytes]) -> Dict:
+        session_id = self.get_session_id(headers)
+        if not session_id:
+            return {}
+        key = f"{self.interface.key_prefix}{session_id}"
+        if isinstance(self.interface, RedisSessionInterface):
+            value = await self.cache.redis.get(key)
+            # Flask-Session pickles the sessions it stores
+            return pickle.loads(value) if value else {}
+        # Sessions are stored on the local filesystem during development
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.interface.cache.get, key) or {}
+
+
+@singleton
+class ASGIApp:
+    @inject
+    def __init__(
+        self,
+        app: Flask,
+        client: AsyncREDCapClient,
+        sessions: AsyncSessionLoader,
+        links: SurveyLinks,
+        logger: logging.Logger,
+    ):
+        from asgiref.wsgi import WsgiToAsgi
+
+        self.app = app
+        self.wsgi_app = WsgiToAsgi(app)
+        self.client = client
+        self.sessions = sessions
+        self.links = links
+        self.logger = logger.getChild("asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.handle_lifespan(receive, send)
+        if scope["type"] == "http" and scope["path"] == "/":
+            if scope["method"] == "GET":
+                return await self.handle_redirect(scope, send)
+        return await self.wsgi_app(scope, receive, send)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.app.extensions["background_jobs"].start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.app.extensions["background_jobs"].stop()
+                await self.client.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def send_response(
+        send, status: int, body: bytes = b"", headers: Optional[Dict] = None
+    ):
+        # Always include a Cache-Control: no-store header in the response;
+        # see `register_error_handlers` in husky_musher/app.py
+        headers = {"cache-control": "no-store", **(headers or {})}
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def handle_redirect(self, scope, send):
+        try:
+            location = await self.render_redirect(dict(scope["headers"]))
+        except Exception as e:
+            self.logger.exception(f"Unexpected error occurred: {e}")
+            with self.app.test_request_context("/"):
+                body = render_template("something_went_wrong.html")
+            return await self.send_response(
+                send, 500, body.encode(), {"content-type": "text/html; charset=utf-8"}
+            )
+        await self.send_response(send, 302, headers={"location": location})
+
+    async def get_prefetched_link(self, netid: str) -> Optional[str]:
+        """
+        The asyncio counterpart of `SurveyLinks.get`, for the link that
+        signing in (which the Flask app serves) prefetched: returns it, and
+        deletes it, waiting for it while it is being prefetched; returns
+        None if there is none.
+        """
+        if not self.links.cache_seconds:
+            return None
+        cache = self.client.cache
+        key = get_survey_link_key(netid)
+        lease_key = self.links.get_prefetch_lease(netid).key
+        deadline = time.monotonic() + self.links.max_wait_seconds
+        link = await cache.get(key)
+        while (
+            not link
+            and time.monotonic() < deadline
+            and await cache.get(lease_key) is not None
+        ):
+            await asyncio.sleep(PREFETCH_POLL_SECONDS)
+            link = await cache.get(key)
+        if not link:
+            return None
+        await cache.delete(key)
+        return link.decode() if isinstance(link, bytes) else link
+
+    async def render_redirect(self, headers: Dict[bytes, bytes]) -> str:
+        """
+        The asyncio counterpart of `AppBlueprint.render_redirect`; returns
+        the URL to redirect the participant to.
+        """
+        session = await self.sessions.load(headers)
+        # All users of this application must be signed in
+        netid = session.get("netid")
+        if not netid:
+            return "/saml/login"
+
+        link = await self.get_prefetched_link(netid)
+        if link:
+            return link
+
+        user_info = extract_user_info(json.loads(session["attributes"]))
+        # Both lookups are independent, so look them up concurrently
+        redcap_record, registration_complete = await asyncio.gather(
+            self.client.fetch_participant(user_info),
+            self.client.cache.get(f"{netid}.registrationComplete", load_json=True),
+        )
+
+        if not redcap_record:
+            # If not in REDCap project, create new record
+            new_record_id = await self.client.register_participant(user_info)
+            redcap_record = {"record_id": new_record_id}
+
+        record_id = redcap_record.get("record_id")
+
+        if registration_complete or await self.client.redcap_registration_complete(
+            redcap_record, netid=netid
+        ):
+            return await self.client.generate_surveyqueue_link(record_id)
+        return await self.client.generate_enrollment_survey_link(
+            record_id, ENROLLMENT_EVENT, ENROLLMENT_INSTRUMENT
+        )
+
+
+# The packages the ASGI entry point needs, by the modules that provide them
+ASGI_REQUIREMENTS = {
+    "asgiref": "asgiref",
+    "httpx": "httpx",
+}
+# With REDIS_HOST set; either provides an asyncio client
+ASGI_REDIS_REQUIREMENTS = {
+    "redis.asyncio": "redis>=4.2",
+    "aioredis": "aioredis",
+}
+
+
+def is_installed(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ImportError:
+        # The parent package is missing
+        return False
+
+
+def check_asgi_requirements(settings: AppSettings):
+    """
+    Raises RuntimeError, naming the packages to install, if any that the
+    ASGI entry point needs are missing.
+    """
+    missing = [
+        package
+        for module, package in ASGI_REQUIREMENTS.items()
+        if not is_installed(module)
+    ]
+    if settings.redis_host and not any(
+        is_installed(module) for module in ASGI_REDIS_REQUIREMENTS
+    ):
+        missing.append(" or ".join(ASGI_REDIS_REQUIREMENTS.values()))
+    if missing:
+        raise RuntimeError(
+            "The ASGI entry point needs packages that are not installed: "
+            f"{', '.join(missing)}. See docs/operations.md"
+        )
+
+
+def create_asgi_app(injector_: Optional[Injector] = None) -> ASGIApp:
+    """
+    Creates a new instance of the ASGI application. Like `create_app`,
+    callers may pass an Injector with overrides already set up.
+    """
+    if not injector_:
+        injector_ = create_app_injector()
+    check_asgi_requirements(injector_.get(AppSettings))
+    injector_.binder.install(AsyncInjectorModule)
+    create_app(injector_)
+    return injector_.get(ASGIApp)
@@ -1,36 +1,69 @@
 import json
+import os
 from logging import Logger
 
-from flask import Blueprint, Request, jsonify, redirect, render_template
+from flask import Blueprint, Request, Response, jsonify, redirect, render_template
 from injector import inject
-from werkzeug.exceptions import BadRequest, MethodNotAllowed, Unauthorized
+from werkzeug.exceptions import BadRequest, Conflict, MethodNotAllowed, Unauthorized
 from werkzeug.local import LocalProxy
 
 from husky_musher.settings import AppSettings
 from husky_musher.utils.cache import Cache
-from husky_musher.utils.redcap import REDCapClient
-from husky_musher.utils.shibboleth import (
-    extract_user_info,
-    get_saml_attributes_from_env,
+from husky_musher.utils.cache_export import ParticipantExport
+from husky_musher.utils.cache_stats import CacheAnalyzer
+from husky_musher.utils.injection import request_scoped
+from husky_musher.utils.memory import (
+    DEFAULT_DIFF_LIMIT,
+    AllocationDiffBusy,
+    diff_allocations,
 )
+from husky_musher.utils.profiler import ProfilerBusy, SamplingProfiler
+from husky_musher.utils.shibboleth import extract_user_info
+from husky_musher.utils.survey_links import SurveyLinks, get_survey_link_key
 
 
 class AppBlueprint(Blueprint):
     """
     The main external interface to the app; serves the API.
+
+    Singletons are injected here, once; views only take the request and the
+    session (see husky_musher/utils/injection.py).
     """
 
     @inject
-    def __init__(self, settings: AppSettings, logger: Logger, cache: Cache):
+    def __init__(
+        self,
+        settings: AppSettings,
+        logger: Logger,
+        cache: Cache,
+        links: SurveyLinks,
+        analyzer: CacheAnalyzer,
+        export: ParticipantExport,
+    ):
         super().__init__("app", __name__)
         self.logger = logger
         self.cache = cache
         self.settings = settings
+        self.links = links
+        self.analyzer = analyzer
+        self.export = export
         self.add_url_rule("/", view_func=self.render_redirect, methods=("GET",))
         self.add_url_rule("/status", view_func=self.render_status, methods=("GET",))
         self.add_url_rule(
             "/admin", view_func=self.render_admin, methods=("GET", "POST")
         )
+        self.add_url_rule(
+            "/admin/profile", view_func=self.render_profile, methods=("GET",)
+        )
+        self.add_url_rule(
+            "/admin/memory", view_func=self.render_memory_diff, methods=("GET",)
+        )
+        self.add_url_rule(
+            "/admin/cache", view_func=self.render_cache_stats, methods=("GET",)
+        )
+        self.add_url_rule(
+            "/admin/export", view_func=self.render_export, methods=("GET",)
+        )
 
     def render_status(self):
         return (
@@ -43,46 +76,17 @@ class AppBlueprint(Blueprint):
             200,
         )
 
-    def render_redirect(
-        self,
-        client: REDCapClient,
-        session: LocalProxy,
-    ):
+    @request_scoped
+    def render_redirect(self, session: LocalProxy):
         # All users of this application must be signed in
         netid = session.get('netid')
 
         if not netid:
             return redirect("/saml/login")
 
-        attributes = json.loads(session["attributes"])
-        user_info = extract_user_info(attributes)
-        redcap_record = client.fetch_participant(user_info)
-
-        if not redcap_record:
-            # If not in REDCap project, create new record
-            new_record_id = client.register_participant(user_info)
-            redcap_record = {"record_id": new_record_id}
-
-        record_id = redcap_record.get('record_id')
-
-        # Because of REDCap's survey queue logic, we can point a participant to an
-        # upstream survey. If they've completed it, REDCap will automatically direct
-        # them to the next, uncompleted survey in the queue.
-        event = "enrollment_arm_1"
-        instrument = "enrollment_questions"
-        # If all enrollment event instruments are complete, point participants
-        # to today's daily attestation instrument.
-        # If the participant has already completed the daily attestation,
-        # REDCap will prevent the participant from filling out the survey again.
-        if client.redcap_registration_complete(redcap_record, netid=netid):
-            return redirect(client.generate_surveyqueue_link(
-                record_id,
-            ))
-        return redirect(
-            client.generate_enrollment_survey_link(
-                record_id, event, instrument
-            )
-        )
+        # Usually prefetched at sign-in; see husky_musher/utils/survey_links.py
+        user_info = extract_user_info(json.loads(session["attributes"]))
+        return redirect(self.links.get(user_info))
 
     def _user_is_admin(self, session: LocalProxy) -> bool:
         """
@@ -97,6 +101,19 @@ class AppBlueprint(Blueprint):
 
         return False
 
+    def _admin_sign_in_redirect(self, session: LocalProxy, return_to: str):
+        """
+        Returns a redirect to sign in if the user has not yet done so, and
+        raises Unauthorized if the signed in user is not an admin.
+        """
+        # The presence of a netid entry indicates the user has signed in.
+        if not session.get("netid"):
+            # If they haven't, we redirect them to do so.
+            return redirect(f"/saml/login?return_to={return_to}")
+
+        if not self._user_is_admin(session):
+            raise Unauthorized
+
     def _op_cache_delete(self, request: Request):
         if request.method.upper() != "POST":
             raise MethodNotAllowed
@@ -105,19 +122,18 @@ class AppBlueprint(Blueprint):
         if netid:
             self.cache.delete(netid)
             self.cache.delete(f'{netid}.registrationComplete')
+            self.cache.delete(f'{netid}.recordId')
+            self.cache.delete(get_survey_link_key(netid))
             payload["message"] = f"Deleted netid {netid} from the cache"
         else:
             payload["message"] = "Error: No UW NetID supplied"
         return payload
 
+    @request_scoped
     def render_admin(self, request: Request, session: LocalProxy):
-        # The presence of a netid entry indicates the user has signed in.
-        if not session.get("netid"):
-            # If they haven't, we redirect them to do so.
-            return redirect("/saml/login?return_to=/admin")
-
-        if not self._user_is_admin(session):
-            raise Unauthorized
+        sign_in = self._admin_sign_in_redirect(session, "/admin")
+        if sign_in:
+            return sign_in
 
         context = {}
         op = request.form.get("operation")
@@ -126,3 +142,115 @@ class AppBlueprint(Blueprint):
             context[op] = getattr(self, op_method)(request)
 
         return render_template("admin.html", **context)
+
+    @request_scoped
+    def render_profile(self, request: Request, session: LocalProxy):
+        """
+        Profiles the worker that serves this request for `seconds`, and
+        returns the samples as collapsed stacks, ready to be rendered
+        as a flame graph. See husky_musher/utils/profiler.py for overhead.
+        """
+        sign_in = self._admin_sign_in_redirect(session, "/admin/profile")
+        if sign_in:
+            return sign_in
+
+        seconds = request.args.get("seconds", default=10, type=float)
+        if not 0 < seconds <= self.settings.profiler_max_seconds:
+            raise BadRequest(
+                f"seconds must be between 0 and {self.settings.profiler_max_seconds}"
+            )
+        interval_ms = request.args.get("interval_ms", default=10, type=float)
+
+        self.logger.info(f"Profiling worker {os.getpid()} for {seconds}s")
+        try:
+            result = SamplingProfiler(interval_seconds=interval_ms / 1000).run(seconds)
+        except ProfilerBusy as e:
+            raise Conflict(str(e))
+
+        headers = {
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Disposition": f'attachment; filename="profile-{os.getpid()}.txt"',
+            "X-Profile-Samples": str(result.num_samples),
+            "X-Profile-Duration-Seconds": str(result.duration_seconds),
+            "X-Profile-Interval-Seconds": str(result.interval_seconds),
+        }
+        return result.to_collapsed(), 200, headers
+
+    @request_scoped
+    def render_memory_diff(self, request: Request, session: LocalProxy):
+        """
+        Traces the allocations of the worker that serves this request for
+        `seconds`, and returns the lines of code that allocated the memory
+        it still holds at the end, most first. See
+        husky_musher/utils/memory.py.
+        """
+        sign_in = self._admin_sign_in_redirect(session, "/admin/memory")
+        if sign_in:
+            return sign_in
+
+        seconds = request.args.get("seconds", default=30, type=float)
+        if not 0 < seconds <= self.settings.memory_diff_max_seconds:
+            raise BadRequest(
+                f"seconds must be between 0 and {self.settings.memory_diff_max_seconds}"
+            )
+        limit = request.args.get("limit", default=DEFAULT_DIFF_LIMIT, type=int)
+        frames = min(max(request.args.get("frames", default=1, type=int), 1), 16)
+
+        self.logger.info(f"Tracing allocations of worker {os.getpid()} for {seconds}s")
+        try:
+            diff = diff_allocations(seconds, frames=frames)
+        except AllocationDiffBusy as e:
+            raise Conflict(str(e))
+
+        headers = {
+            "Content-Type": "text/plain; charset=utf-8",
+            "X-Memory-Growth-Bytes": str(diff.growth_bytes),
+            "X-Memory-Diff-Duration-Seconds": str(round(diff.duration_seconds, 3)),
+        }
+        return diff.to_text(limit), 200, headers
+
+    @request_scoped
+    def render_cache_stats(self, request: Request, session: LocalProxy):
+        """
+        Shows what the cache holds, by key family. Add `?refresh=1` to scan
+        again rather than show the last report; add `?format=json` for the
+        report itself.
+        """
+        sign_in = self._admin_sign_in_redirect(session, "/admin/cache")
+        if sign_in:
+            return sign_in
+
+        report = self.analyzer.get_report(refresh=bool(request.args.get("refresh")))
+        if request.args.get("format") == "json":
+            return jsonify(report)
+        return render_template(
+            "cache_stats.html",
+            report=report,
+            max_age_seconds=self.analyzer.max_age_seconds,
+        )
+
+    @request_scoped
+    def render_export(self, request: Request, session: LocalProxy):
+        """
+        Streams the participants in the cache as CSV (the default) or, with
+        `?format=ndjson`, as one JSON object per line.
+        """
+        sign_in = self._admin_sign_in_redirect(session, "/admin/export")
+        if sign_in:
+            return sign_in
+
+        export_format = request.args.get("format", "csv")
+        if export_format == "csv":
+            chunks, mimetype = self.export.iter_csv(), "text/csv"
+        elif export_format == "ndjson":
+            chunks, mimetype = self.export.iter_ndjson(), "application/x-ndjson"
+        else:
+            raise BadRequest("format must be csv or ndjson")
+
+        self.logger.info(f"Exporting cached participants as {export_format}")
+        filename = f"participants.{export_format}"
+        return Response(
+            chunks,
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
@@ -0,0 +1,52 @@
+from logging import Logger
+
+from flask import Blueprint, Request, jsonify
+from injector import inject
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.injection import request_scoped
+from husky_musher.utils.sync import RecordRefreshQueue
+
+
+class REDCapBlueprint(Blueprint):
+    """
+    Receives notifications from REDCap. Configure the project's Data Entry
+    Trigger (under Project Setup > Additional customizations) to
+    https://<musher host>/redcap/data-entry-trigger.
+    """
+
+    @inject
+    def __init__(
+        self, settings: AppSettings, logger: Logger, queue: RecordRefreshQueue
+    ):
+        super().__init__("redcap", __name__, url_prefix="/redcap")
+        self.settings = settings
+        self.logger = logger.getChild("redcap")
+        self.queue = queue
+        self.add_url_rule(
+            "/data-entry-trigger",
+            view_func=self.receive_data_entry_trigger,
+            methods=("POST",),
+        )
+
+    @request_scoped
+    def receive_data_entry_trigger(self, request: Request):
+        """
+        REDCap posts the project ID and the record ID (among others) whenever
+        a record is saved. The notification is not authenticated, so it is
+        only used as a hint to re-export the record from REDCap; it never
+        changes the cache directly.
+        """
+        project_id = request.form.get("project_id")
+        record_id = request.form.get("record")
+        if not self.settings.redcap_project_id or (
+            project_id != str(self.settings.redcap_project_id)
+        ):
+            self.logger.warning(
+                f"Ignoring a data entry trigger for project {project_id}"
+            )
+            return jsonify({"error": "Unknown project"}), 403
+        if not record_id:
+            return jsonify({"error": "No record"}), 400
+        self.queue.enqueue(record_id)
+        return "", 204
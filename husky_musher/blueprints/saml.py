@@ -4,26 +4,29 @@ import urllib.parse
 from logging import Logger
 from typing import Dict
 
-import uw_saml2
 from flask import Blueprint, Request, redirect
 from injector import inject
-from uw_saml2.idp.uw import UwIdp
 from werkzeug.local import LocalProxy
 
 from husky_musher.settings import AppSettings
-from husky_musher.utils.shibboleth import get_saml_attributes_from_env
+from husky_musher.utils.injection import request_scoped
+from husky_musher.utils.shibboleth import (
+    extract_user_info,
+    get_saml_attributes_from_env,
+)
+from husky_musher.utils.survey_links import SurveyLinks
 
 
 class SAMLBlueprint(Blueprint):
     @inject
     def __init__(
         self,
-        idp_config: UwIdp,
         settings: AppSettings,
         logger: Logger,
+        links: SurveyLinks,
     ):
         super().__init__("saml", __name__, url_prefix="/saml")
-        self.idp_config = idp_config
+        self.links = links
         self.add_url_rule("/login", view_func=self.login, methods=["GET", "POST"])
         self.add_url_rule("/logout", view_func=self.log_out)
         self.settings = settings
@@ -37,12 +40,21 @@ class SAMLBlueprint(Blueprint):
         self.logger.info(
             f"Processing SAML POST request from {remote_ip} to access {dest_url} with POST: {post_args}"
         )
+        # Imported on first use, rather than while the app starts: only
+        # signing in needs it, and it takes tens of milliseconds to import
+        import uw_saml2
+
         attributes = uw_saml2.process_response(post_args, **kwargs)
         session["attributes"] = json.dumps(attributes)
         session["netid"] = attributes["uwnetid"]
         self.logger.info(f"Signed in user {session['netid']}")
+        # Participants are sent on to `/`, which redirects them to their
+        # survey; start looking it up while their browser follows
+        if urllib.parse.urlparse(dest_url).path in ("", "/"):
+            self.links.prefetch(extract_user_info(attributes))
         return redirect(dest_url)
 
+    @request_scoped
     def login(self, request: Request, session: LocalProxy):
         session.clear()
         acs_hostname = urllib.parse.urlparse(request.host_url).hostname
@@ -68,12 +80,15 @@ class SAMLBlueprint(Blueprint):
             self.logger.info(
                 f"Getting SAML redirect URL for {remote_ip} to SAML sign in with args {args}"
             )
+            import uw_saml2
+
             url = uw_saml2.login_redirect(**args, force_authn=True)
             return redirect(url)
 
         return self.process_saml_request(request, session, **args)
 
     @staticmethod
+    @request_scoped
     def log_out(session: LocalProxy):
         session.clear()
         return redirect("/")
@@ -81,16 +96,22 @@ class SAMLBlueprint(Blueprint):
 
 class MockSAMLBlueprint(Blueprint):
     @inject
-    def __init__(self):
+    def __init__(self, links: SurveyLinks):
         super().__init__("mock-saml", __name__, url_prefix="/mock-saml")
+        self.links = links
         self.add_url_rule(
             "/login", view_func=self.process_saml_request, methods=["GET"]
         )
 
-    @staticmethod
-    def process_saml_request(request: Request, session: LocalProxy, **kwargs):
+    @request_scoped
+    def process_saml_request(self, request: Request, session: LocalProxy, **kwargs):
         attrs = get_saml_attributes_from_env()
+        # Lets local load tests sign in as many different users
+        if request.args.get("uwnetid"):
+            attrs["uwnetid"] = request.args["uwnetid"]
         return_to = request.args.get("return_to", "/")
         session["netid"] = attrs["uwnetid"] or getpass.getuser()
         session["attributes"] = json.dumps(attrs)
+        if return_to == "/":
+            self.links.prefetch(extract_user_info(attrs))
         return redirect(return_to)
@@ -19,6 +19,52 @@ class AppSettings:
         os.environ.get("REDCAP_STUDY_START_DATE", "1970-01-01"), "%Y-%m-%d"
     )
     redcap_instrument = os.environ.get("REDCAP_INSTRUMENT")
+    # How often to copy changes made in REDCap into the cache; 0 (the
+    # default) disables the sync. See husky_musher/utils/sync.py
+    redcap_sync_interval_seconds = int(
+        os.environ.get("REDCAP_SYNC_INTERVAL_SECONDS") or 0
+    )
+    redcap_sync_overlap_seconds = int(
+        os.environ.get("REDCAP_SYNC_OVERLAP_SECONDS") or 60
+    )
+    # How long to collect Data Entry Trigger notifications before refreshing
+    # the records they name, in a single call
+    redcap_trigger_debounce_seconds = float(
+        os.environ.get("REDCAP_TRIGGER_DEBOUNCE_SECONDS") or 2
+    )
+    # The time zone of the REDCap server's clock
+    redcap_timezone = os.environ.get("REDCAP_TIMEZONE", "America/Los_Angeles")
+    # Records (sanitized) REDCap calls to this file; see docs/operations.md
+    redcap_capture_path = os.environ.get("REDCAP_CAPTURE_PATH")
+    # Answers REDCap calls from a capture file, instead of calling REDCap
+    redcap_replay_path = os.environ.get("REDCAP_REPLAY_PATH")
+    redcap_replay_speed = float(os.environ.get("REDCAP_REPLAY_SPEED") or 1)
+    # The most REDCap calls per minute, across every worker of every pod;
+    # 0 for no limit. Bursts of up to REDCAP_RATE_LIMIT_BURST calls
+    # (default: 10 seconds' worth) are allowed. Calls wait for at most
+    # the max wait seconds, then fail. See husky_musher/utils/rate_limit.py
+    redcap_rate_limit_per_minute = float(
+        os.environ.get("REDCAP_RATE_LIMIT_PER_MINUTE") or 0
+    )
+    redcap_rate_limit_burst = float(os.environ.get("REDCAP_RATE_LIMIT_BURST") or 0)
+    redcap_rate_limit_max_wait_seconds = float(
+        os.environ.get("REDCAP_RATE_LIMIT_MAX_WAIT_SECONDS") or 5
+    )
+    redcap_rate_limit_background_max_wait_seconds = float(
+        os.environ.get("REDCAP_RATE_LIMIT_BACKGROUND_MAX_WAIT_SECONDS") or 30
+    )
+    # How long the survey link prefetched when a participant signs in waits
+    # for their redirect to `/`, which uses it once; 0 disables the
+    # prefetch. See husky_musher/utils/survey_links.py
+    survey_link_cache_seconds = int(
+        os.environ.get("SURVEY_LINK_CACHE_SECONDS") or 30
+    )
+    # How long each worker reuses the addresses it resolved for REDCap's
+    # host; 0 to resolve them for every new connection. See
+    # husky_musher/utils/network.py
+    redcap_dns_cache_seconds = float(
+        os.environ.get("REDCAP_DNS_CACHE_SECONDS") or 0
+    )
     saml_acs_path = os.environ.get("SAML_ACS_PATH")
     saml_entity_id = os.environ.get("SAML_ENTITY_ID")
     saml_redirect_port = os.environ.get("SAML_REDIRECT_PORT")
@@ -27,6 +73,46 @@ class AppSettings:
         os.environ.get("APP_ADMIN_GROUPS", '["uw_iam_musher-admins"]')
     )
 
+    # How often /readyz checks that redis and REDCap can be reached (at
+    # most), and how long it waits for each
+    readiness_check_interval_seconds = float(
+        os.environ.get("READINESS_CHECK_INTERVAL_SECONDS") or 10
+    )
+    readiness_timeout_seconds = float(
+        os.environ.get("READINESS_TIMEOUT_SECONDS") or 2
+    )
+
+    # The longest an admin may run the sampling profiler at /admin/profile
+    profiler_max_seconds = int(os.environ.get("PROFILER_MAX_SECONDS") or 30)
+    # The longest an admin may trace allocations for at /admin/memory
+    memory_diff_max_seconds = int(os.environ.get("MEMORY_DIFF_MAX_SECONDS") or 60)
+
+    # Workers are replaced once their private memory passes the limit
+    # (lowered by up to the jitter, as a fraction, for each worker), as
+    # checked every interval; see husky_musher/utils/memory.py. A limit of
+    # 0 only reports the workers' memory.
+    worker_memory_limit_mb = int(os.environ.get("WORKER_MEMORY_LIMIT_MB") or 256)
+    worker_memory_limit_jitter = float(
+        os.environ.get("WORKER_MEMORY_LIMIT_JITTER") or 0.1
+    )
+    worker_memory_check_interval_seconds = float(
+        os.environ.get("WORKER_MEMORY_CHECK_INTERVAL_SECONDS") or 30
+    )
+
+    # How long /admin/cache may scan the cache for, and how long its
+    # report is reused; see husky_musher/utils/cache_stats.py
+    cache_stats_budget_seconds = float(
+        os.environ.get("CACHE_STATS_BUDGET_SECONDS") or 0.5
+    )
+    cache_stats_max_age_seconds = int(
+        os.environ.get("CACHE_STATS_MAX_AGE_SECONDS") or 60
+    )
+
+    # Where `python -m husky_musher.utils.static` built the static files
+    # (default: husky_musher/static_build); without a build, they are
+    # fingerprinted and compressed at startup
+    static_build_dir = os.environ.get("STATIC_BUILD_DIR")
+
     session_cookie_name = os.environ.get("SESSION_COOKIE_NAME", "edu.uw.musher.session")
     session_lifetime = int(os.environ.get("SESSION_LIFETIME_SECONDS") or 60)
     secret_key = os.environ.get("SECRET_KEY", "NotSecured")
@@ -36,6 +122,13 @@ class AppSettings:
     redis_host = os.environ.get("REDIS_HOST")
     redis_port = os.environ.get("REDIS_PORT", 6379)
     redis_password = os.environ.get("REDIS_PASSWORD")
+    # Without redis, workers share a cache in this file (e.g., under /dev/shm)
+    # if it is set, rather than each keeping its own in memory. The file holds
+    # a fixed number of entries of a fixed size; see
+    # husky_musher/utils/shared_cache.py
+    shared_cache_path = os.environ.get("SHARED_CACHE_PATH")
+    shared_cache_slots = int(os.environ.get("SHARED_CACHE_SLOTS") or 65536)
+    shared_cache_slot_bytes = int(os.environ.get("SHARED_CACHE_SLOT_BYTES") or 1024)
 
     @property
     def in_development(self):
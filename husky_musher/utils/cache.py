@@ -1,5 +1,7 @@
 import json
-from typing import Any, Optional, Type
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type
 
 from injector import inject, singleton
 from redis import Redis
@@ -96,9 +98,119 @@ class Cache:
         value = self._sanitize_value(value, force_json=save_json)
         self.redis.set(key, value, ex=expire_seconds)
 
-    def delete(self, key: str):
-        """Deletes an entry, if it exists. Nothing happens if not."""
-        self.redis.delete(self.sanitize_key(key))
+    def set_many(
+        self,
+        values: Dict[str, Any],
+        expire_seconds: Optional[int] = None,
+        save_json: bool = False,
+    ):
+        """Adds several entries (as `set` would) in a single round trip."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, value in values.items():
+            value = self._sanitize_value(value, force_json=save_json)
+            pipeline.set(self.sanitize_key(key), value, ex=expire_seconds)
+        pipeline.execute()
+
+    def get_many(self, keys: List[str], load_json: bool = False) -> List[Any]:
+        """Retrieves several entries (as `get` would) in a single round trip."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.get(self.sanitize_key(key))
+        values = pipeline.execute()
+        if load_json:
+            return [json.loads(value) if value else value for value in values]
+        return values
+
+    def scan_keys(self, batch_size: int = 500) -> Iterator[List[str]]:
+        """
+        Yields the keys of this cache's entries (without the prefix), a batch
+        at a time. Unlike KEYS, SCAN does not block redis while it runs, but
+        entries added or deleted during the scan may or may not be included.
+        """
+        cursor = 0
+        while True:
+            cursor, keys = self.redis.scan(
+                cursor, match=f"{self.prefix}*", count=batch_size
+            )
+            keys = [k.decode() if isinstance(k, bytes) else k for k in keys]
+            keys = [k[len(self.prefix) :] for k in keys if k.startswith(self.prefix)]
+            if keys:
+                yield keys
+            if not cursor:
+                return
+
+    def delete(self, *keys: str):
+        """Deletes entries, if they exist. Nothing happens if not."""
+        if keys:
+            self.redis.delete(*(self.sanitize_key(key) for key in keys))
+
+    def update_if_equal(
+        self, key: str, expected: str, update: Callable[[Any, str], None]
+    ) -> bool:
+        """
+        Calls `update(pipeline, key)` to queue commands that are then
+        executed atomically, only if the entry is still *expected*.
+        Returns whether they were executed.
+        """
+        from redis import WatchError
+
+        key = self.sanitize_key(key)
+        with self.redis.pipeline() as pipeline:
+            try:
+                pipeline.watch(key)
+                value = pipeline.get(key)
+                if isinstance(value, bytes):
+                    value = value.decode()
+                if value != expected:
+                    return False
+                pipeline.multi()
+                update(pipeline, key)
+                pipeline.execute()
+                return True
+            except WatchError:
+                # The entry changed after it was read
+                return False
+
+
+class Lease:
+    """
+    A lock on *name* shared by every process using the cache, which
+    expires after *ttl_seconds* unless it is renewed, so that a process that
+    dies while holding it cannot hold it forever.
+
+        lease = Lease(cache, "sync", ttl_seconds=60)
+        if lease.acquire():
+            ...
+            lease.release()
+    """
+
+    def __init__(self, cache: Cache, name: str, ttl_seconds: float):
+        self.cache = cache
+        self.key = f"leases.{name}"
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.token = uuid.uuid4().hex
+
+    def acquire(self) -> bool:
+        """Returns whether the lease was free, and is now held by this instance."""
+        key = self.cache.sanitize_key(self.key)
+        return bool(self.cache.redis.set(key, self.token, nx=True, px=self.ttl_ms))
+
+    def renew(self) -> bool:
+        """Extends the lease, if (and only if) this instance still holds it."""
+        return self.cache.update_if_equal(
+            self.key,
+            self.token,
+            lambda pipeline, key: pipeline.pexpire(key, self.ttl_ms),
+        )
+
+    def release(self) -> bool:
+        return self.cache.update_if_equal(
+            self.key, self.token, lambda pipeline, key: pipeline.delete(key)
+        )
+
+    def is_held(self) -> bool:
+        """Returns whether any process (this instance or another) holds the lease."""
+        return self.cache.get(self.key) is not None
 
 
 class MockRedis:
@@ -109,9 +221,188 @@ class MockRedis:
 
     def __init__(self):
         self._values = {}
+        self._expires_at = {}
+
+    def _expire(self, key):
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires_at.pop(key, None)
 
     def get(self, key):
+        self._expire(key)
         return self._values.get(key)
 
-    def set(self, key, value, *args, **kwargs):
+    def set(self, key, value, ex=None, px=None, nx=False, *args, **kwargs):
+        if nx and self.get(key) is not None:
+            return None
         self._values[key] = value
+        self._expires_at.pop(key, None)
+        if ex or px:
+            self.pexpire(key, px or ex * 1000)
+        return True
+
+    def pexpire(self, key, milliseconds):
+        if self.get(key) is None:
+            return False
+        self._expires_at[key] = time.monotonic() + milliseconds / 1000
+        return True
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            self._expires_at.pop(key, None)
+            if self._values.pop(key, None) is not None:
+                deleted += 1
+        return deleted
+
+    def ping(self):
+        return True
+
+    def pttl(self, key):
+        if self.get(key) is None:
+            return -2
+        if key not in self._expires_at:
+            return -1
+        return int((self._expires_at[key] - time.monotonic()) * 1000)
+
+    def scan(self, cursor=0, match=None, count=None):
+        # Returns every key at once; *match* is not supported
+        for key in list(self._values):
+            self._expire(key)
+        return 0, list(self._values)
+
+    def dbsize(self):
+        return len(self._values)
+
+    def memory_usage(self, key, samples=None):
+        value = self.get(key)
+        if value is None:
+            return None
+        return len(key) + len(value if isinstance(value, (bytes, str)) else str(value))
+
+    def object(self, infotype, key):
+        # Access times are not tracked
+        return None
+
+    def pipeline(self, transaction=True):
+        return MockPipeline(self)
+
+
+class MockPipeline:
+    """
+    Queues commands for a `MockRedis`, like redis-py's pipelines do.
+    Commands issued after `watch()` (and before `multi()`) run immediately.
+    There are no other clients, so watched keys never change.
+    """
+
+    def __init__(self, redis: MockRedis):
+        self._redis = redis
+        self._commands: List = []
+        self._immediate = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.reset()
+
+    def watch(self, *keys):
+        self._immediate = True
+
+    def multi(self):
+        self._immediate = False
+
+    def execute(self, raise_on_error=True):
+        results = [command() for command in self._commands]
+        self.reset()
+        return results
+
+    def reset(self):
+        self._commands = []
+        self._immediate = False
+
+    def __getattr__(self, name):
+        method = getattr(self._redis, name)
+        if self._immediate:
+            return method
+
+        def queue(*args, **kwargs):
+            self._commands.append(lambda: method(*args, **kwargs))
+            return self
+
+        return queue
+
+
+class AsyncCache:
+    """
+    The asyncio counterpart of `Cache`, used by the ASGI entry point
+    (see husky_musher/asgi.py). Keys and values are stored exactly as
+    `Cache` stores them, so both can be used against the same data.
+    """
+
+    def __init__(self, redis, settings: AppSettings):
+        self.redis = redis
+        self.prefix = f"{settings.app_name}:"
+
+    sanitize_key = Cache.sanitize_key
+
+    async def get(self, key, load_json: bool = False, cast_as: Type[Any] = None) -> Any:
+        value = await self.redis.get(self.sanitize_key(key))
+        if value and load_json:
+            return json.loads(value)
+        if cast_as:
+            return cast_as(value)
+        return value
+
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        expire_seconds: Optional[int] = None,
+        save_json: bool = False,
+    ):
+        key = self.sanitize_key(key)
+        value = Cache._sanitize_value(value, force_json=save_json)
+        await self.redis.set(key, value, ex=expire_seconds)
+
+    async def delete(self, key: str):
+        await self.redis.delete(self.sanitize_key(key))
+
+
+class AsyncMockRedis:
+    """
+    Wraps a `MockRedis` so that it can be awaited; wrapping the same
+    instance used by the WSGI app means both share the same data.
+    """
+
+    def __init__(self, redis: MockRedis):
+        self._redis = redis
+
+    def __getattr__(self, name):
+        method = getattr(self._redis, name)
+
+        async def inner(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return inner
+
+
+def create_async_redis(redis: Redis, settings: AppSettings):
+    """
+    Returns an asyncio redis client connected to the same instance as *redis*.
+    Requires redis>=4.2 (or the aioredis package) when REDIS_HOST is set.
+    """
+    if isinstance(redis, MockRedis):
+        return AsyncMockRedis(redis)
+    try:
+        from redis import asyncio as aioredis
+    except ImportError:
+        import aioredis
+
+    return aioredis.Redis(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        username=settings.app_name,
+        password=settings.redis_password,
+    )
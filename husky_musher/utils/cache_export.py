@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List
+
+from injector import inject, singleton
+
+from husky_musher.utils.cache import Cache
+from husky_musher.utils.cache_stats import get_key_family
+
+EXPORT_FIELDS = ["uw_netid", "record_id", "registration_complete"]
+
+
+@singleton
+class ParticipantExport:
+    """
+    Lists the participants in the cache, with their record IDs and whether
+    they have completed registration. The cache is read a batch of keys at
+    a time, and each batch is written out before the next is read, so that
+    memory use does not grow with the number of participants, and a
+    response can start streaming right away.
+    """
+
+    batch_size = 500
+
+    @inject
+    def __init__(self, cache: Cache):
+        self.cache = cache
+
+    def iter_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """Yields the participants found in each batch of keys scanned."""
+        for keys in self.cache.scan_keys(self.batch_size):
+            netids = [k for k in keys if get_key_family(k) == "records"]
+            if not netids:
+                continue
+            values = [
+                self._load(value)
+                for value in self.cache.get_many(
+                    netids + [f"{netid}.registrationComplete" for netid in netids]
+                )
+            ]
+            records, completions = values[: len(netids)], values[len(netids) :]
+            yield [
+                {
+                    "uw_netid": netid,
+                    "record_id": record.get("record_id"),
+                    "registration_complete": bool(complete),
+                }
+                for netid, record, complete in zip(netids, records, completions)
+                # Otherwise, it expired since it was scanned, or it isn't a
+                # participant's record
+                if isinstance(record, dict)
+            ]
+
+    @staticmethod
+    def _load(value: Any) -> Any:
+        """Decodes a cached JSON value; None if it is missing or not JSON."""
+        try:
+            return json.loads(value) if value else None
+        except ValueError:
+            return None
+
+    def iter_ndjson(self) -> Iterator[str]:
+        for participants in self.iter_batches():
+            yield "".join(json.dumps(p) + "\n" for p in participants)
+
+    def iter_csv(self) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield self._drain(buffer)
+        for participants in self.iter_batches():
+            writer.writerows(participants)
+            yield self._drain(buffer)
+
+    @staticmethod
+    def _drain(buffer: io.StringIO) -> str:
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
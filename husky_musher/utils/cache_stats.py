@@ -0,0 +1,192 @@
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from injector import inject, singleton
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache
+
+# Upper bounds (in seconds) of the TTL buckets, with their labels
+TTL_BUCKETS = [(60, "< 1m"), (3600, "< 1h"), (86400, "< 1d")]
+TTL_BUCKET_LABELS = ["none"] + [label for _, label in TTL_BUCKETS] + [">= 1d"]
+
+
+def get_key_family(key: str) -> str:
+    """
+    Names the kind of entry stored under *key* (without the cache prefix).
+
+    >>> get_key_family('sessions.0a1b2c3d')
+    'sessions'
+    >>> get_key_family('dawg.registrationComplete')
+    'completion flags'
+    >>> get_key_family('dawg.surveyLink')
+    'survey links'
+    >>> get_key_family('dawg')
+    'records'
+    >>> get_key_family('rate_limits.redcap')
+    'rate limits'
+    >>> get_key_family('test')
+    'internal'
+    """
+    if key.startswith("sessions."):
+        return "sessions"
+    if key.startswith("leases."):
+        return "leases"
+    if key.startswith("rate_limits."):
+        return "rate limits"
+    # "test" is written at boot, to check that redis can be reached
+    if key == "test" or key.startswith(("sync.", "admin.")):
+        return "internal"
+    if key.endswith(".registrationComplete"):
+        return "completion flags"
+    if key.endswith(".recordId"):
+        return "record index"
+    if key.endswith(".surveyLink"):
+        return "survey links"
+    # NetIDs have no dots
+    if "." in key:
+        return "other"
+    return "records"
+
+
+def get_ttl_bucket(pttl: Optional[int]) -> str:
+    """
+    >>> get_ttl_bucket(-1)
+    'none'
+    >>> get_ttl_bucket(30_000)
+    '< 1m'
+    >>> get_ttl_bucket(7 * 86400 * 1000)
+    '>= 1d'
+    """
+    if pttl is None or pttl < 0:
+        return "none"
+    for seconds, label in TTL_BUCKETS:
+        if pttl < seconds * 1000:
+            return label
+    return TTL_BUCKET_LABELS[-1]
+
+
+class KeyFamilyStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.memory_bytes = 0
+        self.ttl_buckets = dict.fromkeys(TTL_BUCKET_LABELS, 0)
+        self.idle_seconds: List[int] = []
+
+    def add(
+        self, memory_bytes: Optional[int], pttl: Optional[int], idle: Optional[int]
+    ):
+        self.count += 1
+        self.memory_bytes += memory_bytes or 0
+        self.ttl_buckets[get_ttl_bucket(pttl)] += 1
+        if idle is not None:
+            self.idle_seconds.append(idle)
+
+    def to_dict(self, scale: float) -> Dict[str, Any]:
+        """*scale* extrapolates the sampled keys to the whole cache."""
+        return {
+            "name": self.name,
+            "sampled": self.count,
+            "estimated_count": round(self.count * scale),
+            "estimated_memory_bytes": round(self.memory_bytes * scale),
+            "average_bytes": self.memory_bytes // self.count if self.count else 0,
+            "ttl_buckets": self.ttl_buckets,
+            "median_idle_seconds": (
+                statistics.median(self.idle_seconds) if self.idle_seconds else None
+            ),
+            "max_idle_seconds": max(self.idle_seconds) if self.idle_seconds else None,
+        }
+
+
+@singleton
+class CacheAnalyzer:
+    """
+    Reports what the cache holds, by key family (see `get_key_family`):
+    how many keys, how much memory, how long until they expire, and how
+    long since they were last used (redis does not track their age; the
+    idle time is the closest it offers).
+
+    The keys are sampled with SCAN, a batch at a time, which does not block
+    redis the way KEYS would, until *cache_stats_budget_seconds* have passed.
+    When the budget runs out before the scan completes, the counts are
+    extrapolated from the share of the keyspace scanned. Reports are cached
+    for *cache_stats_max_age_seconds*, so that reloading the admin page
+    does not scan again.
+    """
+
+    report_key = "admin.cacheStats"
+    batch_size = 500
+
+    @inject
+    def __init__(self, cache: Cache, settings: AppSettings):
+        self.cache = cache
+        self.budget_seconds = settings.cache_stats_budget_seconds
+        self.max_age_seconds = settings.cache_stats_max_age_seconds
+
+    def get_report(self, refresh: bool = False) -> Dict[str, Any]:
+        if not refresh:
+            report = self.cache.get(self.report_key, load_json=True)
+            if report:
+                return report
+        report = self.analyze()
+        self.cache.set(
+            self.report_key,
+            report,
+            expire_seconds=self.max_age_seconds,
+            save_json=True,
+        )
+        return report
+
+    def analyze(self) -> Dict[str, Any]:
+        redis = self.cache.redis
+        prefix = self.cache.prefix
+        start = time.monotonic()
+        families: Dict[str, KeyFamilyStats] = {}
+        cursor, scanned = 0, 0
+        while True:
+            # Keys are matched here rather than with MATCH, so that the
+            # number of keys scanned (for extrapolating) is known.
+            cursor, keys = redis.scan(cursor, count=self.batch_size)
+            scanned += len(keys)
+            keys = [k.decode() if isinstance(k, bytes) else k for k in keys]
+            keys = [k for k in keys if k.startswith(prefix)]
+            if keys:
+                self._sample(keys, families)
+            if not cursor or time.monotonic() - start > self.budget_seconds:
+                break
+
+        complete = not cursor
+        total_keys = redis.dbsize()
+        scale = 1 if complete or not scanned else max(total_keys / scanned, 1)
+        return {
+            "generated_at": time.time(),
+            "duration_seconds": round(time.monotonic() - start, 3),
+            "complete": complete,
+            "scanned_keys": scanned,
+            "total_keys": total_keys,
+            "families": sorted(
+                (f.to_dict(scale) for f in families.values()),
+                key=lambda f: -f["estimated_memory_bytes"],
+            ),
+        }
+
+    def _sample(self, keys: List[str], families: Dict[str, KeyFamilyStats]):
+        pipeline = self.cache.redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.memory_usage(key)
+            pipeline.pttl(key)
+            pipeline.object("idletime", key)
+        results = pipeline.execute(raise_on_error=False)
+        for i, key in enumerate(keys):
+            memory_bytes, pttl, idle = (
+                None if isinstance(r, Exception) else r
+                for r in results[3 * i : 3 * i + 3]
+            )
+            if pttl == -2:
+                # Expired since it was scanned
+                continue
+            name = get_key_family(key[len(self.cache.prefix) :])
+            family = families.setdefault(name, KeyFamilyStats(name))
+            family.add(memory_bytes, pttl, idle)
@@ -0,0 +1,59 @@
+"""
+Flask-Injector wraps every view that has annotated arguments, and resolves
+those arguments on each call through `Injector.call_with_injection`, which
+inspects the view's signature and takes the injector's lock every time:
+that costs a view tens of microseconds per request before it runs, even if
+all it takes are singletons (see `benchmarks/micro.py`).
+
+So blueprints take their singletons (settings, the REDCap client, the
+cache) in their constructors, which are injected once, and views only take
+the values that change with each request: the request and the session.
+`request_scoped` passes those directly from Flask's context locals (which
+are what the injector would provide), and hides the view's annotations so
+that Flask-Injector leaves it alone.
+"""
+import functools
+from typing import Callable, Dict, TypeVar, get_type_hints
+
+from flask import Request
+from flask import request as flask_request
+from flask import session as flask_session
+from werkzeug.local import LocalProxy
+
+# What the injector provides for each request-scoped type; see
+# `flask_injector.FlaskInjector` and `AppInjectorModule.provide_session`
+REQUEST_SCOPED_VALUES: Dict[type, LocalProxy] = {
+    Request: flask_request,
+    LocalProxy: flask_session,
+}
+
+View = TypeVar("View", bound=Callable)
+
+
+def request_scoped(view: View) -> View:
+    """
+    Passes a view the request and the session, for its arguments annotated
+    with `Request` and `LocalProxy`, without going through the injector.
+    Raises TypeError for any other annotated argument: singletons belong
+    to the blueprint.
+    """
+    hints = get_type_hints(view)
+    hints.pop("return", None)
+    values = {}
+    for name, type_ in hints.items():
+        if type_ not in REQUEST_SCOPED_VALUES:
+            raise TypeError(
+                f"{view.__qualname__} takes {name}: {type_.__name__}, which is "
+                f"not request-scoped; inject it into the blueprint instead"
+            )
+        values[name] = REQUEST_SCOPED_VALUES[type_]
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        for name, value in values.items():
+            kwargs.setdefault(name, value)
+        return view(*args, **kwargs)
+
+    # Without annotations, Flask-Injector does not wrap the view
+    wrapper.__annotations__ = {}
+    return wrapper  # type: ignore
@@ -0,0 +1,91 @@
+import threading
+from logging import Logger
+from typing import Callable, List, Optional
+
+from injector import inject, singleton
+
+from husky_musher.utils.cache import Lease
+
+
+class PeriodicJob:
+    """
+    Calls *run* every *interval_seconds* from a background thread (a
+    greenlet, under gunicorn's gevent workers). When a *lease* is given,
+    only the process holding it runs the job, so that a job runs once per
+    interval across all workers and pods rather than once per worker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        interval_seconds: float,
+        run: Callable[[], None],
+        logger: Logger,
+        lease: Optional[Lease] = None,
+    ):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.run = run
+        self.logger = logger
+        self.lease = lease
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def tick(self) -> bool:
+        """Runs the job once, if this process holds (or can take) the lease."""
+        if self.lease and not (self.lease.renew() or self.lease.acquire()):
+            return False
+        self.run()
+        return True
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval_seconds):
+            try:
+                self.tick()
+            except Exception as e:
+                # Try again next interval
+                self.logger.exception(f"Background job {self.name} failed: {e}")
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(
+            target=self._loop, name=f"job-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self.lease:
+            try:
+                self.lease.release()
+            except Exception:
+                pass
+
+
+@singleton
+class BackgroundJobs:
+    """
+    The background jobs of this process. Jobs must be started after the
+    worker process is forked (see `post_worker_init` in gunicorn.conf.py),
+    since threads do not survive a fork.
+    """
+
+    @inject
+    def __init__(self, logger: Logger):
+        self.logger = logger.getChild("jobs")
+        self.jobs: List[PeriodicJob] = []
+
+    def add(self, job: PeriodicJob):
+        self.jobs.append(job)
+
+    def start(self):
+        for job in self.jobs:
+            self.logger.info(
+                f"Running {job.name} every {job.interval_seconds}s in the background"
+            )
+            job.start()
+
+    def stop(self):
+        for job in self.jobs:
+            job.stop()
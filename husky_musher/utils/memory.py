@@ -0,0 +1,213 @@
+"""
+Watches the memory of each worker, and finds out where it grows.
+
+Workers used to be recycled after a fixed number of requests, which threw
+away their kept-alive REDCap connections and in-process caches whether or
+not they had grown. Instead, each worker checks its memory every
+`worker_memory_check_interval_seconds`, exports it as metrics, and asks
+gunicorn to replace it (gracefully, as max_requests does) once its private
+memory passes `worker_memory_limit_mb`. Each worker's limit is lowered by
+a random fraction of up to `worker_memory_limit_jitter`, so that workers
+that grow at the same rate don't all restart at once.
+
+Private memory (USS) is what the worker would free by exiting; unlike the
+RSS, it leaves out the pages shared with the arbiter, which preloads the
+app (see gunicorn.conf.py).
+
+`diff_allocations` reports which lines of code allocated the memory that
+was still held after a while, using tracemalloc; see /admin/memory.
+tracemalloc slows allocations down, so it only traces during the diff.
+"""
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from logging import Logger
+from typing import Callable, Dict, List, Optional
+
+from injector import inject, singleton
+from prometheus_client import Counter, Gauge
+
+from husky_musher.settings import AppSettings
+
+MB = 1024 * 1024
+DEFAULT_DIFF_LIMIT = 25
+
+_diff_lock = threading.Lock()
+
+
+class WorkerMemoryGauge(Gauge):
+    pass
+
+
+class WorkerAllocatedBlocksGauge(Gauge):
+    pass
+
+
+class WorkerMemoryRecycleCounter(Counter):
+    pass
+
+
+def read_memory_usage() -> Dict[str, int]:
+    """
+    Returns the resident (rss) and private memory of this process, in
+    bytes, from /proc; or an empty dict where /proc is not available.
+    """
+    try:
+        # Linux 4.14+; the sums of smaps, which is too slow to read often
+        with open("/proc/self/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                key, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[key] = int(value.split()[0]) * 1024
+        return {
+            "rss": fields["Rss"],
+            "private": fields["Private_Clean"] + fields["Private_Dirty"],
+        }
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared = (int(v) for v in f.read().split()[:3])
+        page_size = resource.getpagesize()
+        return {
+            "rss": resident * page_size,
+            "private": (resident - shared) * page_size,
+        }
+    except (OSError, ValueError):
+        return {}
+
+
+@singleton
+class MemoryMonitor:
+    @inject
+    def __init__(
+        self,
+        settings: AppSettings,
+        logger: Logger,
+        memory_bytes: WorkerMemoryGauge,
+        allocated_blocks: WorkerAllocatedBlocksGauge,
+        recycles: WorkerMemoryRecycleCounter,
+    ):
+        self.limit_bytes = settings.worker_memory_limit_mb * MB
+        self.jitter = settings.worker_memory_limit_jitter
+        self.logger = logger.getChild("memory")
+        self.memory_bytes = memory_bytes
+        self.allocated_blocks = allocated_blocks
+        self.recycles = recycles
+        # Asks the server to replace this worker once it is done with its
+        # requests; set by gunicorn's post_worker_init (see gunicorn.conf.py).
+        # Without it, the limit is not enforced.
+        self.recycle: Optional[Callable[[], None]] = None
+        self.recycling = False
+        self.worker_limit_bytes = self._draw_limit()
+        # When the app is preloaded, the monitor is created in the arbiter;
+        # each worker must draw its own limit.
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _draw_limit(self) -> int:
+        return int(self.limit_bytes * (1 - random.uniform(0, self.jitter)))
+
+    def _reset(self):
+        self.recycling = False
+        self.worker_limit_bytes = self._draw_limit()
+
+    def check(self) -> Dict[str, int]:
+        usage = read_memory_usage()
+        for kind, value in usage.items():
+            self.memory_bytes.labels(kind).set(value)
+        self.allocated_blocks.set(sys.getallocatedblocks())
+        private = usage.get("private", 0)
+        if (
+            self.limit_bytes
+            and private > self.worker_limit_bytes
+            and self.recycle
+            and not self.recycling
+        ):
+            self.logger.warning(
+                f"Recycling worker {os.getpid()}: its private memory "
+                f"({private // MB}MB) is over its limit "
+                f"({self.worker_limit_bytes // MB}MB)"
+            )
+            self.recycling = True
+            self.recycles.inc()
+            self.recycle()
+        return usage
+
+
+class AllocationDiffBusy(RuntimeError):
+    pass
+
+
+class AllocationDiff:
+    def __init__(
+        self, stats: List[tracemalloc.StatisticDiff], duration_seconds: float
+    ):
+        self.stats = stats
+        self.duration_seconds = duration_seconds
+
+    @property
+    def growth_bytes(self) -> int:
+        return sum(stat.size_diff for stat in self.stats)
+
+    def top(self, limit: int = DEFAULT_DIFF_LIMIT) -> List[tracemalloc.StatisticDiff]:
+        """The allocation sites that grew the most, largest first."""
+        growing = [stat for stat in self.stats if stat.size_diff > 0]
+        return sorted(growing, key=lambda stat: stat.size_diff, reverse=True)[:limit]
+
+    def to_text(self, limit: int = DEFAULT_DIFF_LIMIT) -> str:
+        lines = [
+            f"Memory allocated over {self.duration_seconds:.1f}s and still held: "
+            f"{self.growth_bytes:+,d} bytes",
+            "",
+        ]
+        for stat in self.top(limit):
+            lines.append(
+                f"{stat.size_diff:+,d} bytes in {stat.count_diff:+,d} blocks "
+                f"(now {stat.size:,d} bytes)"
+            )
+            # The most recent frame last, as in Python's tracebacks
+            for frame in stat.traceback:
+                lines.append(f"    {frame.filename}:{frame.lineno}")
+        return "\n".join(lines) + "\n"
+
+
+def diff_allocations(seconds: float, frames: int = 1) -> AllocationDiff:
+    """
+    Traces this process' allocations for *seconds*, and returns where the
+    memory that was allocated and not freed in that time was allocated,
+    by line (with *frames* callers). Raises AllocationDiffBusy if a diff
+    is already running.
+    """
+    if not _diff_lock.acquire(blocking=False):
+        raise AllocationDiffBusy("A memory diff is already running in this worker")
+    try:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(frames)
+        start_time = time.time()
+        try:
+            before = tracemalloc.take_snapshot()
+            # Yields to the requests being served, under gevent
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+        duration = time.time() - start_time
+    finally:
+        _diff_lock.release()
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ]
+    key_type = "traceback" if frames > 1 else "lineno"
+    stats = after.filter_traces(filters).compare_to(
+        before.filter_traces(filters), key_type
+    )
+    return AllocationDiff(stats, duration)
@@ -0,0 +1,166 @@
+import fcntl
+import functools
+import glob
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from prometheus_client import Histogram
+from prometheus_client.mmap_dict import MmapedDict
+
+# Only these metric types can be folded together by simply adding
+# their values; gauges have per-process semantics (and are already
+# cleaned up by `mark_process_dead`), so they are never compacted.
+COMPACTABLE_TYPES = ("counter", "histogram", "summary")
+
+# The archive files must still match the `<type>_*.db` pattern so that the
+# MultiProcessCollector picks them up during a scrape.
+ARCHIVE_SUFFIX = "archive"
+
+LOCK_FILENAME = "compaction.lock"
+
+
+class MetricsScrapeSecondsHistogram(Histogram):
+    pass
+
+
+def get_multiprocess_dir() -> Optional[str]:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+@contextmanager
+def multiprocess_lock(directory: str, exclusive: bool = False):
+    """
+    Serializes compaction against scrapes. Scrapes take a shared lock, so they
+    never block one another; compaction takes an exclusive lock so that a scrape
+    never sees a dead worker's values both in its original file and in
+    the archive (or in neither).
+    """
+    with open(os.path.join(directory, LOCK_FILENAME), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _get_file_pid(path: str) -> Optional[int]:
+    """
+    >>> _get_file_pid('/tmp/prometheus/counter_1234.db')
+    1234
+    >>> _get_file_pid('/tmp/prometheus/counter_archive.db')
+    """
+    name = os.path.basename(path)[: -len(".db")]
+    pid = name.rsplit("_", 1)[-1]
+    return int(pid) if pid.isdigit() else None
+
+
+def _read_values(path: str) -> Iterable:
+    # Depending on the prometheus_client version, entries are either
+    # (key, value, pos) or (key, value, timestamp, pos)
+    for entry in MmapedDict.read_all_values_from_file(path):
+        yield entry[0], entry[1]
+
+
+def compact_multiprocess_files(directory: str, live_pids: Iterable[int]) -> int:
+    """
+    Folds the counter, histogram and summary files of every process that is not
+    in *live_pids* into a single `<type>_archive.db` file per type, then removes
+    the originals. Values are summed per key, which preserves totals exactly.
+
+    Returns the number of files that were compacted.
+    """
+    live_pids = set(live_pids)
+    compacted = 0
+    with multiprocess_lock(directory, exclusive=True):
+        for typ in COMPACTABLE_TYPES:
+            archive_path = os.path.join(directory, f"{typ}_{ARCHIVE_SUFFIX}.db")
+            dead_files = [
+                path
+                for path in glob.glob(os.path.join(directory, f"{typ}_*.db"))
+                if _get_file_pid(path) not in live_pids | {None}
+            ]
+            if not dead_files:
+                continue
+
+            totals: Dict[str, float] = defaultdict(float)
+            for path in [archive_path, *dead_files]:
+                if os.path.exists(path):
+                    for key, value in _read_values(path):
+                        totals[key] += value
+
+            # Write the new archive next to the old one, and swap it in
+            # atomically; the temporary name does not end in `.db` so that
+            # it is never collected.
+            tmp_path = f"{archive_path}.tmp"
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            archive = MmapedDict(tmp_path)
+            try:
+                for key, value in totals.items():
+                    archive.write_value(key, value)
+            finally:
+                archive.close()
+            os.replace(tmp_path, archive_path)
+
+            for path in dead_files:
+                os.unlink(path)
+            compacted += len(dead_files)
+    return compacted
+
+
+def time_scrape(histogram: MetricsScrapeSecondsHistogram):
+    """
+    Decorates the /metrics view so that scrape time is recorded, and so that
+    scrapes do not read files while a compaction is underway.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def inner(*args, **kwargs):
+            directory = get_multiprocess_dir()
+            with histogram.time():
+                if not directory:
+                    return view(*args, **kwargs)
+                with multiprocess_lock(directory):
+                    return view(*args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+class MultiprocessCompactor:
+    """
+    Runs in the gunicorn arbiter (see gunicorn.conf.py); workers are recycled
+    as they grow (see husky_musher/utils/memory.py), so worker exits are a
+    natural trigger. At most one compaction will run per `interval_seconds`.
+    """
+
+    def __init__(self, directory: str, interval_seconds: float):
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.last_run = time.monotonic()
+
+    def maybe_compact(self, live_pids: Iterable[int], logger=None) -> int:
+        if not self.interval_seconds or not self.directory:
+            return 0
+        now = time.monotonic()
+        if now - self.last_run < self.interval_seconds:
+            return 0
+        self.last_run = now
+        start_time = time.time()
+        try:
+            compacted = compact_multiprocess_files(self.directory, live_pids)
+        except Exception as e:
+            if logger:
+                logger.error(f"Unable to compact prometheus files: {e.__class__}: {e}")
+            return 0
+        if logger and compacted:
+            duration = round(time.time() - start_time, 3)
+            logger.info(
+                f"Compacted {compacted} prometheus files from dead workers ({duration}s)"
+            )
+        return compacted
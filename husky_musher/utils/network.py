@@ -0,0 +1,247 @@
+"""
+Times the network phases of REDCap calls, so that when REDCap gets slower
+we can tell whether resolving its host (which gevent hands off to a thread
+pool), connecting, the TLS handshake or REDCap itself is to blame:
+
+- dns: resolving the host, for new connections
+- connect: the TCP handshake, for new connections
+- tls: the TLS handshake, for new connections
+- ttfb: sending the request until the response headers arrive, which is
+  mostly REDCap's processing time
+- download: reading the response body
+
+Calls made within `record_network_phases()` add their phases to the dict
+it yields; calls over a kept-alive connection have no dns, connect or tls.
+`TimedHTTPAdapter` times calls made with requests; `HttpcoreTrace` times
+calls made with httpx, whose connect includes resolving the host.
+
+`TimedHTTPAdapter` may also reuse the addresses it resolved for a while
+(see `DNSCache`), since a worker opens new connections to REDCap whenever
+its pool runs short, and each of them would otherwise wait on a lookup.
+"""
+import functools
+import socket
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util import connection
+
+
+class NetworkPhase:
+    dns = "dns"
+    connect = "connect"
+    tls = "tls"
+    ttfb = "ttfb"
+    download = "download"
+
+
+# Context variables, unlike thread locals created at import time (before
+# gevent patches `threading`), are separate for each greenlet.
+_current_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "network_phases", default=None
+)
+
+
+@contextmanager
+def record_network_phases() -> Iterator[Dict[str, float]]:
+    """Yields a dict of the seconds spent in each `NetworkPhase` within."""
+    phases: Dict[str, float] = {}
+    token = _current_phases.set(phases)
+    try:
+        yield phases
+    finally:
+        _current_phases.reset(token)
+
+
+def add_phase(phase: str, seconds: float):
+    phases = _current_phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0) + max(0.0, seconds)
+
+
+def add_download_phase(phases: Dict[str, float], total_seconds: float):
+    """
+    Attributes whatever part of a call's *total_seconds* was not spent in
+    the other phases to reading the response; does nothing for calls that
+    were not timed (e.g., replayed ones).
+    """
+    if phases:
+        phases[NetworkPhase.download] = max(0.0, total_seconds - sum(phases.values()))
+
+
+class DNSCache:
+    """
+    Keeps the addresses that hosts resolved to for *ttl_seconds* (or not at
+    all, for 0). getaddrinfo does not tell us the records' TTLs, so keep
+    *ttl_seconds* short; entries are also evicted when none of their
+    addresses accept connections.
+    """
+
+    def __init__(self, ttl_seconds: float = 0):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        addresses: List[str] = []
+        for *_, sockaddr in socket.getaddrinfo(
+            host, port, connection.allowed_gai_family(), socket.SOCK_STREAM
+        ):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        if self.ttl_seconds > 0:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, addresses)
+        return addresses
+
+    def evict(self, host: str, port: int):
+        self._entries.pop((host, port), None)
+
+
+class TimedConnectionMixin:
+    """
+    Resolves the host through a `DNSCache`, then connects to its addresses
+    in turn, as urllib3 does, timing both.
+    """
+
+    def __init__(self, *args, dns_cache: Optional[DNSCache] = None, **kwargs):
+        self.dns_cache = dns_cache or DNSCache()
+        self.new_conn_seconds = 0.0
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        start_time = time.perf_counter()
+        try:
+            addresses = self.dns_cache.resolve(self._dns_host, self.port)
+        except socket.gaierror as e:
+            raise NewConnectionError(
+                self, f"Failed to establish a new connection: {e}"
+            )
+        resolved_time = time.perf_counter()
+        add_phase(NetworkPhase.dns, resolved_time - start_time)
+
+        extra_kw = {}
+        if self.source_address:
+            extra_kw["source_address"] = self.source_address
+        if self.socket_options:
+            extra_kw["socket_options"] = self.socket_options
+        error: Optional[OSError] = None
+        for address in addresses:
+            try:
+                conn = connection.create_connection(
+                    (address, self.port), self.timeout, **extra_kw
+                )
+                break
+            except OSError as e:
+                error = e
+        else:
+            add_phase(NetworkPhase.connect, time.perf_counter() - resolved_time)
+            self.dns_cache.evict(self._dns_host, self.port)
+            if isinstance(error, socket.timeout):
+                raise ConnectTimeoutError(
+                    self,
+                    f"Connection to {self.host} timed out. "
+                    f"(connect timeout={self.timeout})",
+                )
+            raise NewConnectionError(
+                self, f"Failed to establish a new connection: {error}"
+            )
+        end_time = time.perf_counter()
+        add_phase(NetworkPhase.connect, end_time - resolved_time)
+        self.new_conn_seconds = end_time - start_time
+        return conn
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        start_time = time.perf_counter()
+        super().connect()
+        add_phase(
+            NetworkPhase.tls,
+            time.perf_counter() - start_time - self.new_conn_seconds,
+        )
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that records the network phases of its calls (see the
+    module docstring), and resolves hosts through *dns_cache*.
+    """
+
+    def __init__(self, *args, dns_cache: Optional[DNSCache] = None, **kwargs):
+        # Needed by init_poolmanager, which HTTPAdapter.__init__ calls
+        self.dns_cache = dns_cache or DNSCache()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # Pools pass the keyword arguments they don't know to their connections
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": functools.partial(
+                TimedHTTPConnectionPool, dns_cache=self.dns_cache
+            ),
+            "https": functools.partial(
+                TimedHTTPSConnectionPool, dns_cache=self.dns_cache
+            ),
+        }
+
+    def send(self, request, *args, **kwargs):
+        phases = _current_phases.get()
+        connecting_before = sum(phases.values()) if phases is not None else 0
+        start_time = time.perf_counter()
+        response = super().send(request, *args, **kwargs)
+        if phases is not None:
+            # Requests reads the headers (not the body) before returning
+            connecting = sum(phases.values()) - connecting_before
+            add_phase(
+                NetworkPhase.ttfb, time.perf_counter() - start_time - connecting
+            )
+        return response
+
+
+class HttpcoreTrace:
+    """
+    Records the network phases of an httpx call from httpcore's trace
+    events; pass it as the call's `extensions={"trace": ...}`.
+    """
+
+    def __init__(self):
+        self.started: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: Dict):
+        now = time.perf_counter()
+        # e.g., connection.start_tls.started, http11.send_request_headers.complete
+        name, _, stage = event_name.rpartition(".")
+        step = name.rpartition(".")[2]
+        if stage == "started":
+            self.started[step] = now
+        elif step == "connect_tcp" and "connect_tcp" in self.started:
+            add_phase(NetworkPhase.connect, now - self.started["connect_tcp"])
+        elif step == "start_tls" and "start_tls" in self.started:
+            add_phase(NetworkPhase.tls, now - self.started["start_tls"])
+        elif (
+            step == "receive_response_headers"
+            and stage == "complete"
+            and "send_request_headers" in self.started
+        ):
+            add_phase(NetworkPhase.ttfb, now - self.started["send_request_headers"])
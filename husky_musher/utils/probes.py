@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from logging import Logger
+from typing import Any, Callable, Dict, List, Optional
+
+from injector import inject, singleton
+from redis import ConnectionPool, Redis
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache
+from husky_musher.utils.redcap import REDCapClient
+
+LIVENESS_PATH = "/healthz"
+READINESS_PATH = "/readyz"
+
+
+@singleton
+class ReadinessChecks:
+    """
+    Checks that redis and REDCap can be reached. The results are reused for
+    *readiness_check_interval_seconds*, and only one request at a time runs
+    the checks (the others get the previous results), so that the load on
+    redis and REDCap does not depend on how often probes come.
+    """
+
+    @inject
+    def __init__(
+        self,
+        cache: Cache,
+        client: REDCapClient,
+        settings: AppSettings,
+        logger: Logger,
+    ):
+        self.cache = cache
+        self.client = client
+        self.interval_seconds = settings.readiness_check_interval_seconds
+        self.timeout_seconds = settings.readiness_timeout_seconds
+        self.logger = logger.getChild("probes")
+        self.results: Optional[Dict[str, Any]] = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        self._probe_redis: Optional[Redis] = None
+
+    def get_probe_redis(self) -> Redis:
+        """
+        A client with its own connection to the app's redis, which (unlike
+        the app's) gives up after the readiness timeout, so that a redis that
+        stopped responding fails the check rather than hanging it.
+        """
+        pool = getattr(self.cache.redis, "connection_pool", None)
+        if pool is None:
+            # MockRedis or the shared cache, which cannot hang
+            return self.cache.redis
+        if not self._probe_redis:
+            kwargs = {**pool.connection_kwargs, "socket_timeout": self.timeout_seconds}
+            # Unix socket connections don't take a connect timeout
+            if "host" in kwargs:
+                kwargs["socket_connect_timeout"] = self.timeout_seconds
+            self._probe_redis = Redis(
+                connection_pool=ConnectionPool(
+                    connection_class=pool.connection_class,
+                    max_connections=1,
+                    **kwargs,
+                )
+            )
+        return self._probe_redis
+
+    def check_redis(self):
+        self.get_probe_redis().ping()
+
+    def check_redcap(self):
+        if not self.client.api_url:
+            return
+        # Not `client.request`, which would wait for the rate limit, and add
+        # probes to the REDCap metrics
+        response = self.client.session.post(
+            self.client.api_url,
+            data={
+                "token": self.client.api_token,
+                "content": "version",
+                "format": "json",
+            },
+            timeout=self.timeout_seconds,
+        )
+        # An error response still shows that REDCap can be reached,
+        # unless REDCap itself is failing
+        if response.status_code >= 500:
+            response.raise_for_status()
+
+    def run_checks(self) -> Dict[str, Any]:
+        checks: Dict[str, Callable[[], None]] = {
+            "redis": self.check_redis,
+            "redcap": self.check_redcap,
+        }
+        results: Dict[str, Any] = {"ready": True}
+        for name, check in checks.items():
+            start_time = time.time()
+            try:
+                check()
+                result = {"ok": True}
+            except Exception as e:
+                self.logger.warning(f"Readiness check {name} failed: {e}")
+                result = {"ok": False, "error": e.__class__.__name__}
+                results["ready"] = False
+            result["seconds"] = round(time.time() - start_time, 3)
+            results[name] = result
+        return results
+
+    def is_fresh(self) -> bool:
+        return bool(self.results) and (
+            time.monotonic() - self.checked_at < self.interval_seconds
+        )
+
+    def get_results(self) -> Dict[str, Any]:
+        if self.is_fresh():
+            return self.results
+        if not self._lock.acquire(blocking=self.results is None):
+            # Another request is running the checks
+            return self.results
+        try:
+            if not self.is_fresh():
+                self.results = self.run_checks()
+                self.checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+        return self.results
+
+
+class ProbeMiddleware:
+    """
+    A WSGI middleware that answers Kubernetes' probes before they reach
+    Flask, so that they skip the session, the injector and the request
+    hooks: LIVENESS_PATH only shows that the worker is serving requests;
+    READINESS_PATH also shows that redis and REDCap can be reached (see
+    `ReadinessChecks`), and fails with a 503 otherwise.
+    """
+
+    def __init__(self, wsgi_app: Callable, readiness: ReadinessChecks):
+        self.wsgi_app = wsgi_app
+        self.readiness = readiness
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == LIVENESS_PATH:
+            return self.respond(start_response, "200 OK", {"live": True})
+        if path == READINESS_PATH:
+            results = self.readiness.get_results()
+            status = "200 OK" if results["ready"] else "503 Service Unavailable"
+            return self.respond(start_response, status, results)
+        return self.wsgi_app(environ, start_response)
+
+    @staticmethod
+    def respond(start_response, status: str, payload: Dict) -> List[bytes]:
+        body = json.dumps(payload).encode()
+        start_response(
+            status,
+            [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(body))),
+                ("Cache-Control", "no-store"),
+            ],
+        )
+        return [body]
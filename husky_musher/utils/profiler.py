@@ -0,0 +1,181 @@
+"""
+A low-overhead sampling profiler that can be run inside a live worker.
+
+A real OS thread (not a greenlet, which would never be scheduled while the
+worker is CPU-bound) wakes up every `interval_seconds`, and records the
+stack of every other thread in the process. Greenlet switches are traced
+so that each sample is attributed to the greenlet that was running at the
+time; samples taken while the gevent hub is running are time spent idle or
+waiting on I/O.
+
+Overhead: each sample walks at most `max_depth` frames per thread while
+holding the GIL, which takes tens of microseconds; at the default rate of
+100 samples per second that costs well under 1% of one CPU. The greenlet
+trace function adds a dictionary write per greenlet switch. Only one profile
+may run per worker at a time, and durations are capped by the caller.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import greenlet
+from gevent import monkey
+
+# Under gunicorn, `threading` and `time` are monkey-patched by gevent; the
+# sampler must run on a real thread, and sleep without yielding to the hub.
+_start_new_thread = monkey.get_original("_thread", "start_new_thread")
+_get_ident = monkey.get_original("_thread", "get_ident")
+_sleep = monkey.get_original("time", "sleep")
+
+DEFAULT_INTERVAL_SECONDS = 0.01
+MIN_INTERVAL_SECONDS = 0.005
+DEFAULT_MAX_DEPTH = 64
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+class ProfileResult:
+    def __init__(
+        self, stacks: Counter, duration_seconds: float, interval_seconds: float
+    ):
+        self.stacks = stacks
+        self.duration_seconds = duration_seconds
+        self.interval_seconds = interval_seconds
+
+    @property
+    def num_samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def to_collapsed(self) -> str:
+        """
+        Renders the profile in the "collapsed stack" format understood by
+        flamegraph.pl, speedscope and most other flame graph tools.
+
+        >>> ProfileResult(Counter({"a;b": 2, "a": 1}), 1, 0.01).to_collapsed()
+        'a;b 2\\na 1\\n'
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def _shorten_filename(filename: str, path_prefixes: List[str]) -> str:
+    """
+    >>> _shorten_filename('/app/husky_musher/app.py', ['/app/'])
+    'husky_musher/app.py'
+    """
+    for prefix in path_prefixes:
+        if filename.startswith(prefix):
+            return filename[len(prefix) :]
+    return filename
+
+
+def _greenlet_label(glet) -> str:
+    if type(glet).__name__ == "Hub":
+        return "greenlet:hub"
+    if glet.parent is None:
+        return "greenlet:main"
+    run = getattr(glet, "_run", None) or getattr(glet, "run", None)
+    return f"greenlet:{getattr(run, '__qualname__', type(glet).__name__)}"
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        interval_seconds: float = DEFAULT_INTERVAL_SECONDS,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ):
+        self.interval_seconds = max(interval_seconds, MIN_INTERVAL_SECONDS)
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._path_prefixes = [
+            path + os.sep for path in sorted(sys.path, key=len, reverse=True) if path
+        ]
+        self._frame_labels: Dict[tuple, str] = {}
+        self._running_greenlets: Dict[int, str] = {}
+        self._stop = False
+        self._done = False
+
+    def _trace_greenlet_switch(self, event, args):
+        if event in ("switch", "throw"):
+            _, target = args
+            self._running_greenlets[_get_ident()] = _greenlet_label(target)
+
+    def _format_frame(self, frame) -> str:
+        code = frame.f_code
+        key = (code, frame.f_lineno)
+        label = self._frame_labels.get(key)
+        if not label:
+            filename = _shorten_filename(code.co_filename, self._path_prefixes)
+            # Semicolons delimit frames in the collapsed format
+            label = f"{code.co_name} ({filename}:{frame.f_lineno})".replace(";", ":")
+            self._frame_labels[key] = label
+        return label
+
+    def _collapse_stack(self, frame) -> List[str]:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(self._format_frame(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _sample(self, sampler_ident: int):
+        for ident, frame in sys._current_frames().items():
+            if ident == sampler_ident:
+                continue
+            stack = self._collapse_stack(frame)
+            label = self._running_greenlets.get(ident, "thread")
+            self.stacks[";".join([label, *stack])] += 1
+
+    def _run_sampler(self, deadline: float):
+        ident = _get_ident()
+        try:
+            while not self._stop and time.monotonic() < deadline:
+                self._sample(ident)
+                _sleep(self.interval_seconds)
+        finally:
+            self._done = True
+
+    def run(self, duration_seconds: float) -> ProfileResult:
+        """
+        Profiles the process for *duration_seconds*. The calling greenlet
+        (or thread) sleeps cooperatively while the sampler runs, so that
+        the worker keeps serving requests.
+        """
+        if not _profile_lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running in this worker")
+        previous_trace = greenlet.settrace(self._chain(greenlet.gettrace()))
+        start_time = time.monotonic()
+        try:
+            self._running_greenlets[_get_ident()] = _greenlet_label(
+                greenlet.getcurrent()
+            )
+            _start_new_thread(self._run_sampler, (start_time + duration_seconds,))
+            while not self._done:
+                # Monkey-patched under gevent; this yields to other greenlets.
+                time.sleep(min(self.interval_seconds * 10, duration_seconds))
+        finally:
+            self._stop = True
+            greenlet.settrace(previous_trace)
+            _profile_lock.release()
+        return ProfileResult(
+            self.stacks,
+            duration_seconds=round(time.monotonic() - start_time, 3),
+            interval_seconds=self.interval_seconds,
+        )
+
+    def _chain(self, previous_trace: Optional[callable]):
+        def trace(event, args):
+            self._trace_greenlet_switch(event, args)
+            if previous_trace:
+                return previous_trace(event, args)
+
+        return trace
@@ -0,0 +1,258 @@
+"""
+Limits the rate of REDCap calls made by the whole fleet (every worker of
+every pod), so that a surge waits a little rather than tripping REDCap's
+per-token API rate limit and failing for everyone.
+
+The limit is a token bucket kept in redis, and updated by a Lua script so
+that concurrent callers never see the same tokens. Each call takes a
+token; callers that find the bucket empty wait until it refills, within a
+budget, then give up. Background work (the participant sync, warm-up
+jobs) may not take the last INTERACTIVE_RESERVE of the bucket, so that
+participants being redirected go first when calls are scarce.
+
+Without redis, the processes on a host share a bucket in the shared cache
+(see husky_musher/utils/shared_cache.py), or else each process keeps its
+own; either way, with the same limit.
+"""
+import asyncio
+import random
+import threading
+import time
+from logging import Logger
+from typing import Dict, Optional, Tuple
+
+from injector import inject, singleton
+from prometheus_client import Counter, Histogram
+from werkzeug.exceptions import ServiceUnavailable
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache, MockRedis
+from husky_musher.utils.shared_cache import SharedMemoryRedis
+
+# The share of the bucket that only interactive calls may take
+INTERACTIVE_RESERVE = 0.25
+# The most that callers sleep between attempts, since the time until the
+# bucket has a token for them changes as other callers take tokens
+MAX_POLL_SECONDS = 0.5
+
+TOKEN_BUCKET_SCRIPT = """
+pcall(redis.replicate_commands)
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate / 1000)
+local wait_ms = 0
+if tokens >= reserve + 1 then
+    tokens = tokens - 1
+else
+    wait_ms = math.ceil((reserve + 1 - tokens) * 1000 / rate)
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return wait_ms
+"""
+
+
+class Priority:
+    # A participant is waiting on the call
+    interactive = "interactive"
+    # The participant sync, refreshes, and jobs that warm the cache
+    background = "background"
+
+
+class REDCapRateLimitWaitHistogram(Histogram):
+    pass
+
+
+class REDCapThrottledCounter(Counter):
+    pass
+
+
+class LocalTokenBucket:
+    """The token bucket of `TOKEN_BUCKET_SCRIPT`, for a single process."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def refill_and_take(
+        self, tokens: float, updated: float, now: float, reserve: float
+    ) -> Tuple[float, float]:
+        """
+        Returns the tokens left in a bucket that had *tokens* at *updated*,
+        and 0 if a token was taken at *now*, or else the seconds to wait.
+        """
+        tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+        if tokens >= reserve + 1:
+            return tokens - 1, 0
+        return tokens, (reserve + 1 - tokens) / self.rate
+
+    def take(self, reserve: float) -> float:
+        """Returns 0 if a token was taken, or else the seconds to wait for one."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens, wait = self.refill_and_take(
+                self.tokens, self.updated, now, reserve
+            )
+            self.updated = now
+            return wait
+
+
+class SharedTokenBucket(LocalTokenBucket):
+    """
+    The token bucket of `TOKEN_BUCKET_SCRIPT`, kept in the shared cache
+    under *key*, for every process on the host.
+    """
+
+    def __init__(
+        self, redis: SharedMemoryRedis, key: str, rate: float, capacity: float
+    ):
+        super().__init__(rate, capacity)
+        self.redis = redis
+        self.key = key
+        self.expire_ms = int(capacity * 1000 / rate) + 1000 if rate else None
+
+    def take(self, reserve: float) -> float:
+        with self.redis.lock():
+            # Wall clock time, which (unlike the monotonic clock) every
+            # process reads the same
+            now = time.time()
+            value = self.redis.get(self.key)
+            tokens, updated = (
+                map(float, value.split()) if value else (self.capacity, now)
+            )
+            tokens, wait = self.refill_and_take(tokens, updated, now, reserve)
+            self.redis.set(self.key, f"{tokens} {now}", px=self.expire_ms)
+        return wait
+
+
+@singleton
+class REDCapRateLimiter:
+    bucket_key = "rate_limits.redcap"
+
+    @inject
+    def __init__(
+        self,
+        cache: Cache,
+        settings: AppSettings,
+        logger: Logger,
+        wait_seconds: REDCapRateLimitWaitHistogram,
+        throttled: REDCapThrottledCounter,
+    ):
+        self.cache = cache
+        self.logger = logger.getChild("rate_limit")
+        self.wait_seconds = wait_seconds
+        self.throttled = throttled
+        self.rate = settings.redcap_rate_limit_per_minute / 60
+        self.capacity = float(
+            settings.redcap_rate_limit_burst or max(1, self.rate * 10)
+        )
+        self.max_wait_seconds: Dict[str, float] = {
+            Priority.interactive: settings.redcap_rate_limit_max_wait_seconds,
+            Priority.background: (
+                settings.redcap_rate_limit_background_max_wait_seconds
+            ),
+        }
+        self.reserves = {
+            Priority.interactive: 0,
+            Priority.background: self.capacity * INTERACTIVE_RESERVE,
+        }
+        self.script = None
+        self.local_bucket: Optional[LocalTokenBucket] = None
+        if isinstance(cache.redis, SharedMemoryRedis):
+            self.local_bucket = SharedTokenBucket(
+                cache.redis,
+                cache.sanitize_key(self.bucket_key),
+                self.rate,
+                self.capacity,
+            )
+        elif isinstance(cache.redis, MockRedis):
+            self.local_bucket = LocalTokenBucket(self.rate, self.capacity)
+        elif self.enabled:
+            self.script = cache.redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, priority: str) -> float:
+        """Returns 0 if a token was taken, or else the seconds to wait for one."""
+        reserve = self.reserves[priority]
+        if self.local_bucket:
+            return self.local_bucket.take(reserve)
+        try:
+            wait_ms = self.script(
+                keys=[self.cache.sanitize_key(self.bucket_key)],
+                args=[self.rate, self.capacity, reserve],
+            )
+        except Exception as e:
+            # Don't fail REDCap calls because the limiter is unavailable
+            self.logger.warning(f"Unable to check the REDCap rate limit: {e}")
+            return 0
+        return int(wait_ms) / 1000
+
+    def _next_wait(self, priority: str, start: float) -> Tuple[float, float]:
+        """
+        Returns how long to sleep before trying again (0 once a token was
+        taken), and how long has been waited so far.
+        """
+        waited = time.monotonic() - start
+        wait = self.take(priority)
+        if not wait:
+            return 0, waited
+        remaining = self.max_wait_seconds[priority] - waited
+        if remaining <= 0:
+            self.throttled.labels(priority, "rejected").inc()
+            self.wait_seconds.labels(priority).observe(waited)
+            raise ServiceUnavailable("Too many REDCap requests; try again shortly")
+        # Jitter, so that waiting callers don't all retry at once
+        wait = min(wait, remaining, MAX_POLL_SECONDS) * random.uniform(0.8, 1.2)
+        return wait, waited
+
+    def _observe(self, priority: str, waited: float, delayed: bool):
+        if delayed:
+            self.throttled.labels(priority, "delayed").inc()
+        self.wait_seconds.labels(priority).observe(waited if delayed else 0)
+
+    def acquire(self, priority: str = Priority.interactive):
+        """
+        Waits, if needed, until a REDCap call may be made. Raises
+        ServiceUnavailable if that takes longer than the priority's budget.
+        """
+        if not self.enabled:
+            return
+        start = time.monotonic()
+        delayed = False
+        while True:
+            wait, waited = self._next_wait(priority, start)
+            if not wait:
+                break
+            time.sleep(wait)
+            delayed = True
+        self._observe(priority, waited, delayed)
+
+    async def acquire_async(self, priority: str = Priority.interactive):
+        """See `acquire`."""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        delayed = False
+        while True:
+            # The script runs on the synchronous redis client
+            wait, waited = await loop.run_in_executor(
+                None, self._next_wait, priority, start
+            )
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+            delayed = True
+        self._observe(priority, waited, delayed)
@@ -0,0 +1,86 @@
+"""
+Participant records are cached with the version of their shape (the
+fields exported from REDCap, and how they are stored), so that a deploy
+that changes the shape does not require flushing the cache, which would
+send every participant's next visit to REDCap at once.
+
+When the shape changes:
+
+1. Bump RECORD_SCHEMA_VERSION.
+2. Add a migration from the previous version to MIGRATIONS. A migration
+   upgrades a record in place (e.g., renames a field, or adds one with a
+   default), or returns None if the record must be exported from REDCap
+   again (e.g., a field was added to `build_fetch_participant_data` whose
+   value cannot be derived).
+
+Records of older versions are still served. They are upgraded, and
+re-cached, the next time they are read; those that cannot be upgraded
+are refreshed from REDCap in the background (see
+`REDCapClient.fetch_participant`). During a rolling deploy, pods on
+the previous version read records written by the new one as-is: only
+add fields, so that older readers can ignore them.
+"""
+from typing import Any, Callable, Dict, Optional, Tuple
+
+RECORD_SCHEMA_VERSION = 1
+SCHEMA_VERSION_KEY = "_schema"
+
+Record = Dict[str, Any]
+
+# Upgrades a record from the version it is keyed by to the next one.
+# Records cached before versioning have version 0; their shape is the same
+# as version 1.
+MIGRATIONS: Dict[int, Callable[[Record], Optional[Record]]] = {
+    0: lambda record: record,
+}
+
+
+class RecordStatus:
+    current = "current"
+    # Upgraded in memory; should be cached again
+    migrated = "migrated"
+    # Could not be upgraded; should be exported from REDCap again
+    stale = "stale"
+
+
+def get_schema_version(record: Record) -> int:
+    return record.get(SCHEMA_VERSION_KEY, 0)
+
+
+def tag_record(record: Record) -> Record:
+    """
+    Returns *record* tagged with the current version, ready to be cached.
+
+    >>> tag_record({'record_id': '1'})
+    {'record_id': '1', '_schema': 1}
+    """
+    return {**record, SCHEMA_VERSION_KEY: RECORD_SCHEMA_VERSION}
+
+
+def upgrade_record(
+    record: Record, migrations: Optional[Dict[int, Callable]] = None
+) -> Tuple[Record, str]:
+    """
+    Returns the cached *record* upgraded to the current version (or as-is,
+    if it cannot be), and its `RecordStatus`. Records written by a newer
+    version are returned as-is, as current.
+
+    >>> upgrade_record({'record_id': '1'})
+    ({'record_id': '1', '_schema': 1}, 'migrated')
+    >>> upgrade_record({'record_id': '1', '_schema': 1})
+    ({'record_id': '1', '_schema': 1}, 'current')
+    >>> upgrade_record({'record_id': '1'}, {0: lambda record: None})
+    ({'record_id': '1'}, 'stale')
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    version = get_schema_version(record)
+    if version >= RECORD_SCHEMA_VERSION:
+        return record, RecordStatus.current
+    upgraded: Optional[Record] = record
+    while version < RECORD_SCHEMA_VERSION:
+        migrate = migrations.get(version)
+        upgraded = migrate(dict(upgraded)) if migrate else None
+        if upgraded is None:
+            return record, RecordStatus.stale
+        version += 1
+    return tag_record(upgraded), RecordStatus.migrated
@@ -0,0 +1,219 @@
+"""
+Record and replay of REDCap API traffic, so that changes to the client can
+be benchmarked against production-like response sizes and latencies
+without network access (see docs/operations.md).
+
+Captures are JSON lines, one REDCap call per line. API tokens are dropped,
+identifying values (see `PII_FIELDS`) are replaced by pseudonyms
+wherever they appear in the call, and so are the hashes of survey links.
+"""
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import parse_qsl
+
+from requests import PreparedRequest, Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Fields of REDCap records that identify participants
+PII_FIELDS = ("uw_netid", "uw_email", "first_name", "last_name")
+QUOTED_VALUE = re.compile(r'"([^"]*)"')
+# The hash of survey (`s=`) and survey queue (`sq=`) links, which lets
+# anyone who has the link open the participant's survey
+SURVEY_LINK_HASH = re.compile(r"([?&]sq?=)([^&#\s\"]+)")
+
+
+def get_call_key(data: Dict[str, str]) -> str:
+    """
+    Identifies the kind of REDCap call made with *data*; replayed calls are
+    matched to captured calls of the same kind.
+
+    >>> get_call_key({'content': 'record', 'data': '[]'})
+    'record:import'
+    >>> get_call_key({'content': 'surveyLink'})
+    'surveyLink'
+    """
+    content = data.get("content", "")
+    if content == "record":
+        return "record:import" if "data" in data else "record:export"
+    return content
+
+
+class Sanitizer:
+    """
+    Replaces identifying values with pseudonyms. The pseudonyms are keyed
+    with a secret *salt*, so that they cannot be reversed by hashing likely
+    NetIDs; captures made with the same salt use the same pseudonyms.
+    """
+
+    def __init__(self, salt: Optional[bytes] = None):
+        self.salt = salt or os.urandom(16)
+
+    def pseudonym(self, value: str) -> str:
+        if not value:
+            return value
+        digest = hmac.new(self.salt, value.encode(), hashlib.sha256).hexdigest()
+        return f"anon-{digest[:12]}"
+
+    def sanitize_records(self, records: List, replacements: Dict[str, str]) -> List:
+        sanitized = []
+        for record in records:
+            if isinstance(record, dict):
+                record = dict(record)
+                for field in PII_FIELDS:
+                    if record.get(field):
+                        replacements[record[field]] = self.pseudonym(record[field])
+                        record[field] = replacements[record[field]]
+            sanitized.append(record)
+        return sanitized
+
+    def sanitize_request(
+        self, data: Dict[str, str], replacements: Dict[str, str]
+    ) -> Dict[str, str]:
+        """
+        Returns a copy of the form *data* without the API token, with
+        identifying values replaced; the values replaced are added to
+        *replacements*.
+        """
+        sanitized = {k: v for k, v in data.items() if k != "token"}
+        if "filterLogic" in sanitized:
+
+            def replace(match):
+                replacements[match[1]] = self.pseudonym(match[1])
+                return f'"{replacements[match[1]]}"'
+
+            sanitized["filterLogic"] = QUOTED_VALUE.sub(replace, data["filterLogic"])
+        if "data" in sanitized:
+            try:
+                records = json.loads(data["data"])
+            except ValueError:
+                records = None
+            if isinstance(records, list):
+                sanitized["data"] = json.dumps(
+                    self.sanitize_records(records, replacements)
+                )
+        return sanitized
+
+    def sanitize_response(self, body: str, replacements: Dict[str, str]) -> str:
+        try:
+            records = json.loads(body)
+        except ValueError:
+            records = None
+        if isinstance(records, list):
+            body = json.dumps(self.sanitize_records(records, replacements))
+        body = SURVEY_LINK_HASH.sub(
+            lambda match: match[1] + self.pseudonym(match[2]), body
+        )
+        # Error messages may quote the values sent in the request
+        for value, pseudonym in replacements.items():
+            body = body.replace(value, pseudonym)
+        return body
+
+
+class REDCapRecorder:
+    """
+    Appends sanitized REDCap calls to the capture file at *path*. Every
+    worker process may append to the same file; each call is written with
+    a single `write` to a file opened in append mode.
+    """
+
+    def __init__(self, path: str, salt: Optional[bytes] = None):
+        self.path = path
+        self.sanitizer = Sanitizer(salt)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    def record(
+        self,
+        operation: str,
+        data: Optional[Dict[str, str]],
+        status_code: int,
+        body: str,
+        elapsed: float,
+        request_bytes: int,
+        response_bytes: int,
+    ):
+        data = data or {}
+        replacements: Dict[str, str] = {}
+        entry = {
+            "at": round(time.time(), 3),
+            "operation": operation,
+            "key": get_call_key(data),
+            "status": status_code,
+            "elapsed": round(elapsed, 4),
+            "request_bytes": request_bytes,
+            "response_bytes": response_bytes,
+            "request": self.sanitizer.sanitize_request(data, replacements),
+        }
+        entry["response"] = self.sanitizer.sanitize_response(body, replacements)
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        os.write(self._fd, line.encode())
+
+
+def load_captures(path: str) -> List[Dict]:
+    """Reads a capture file, which may have been compressed with gzip."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    A transport for `requests` that answers REDCap calls from captured
+    traffic instead of the network. Each call is answered with the next
+    captured call of the same kind (see `get_call_key`), in the order they
+    were captured, after waiting as long as the captured call took
+    (multiplied by *speed*; pass 0 not to wait at all).
+    """
+
+    def __init__(self, captures: List[Dict], speed: float = 1.0):
+        super().__init__()
+        self.speed = speed
+        by_key: Dict[str, List[Dict]] = {}
+        for capture in captures:
+            by_key.setdefault(capture["key"], []).append(capture)
+        self._captures: Dict[str, Iterator[Dict]] = {
+            key: itertools.cycle(values) for key, values in by_key.items()
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, speed: float = 1.0) -> "ReplayAdapter":
+        return cls(load_captures(path), speed)
+
+    def next_capture(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            captures = self._captures.get(key)
+            return next(captures) if captures else None
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        body = request.body or ""
+        if isinstance(body, bytes):
+            body = body.decode()
+        key = get_call_key(dict(parse_qsl(body)))
+        capture = self.next_capture(key)
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = "utf-8"
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        if not capture:
+            response.status_code = 400
+            response._content = json.dumps(
+                {"error": f"No captured calls to replay for {key}"}
+            ).encode()
+            return response
+        time.sleep(capture["elapsed"] * self.speed)
+        response.status_code = capture["status"]
+        response._content = capture["response"].encode()
+        return response
+
+    def close(self):
+        pass
@@ -1,68 +1,218 @@
-import functools
+import asyncio
 import json
+import os
 import time
 from datetime import datetime
 from logging import Logger
-from typing import Dict, Iterable, Optional
+from typing import Callable, Dict, Iterable, List, Optional
 
 import requests
 from injector import Module, inject, provider, singleton
-from prometheus_client import Summary
+from prometheus_client import Counter, Histogram
 from prometheus_client.registry import CollectorRegistry
 from redcap_client import is_complete
 from requests import Response
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, ServiceUnavailable
 
 from husky_musher.settings import AppSettings
-from husky_musher.utils.cache import Cache
+from husky_musher.utils.cache import AsyncCache, Cache, Lease
+from husky_musher.utils.network import (
+    DNSCache,
+    HttpcoreTrace,
+    TimedHTTPAdapter,
+    add_download_phase,
+    record_network_phases,
+)
+from husky_musher.utils.rate_limit import (
+    Priority,
+    REDCapRateLimiter,
+    REDCapRateLimitWaitHistogram,
+    REDCapThrottledCounter,
+)
+from husky_musher.utils.record_schema import RecordStatus, tag_record, upgrade_record
+from husky_musher.utils.recording import REDCapRecorder, ReplayAdapter
+
+
+# Connections to REDCap are kept alive between calls, which saves a TCP and
+# TLS handshake per call; a gevent worker may make many calls at once.
+REDCAP_POOL_MAXSIZE = 20
+
+# REDCap calls usually take a few hundred milliseconds, but can take
+# several seconds when the project is busy.
+REDCAP_LATENCY_BUCKETS = (
+    0.025,
+    0.05,
+    0.1,
+    0.2,
+    0.3,
+    0.5,
+    0.75,
+    1.0,
+    1.5,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+# Resolving REDCap's host and connecting to it should take milliseconds
+NETWORK_PHASE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025) + REDCAP_LATENCY_BUCKETS
+
+
+# A participant's registration is guarded by a lock, so that concurrent
+# first visits (e.g., from two tabs) create a single record. The lock expires
+# if its holder dies; requests that were waiting on it read the record ID it
+# registered from the record index.
+REGISTRATION_LOCK_SECONDS = 10
+REGISTRATION_POLL_SECONDS = 0.1
+
+# The format of dates and times in REDCap's API
+REDCAP_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class CacheOutcome:
+    hit = "hit"
+    miss = "miss"
+    # The operation never consults the cache
+    bypass = "bypass"
+
+
+class REDCapRequestSecondsHistogram(Histogram):
+    pass
+
+
+class REDCapNetworkPhaseHistogram(Histogram):
+    pass
+
+
+class REDCapRequestBytesCounter(Counter):
+    pass
 
 
-class REDCapRequestSecondsSummary(Summary):
+class REDCapResponseBytesCounter(Counter):
     pass
 
 
-class FetchParticipantMetric(REDCapRequestSecondsSummary):
+class REDCapRecordIndexCounter(Counter):
     pass
 
 
+class IndexOutcome:
+    hit = "hit"
+    miss = "miss"
+    # The indexed record no longer belongs to the participant
+    stale = "stale"
+
+
+def get_status_class(status_code: Optional[int]) -> str:
+    """
+    >>> get_status_class(201)
+    '2xx'
+    >>> get_status_class(None)
+    'error'
+    """
+    if not status_code:
+        return "error"
+    return f"{status_code // 100}xx"
+
+
 class RedcapInjectorModule(Module):
     @provider
     @singleton
-    def provide_metric_summary(
+    def provide_request_seconds_histogram(
         self, registry: CollectorRegistry
-    ) -> REDCapRequestSecondsSummary:
-        return REDCapRequestSecondsSummary(
+    ) -> REDCapRequestSecondsHistogram:
+        return REDCapRequestSecondsHistogram(
             "redcap_request_seconds",
-            documentation="Time spent making requests to REDCap",
-            labelnames=["function"],
+            documentation="Time spent fulfilling REDCap operations, "
+            "including operations served from the cache",
+            labelnames=["operation", "status_class", "cache"],
+            buckets=REDCAP_LATENCY_BUCKETS,
             registry=registry,
         )
 
     @provider
+    @singleton
+    def provide_network_phase_histogram(
+        self, registry: CollectorRegistry
+    ) -> REDCapNetworkPhaseHistogram:
+        return REDCapNetworkPhaseHistogram(
+            "redcap_network_phase_seconds",
+            documentation="Time spent in each network phase of REDCap calls "
+            "(see husky_musher/utils/network.py); new connections only "
+            "for dns, connect and tls",
+            labelnames=["phase"],
+            buckets=NETWORK_PHASE_BUCKETS,
+            registry=registry,
+        )
+
     @provider
     @singleton
-    def provide_prometheus_registry(self) -> CollectorRegistry:
-        return CollectorRegistry()
+    def provide_request_bytes_counter(
+        self, registry: CollectorRegistry
+    ) -> REDCapRequestBytesCounter:
+        return REDCapRequestBytesCounter(
+            "redcap_request_bytes",
+            documentation="Size of request payloads sent to REDCap",
+            labelnames=["operation"],
+            registry=registry,
+        )
 
     @provider
     @singleton
-    def provide_fetch_participant_metric(
-        self, summary: REDCapRequestSecondsSummary
-    ) -> FetchParticipantMetric:
-        return summary.labels("fetch_participant")
+    def provide_response_bytes_counter(
+        self, registry: CollectorRegistry
+    ) -> REDCapResponseBytesCounter:
+        return REDCapResponseBytesCounter(
+            "redcap_response_bytes",
+            documentation="Size of response payloads received from REDCap",
+            labelnames=["operation"],
+            registry=registry,
+        )
 
+    @provider
+    @singleton
+    def provide_record_index_counter(
+        self, registry: CollectorRegistry
+    ) -> REDCapRecordIndexCounter:
+        return REDCapRecordIndexCounter(
+            "redcap_record_index_lookups",
+            documentation="Lookups of participants' record IDs by NetID, "
+            "before exporting their records from REDCap",
+            labelnames=["outcome"],
+            registry=registry,
+        )
 
-def time_redcap_request(label: Optional[str] = None):
-    def decorator(method):
-        @functools.wraps(method)
-        def inner(*args, **kwargs):
-            instance: REDCapClient = args[0]
-            with instance.metric_summary.labels(label or method.__name__).time():
-                return method(*args, **kwargs)
+    @provider
+    @singleton
+    def provide_rate_limit_wait_histogram(
+        self, registry: CollectorRegistry
+    ) -> REDCapRateLimitWaitHistogram:
+        return REDCapRateLimitWaitHistogram(
+            "redcap_rate_limit_wait_seconds",
+            documentation="Time spent waiting for the fleet-wide REDCap rate "
+            "limit before calling REDCap",
+            labelnames=["priority"],
+            buckets=(0, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+            registry=registry,
+        )
 
-        return inner
+    @provider
+    @singleton
+    def provide_throttled_counter(
+        self, registry: CollectorRegistry
+    ) -> REDCapThrottledCounter:
+        return REDCapThrottledCounter(
+            "redcap_rate_limit_throttled",
+            documentation="REDCap calls delayed, or rejected after waiting too "
+            "long, by the fleet-wide REDCap rate limit",
+            labelnames=["priority", "outcome"],
+            registry=registry,
+        )
 
-    return decorator
+    @provider
+    @singleton
+    def provide_prometheus_registry(self) -> CollectorRegistry:
+        return CollectorRegistry()
 
 
 @singleton
@@ -70,20 +220,58 @@ class REDCapClient:
     @inject
     def __init__(
         self,
-        metric_summary: REDCapRequestSecondsSummary,
+        request_seconds: REDCapRequestSecondsHistogram,
+        network_phase_seconds: REDCapNetworkPhaseHistogram,
+        request_bytes: REDCapRequestBytesCounter,
+        response_bytes: REDCapResponseBytesCounter,
+        record_index_lookups: REDCapRecordIndexCounter,
         cache: Cache,
         settings: AppSettings,
-        fetch_participant_metric: FetchParticipantMetric,
         logger: Logger,
+        rate_limiter: REDCapRateLimiter,
     ):
-        self.fetch_participant_metric = metric_summary.labels("fetch_participant")
         self.cache = cache
         self.settings = settings
-        self.fetch_participant_metric = fetch_participant_metric
-        self.metric_summary = metric_summary
+        self.rate_limiter = rate_limiter
+        self.request_seconds = request_seconds
+        self.network_phase_seconds = network_phase_seconds
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.record_index_lookups = record_index_lookups
         self.logger = logger.getChild("redcap")
         self.api_token = self.settings.redcap_api_token
         self.api_url = self.settings.redcap_api_url
+        self.recorder = None
+        if settings.redcap_capture_path:
+            self.recorder = REDCapRecorder(settings.redcap_capture_path)
+        self.replay_adapter = None
+        if settings.redcap_replay_path:
+            self.replay_adapter = ReplayAdapter.from_file(
+                settings.redcap_replay_path, speed=settings.redcap_replay_speed
+            )
+        # Called with the ID of a cached record that is too old to upgrade,
+        # to refresh it in the background (see husky_musher/app.py); if
+        # unset, such records are exported again right away.
+        self.refresh_record_later: Optional[Callable[[str], None]] = None
+        self.dns_cache = DNSCache(settings.redcap_dns_cache_seconds)
+        self.session = self._create_session()
+        # When the app is preloaded, the client is created in the gunicorn
+        # arbiter; each worker must get its own connection pool.
+        os.register_at_fork(after_in_child=self._reset_session)
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = self.replay_adapter or TimedHTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=REDCAP_POOL_MAXSIZE,
+            dns_cache=self.dns_cache,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _reset_session(self):
+        self.session = self._create_session()
 
     def request(
         self,
@@ -91,6 +279,9 @@ class REDCapClient:
         url: Optional[str] = None,
         log_data: Optional[Iterable[str]] = None,
         *args,
+        operation: str = "request",
+        cache_outcome: str = CacheOutcome.bypass,
+        priority: str = Priority.interactive,
         **kwargs,
     ) -> Response:
         """
@@ -107,31 +298,198 @@ class REDCapClient:
                data={'foo': 1234, 'secret': 'abcde'},
                log_data={'foo'}
             )  # log json payload will include 'foo: 1234'
+
+        :param operation:
+            The label under which the call's latency and payload sizes
+            are recorded.
+
+        :param cache_outcome:
+            Whether the call was made because of a cache miss, or
+            without consulting the cache at all.
+
+        :param priority:
+            Whether a participant is waiting on the call, which goes first
+            when the REDCap rate limit is reached (see
+            husky_musher/utils/rate_limit.py).
         """
         method = method.upper()
         url = url or self.api_url
+        self.rate_limiter.acquire(priority)
         start_time = time.time()
-        response = requests.request(method, url, *args, **kwargs)
-        end_time = time.time()
-        duration = round(end_time - start_time, 3)
-        message = f"[{method}] {response.status_code} {url} ({duration}s)"
-        if log_data and "data" in kwargs:
-            logged_data = {k: v for k, v in kwargs["data"].items() if k in log_data}
+        with record_network_phases() as phases:
+            try:
+                response = self.session.request(method, url, *args, **kwargs)
+            except Exception:
+                self.observe_request(
+                    operation, cache_outcome, time.time() - start_time, phases=phases
+                )
+                raise
+        duration = time.time() - start_time
+        add_download_phase(phases, duration)
+        request_bytes = len(response.request.body or "")
+        self.observe_request(
+            operation,
+            cache_outcome,
+            duration,
+            status_code=response.status_code,
+            request_bytes=request_bytes,
+            response_bytes=len(response.content),
+            phases=phases,
+        )
+        if self.recorder:
+            self.recorder.record(
+                operation,
+                kwargs.get("data"),
+                response.status_code,
+                response.text,
+                duration,
+                request_bytes,
+                len(response.content),
+            )
+        self.log_request(
+            method,
+            url,
+            response.status_code,
+            duration,
+            data=kwargs.get("data"),
+            log_data=log_data,
+            phases=phases,
+        )
+        response.raise_for_status()
+        return response
+
+    def observe_request(
+        self,
+        operation: str,
+        cache_outcome: str,
+        duration: float,
+        status_code: Optional[int] = None,
+        request_bytes: int = 0,
+        response_bytes: int = 0,
+        phases: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Records the latency, network phases (see
+        husky_musher/utils/network.py) and payload sizes of a REDCap call.
+        """
+        self.request_seconds.labels(
+            operation, get_status_class(status_code), cache_outcome
+        ).observe(duration)
+        for phase, seconds in (phases or {}).items():
+            self.network_phase_seconds.labels(phase).observe(seconds)
+        self.request_bytes.labels(operation).inc(request_bytes)
+        self.response_bytes.labels(operation).inc(response_bytes)
+
+    def log_request(
+        self,
+        method: str,
+        url: str,
+        status_code: int,
+        duration: float,
+        data: Optional[Dict] = None,
+        log_data: Optional[Iterable[str]] = None,
+        phases: Optional[Dict[str, float]] = None,
+    ):
+        message = f"[{method}] {status_code} {url} ({round(duration, 3)}s)"
+        if log_data and data:
+            logged_data = {k: v for k, v in data.items() if k in log_data}
         else:
             logged_data = {}
-        try:
-            response.raise_for_status()
-            self.logger.info(
-                message, extra={"data": logged_data, "extra_keys": {"data"}}
-            )
-            return response
-        except Exception:
-            self.logger.info(
-                message, extra={"data": logged_data, "extra_keys": {"data"}}
+        logged_phases = {k: round(v, 4) for k, v in (phases or {}).items()}
+        self.logger.info(
+            message,
+            extra={
+                "data": logged_data,
+                "phases": logged_phases,
+                "extra_keys": {"data", "phases"},
+            },
+        )
+
+    def build_fetch_participant_data(self, uw_netid: str) -> Dict[str, str]:
+        fields = [
+            "uw_netid",
+            "record_id",
+            "enrollment_questions_complete",
+        ]
+
+        return {
+            "token": self.api_token,
+            "content": "record",
+            "format": "json",
+            "type": "flat",
+            "csvDelimiter": "",
+            "filterLogic": f'[uw_netid] = "{uw_netid}"',
+            "fields": ",".join(map(str, fields)),
+            "rawOrLabel": "raw",
+            "rawOrLabelHeaders": "raw",
+            "exportCheckboxLabel": "false",
+            "exportSurveyFields": "false",
+            "exportDataAccessGroups": "false",
+            "returnFormat": "json",
+        }
+
+    def fetch_participants_modified(
+        self, begin: datetime, end: datetime
+    ) -> List[Dict[str, str]]:
+        """
+        Exports the records created or modified between *begin* and *end*,
+        in the REDCap server's local time.
+        """
+        response = self.request(
+            "post",
+            data=self.build_fetch_participants_modified_data(begin, end),
+            log_data={"content", "dateRangeBegin", "dateRangeEnd"},
+            operation="fetch_participants_modified",
+            priority=Priority.background,
+        )
+        return response.json()
+
+    def fetch_participants_by_record_id(
+        self, record_ids: List[str]
+    ) -> List[Dict[str, str]]:
+        """Exports the records with the given *record_ids*, in a single call."""
+        response = self.request(
+            "post",
+            data=self.build_fetch_participants_by_record_id_data(record_ids),
+            log_data={"content"},
+            operation="fetch_participants_by_record_id",
+            priority=Priority.background,
+        )
+        return response.json()
+
+    def build_fetch_participants_by_record_id_data(
+        self, record_ids: List[str]
+    ) -> Dict[str, str]:
+        data = self.build_fetch_participant_data("")
+        del data["filterLogic"]
+        for i, record_id in enumerate(record_ids):
+            data[f"records[{i}]"] = record_id
+        return data
+
+    def build_fetch_participants_modified_data(
+        self, begin: datetime, end: datetime
+    ) -> Dict[str, str]:
+        data = self.build_fetch_participant_data("")
+        del data["filterLogic"]
+        data["dateRangeBegin"] = begin.strftime(REDCAP_DATETIME_FORMAT)
+        data["dateRangeEnd"] = end.strftime(REDCAP_DATETIME_FORMAT)
+        return data
+
+    @staticmethod
+    def select_participant_record(
+        records: List[Dict[str, str]], uw_netid: str
+    ) -> Optional[Dict[str, str]]:
+        if not records:
+            return None
+
+        if len(records) > 1:
+            raise BadRequest(
+                f'Multiple records exist with NetID "{uw_netid}": '
+                f'{[r["record_id"] for r in records]}'
             )
-            raise
 
-    @time_redcap_request("fetch_participant (cached)")
+        return records[0]
+
     def fetch_participant(self, user_info: Dict) -> Optional[Dict[str, str]]:
         """
         Exports a REDCap record matching the given *user_info*. Returns None if no
@@ -141,67 +499,152 @@ class REDCapClient:
         given *user_info*.
         """
         uw_netid = user_info["uw_netid"]
+        start_time = time.time()
         record = self.cache.get(uw_netid, load_json=True)
 
         if not uw_netid:
             raise BadRequest(f"No uw_netid in user_info: {user_info}")
 
-        if not record:
-            with self.fetch_participant_metric.time():
-                fields = [
-                    "uw_netid",
-                    "record_id",
-                    "enrollment_questions_complete",
-                ]
-
-                data = {
-                    "token": self.api_token,
-                    "content": "record",
-                    "format": "json",
-                    "type": "flat",
-                    "csvDelimiter": "",
-                    "filterLogic": f'[uw_netid] = "{uw_netid}"',
-                    "fields": ",".join(map(str, fields)),
-                    "rawOrLabel": "raw",
-                    "rawOrLabelHeaders": "raw",
-                    "exportCheckboxLabel": "false",
-                    "exportSurveyFields": "false",
-                    "exportDataAccessGroups": "false",
-                    "returnFormat": "json",
-                }
-
-                response = self.request(
-                    "post", data=data, log_data={"content", "fields"}
-                )
-                records = response.json()
+        if record:
+            record = self.upgrade_cached_record(uw_netid, record)
 
-                if not records:
-                    return None
+        if record:
+            self.observe_request(
+                "fetch_participant", CacheOutcome.hit, time.time() - start_time
+            )
+        else:
+            record = self.fetch_indexed_participant(uw_netid)
 
-                if len(records) > 1:
-                    raise BadRequest(
-                        f'Multiple records exist with NetID "{uw_netid}": '
-                        f'{[r["record_id"] for r in records]}'
-                    )
+        if not record:
+            # Searching by NetID makes REDCap evaluate the filter against
+            # every record in the project, so it is only a fallback
+            response = self.request(
+                "post",
+                data=self.build_fetch_participant_data(uw_netid),
+                log_data={"content", "fields"},
+                operation="fetch_participant",
+                cache_outcome=CacheOutcome.miss,
+            )
+            record = self.select_participant_record(response.json(), uw_netid)
 
-                record = records[0]
+            if not record:
+                return None
 
+            self.index_record_id(uw_netid, record["record_id"])
             if self.redcap_registration_complete(record):
-                self.cache.set(uw_netid, record)
+                self.cache.set(uw_netid, tag_record(record))
+
+        return record
 
+    def fetch_indexed_participant(self, uw_netid: str) -> Optional[Dict[str, str]]:
+        """
+        Exports the participant's record by its ID, if the record index
+        (see `index_record_id`) has it; returns None otherwise, or if the
+        indexed record no longer belongs to the participant.
+        """
+        record_id = self.get_indexed_record_id(uw_netid)
+        if not record_id:
+            self.record_index_lookups.labels(IndexOutcome.miss).inc()
+            return None
+        response = self.request(
+            "post",
+            data=self.build_fetch_participants_by_record_id_data([record_id]),
+            log_data={"content"},
+            operation="fetch_participant_by_record_id",
+            cache_outcome=CacheOutcome.miss,
+        )
+        record = self.select_indexed_record(response.json(), uw_netid)
+        if not record:
+            self.record_index_lookups.labels(IndexOutcome.stale).inc()
+            self.cache.delete(f"{uw_netid}.recordId")
+            return None
+        self.record_index_lookups.labels(IndexOutcome.hit).inc()
+        if self.redcap_registration_complete(record):
+            self.cache.set(uw_netid, tag_record(record))
+        return record
+
+    def select_indexed_record(
+        self, records: List[Dict[str, str]], uw_netid: str
+    ) -> Optional[Dict[str, str]]:
+        # In longitudinal projects, a record is exported with one row per
+        # event, only one of which has the NetID
+        return self.select_participant_record(
+            [r for r in records if r.get("uw_netid") == uw_netid], uw_netid
+        )
+
+    def index_record_id(self, uw_netid: str, record_id: str):
+        """
+        Adds the participant's record ID to the record index, which is kept
+        for every participant seen (unlike cached records, which are only
+        kept for participants who have completed registration), so that
+        their records can be exported by ID.
+        """
+        self.cache.set(f"{uw_netid}.recordId", record_id)
+
+    def get_indexed_record_id(self, uw_netid: str) -> Optional[str]:
+        record_id = self.cache.get(f"{uw_netid}.recordId")
+        if isinstance(record_id, bytes):
+            return record_id.decode()
+        return record_id
+
+    def upgrade_cached_record(self, uw_netid: str, record: Dict) -> Optional[Dict]:
+        """
+        Returns the cached *record*, upgraded to the current schema version
+        (see husky_musher/utils/record_schema.py), or None if it must be
+        exported from REDCap again before it can be used.
+        """
+        record, status = upgrade_record(record)
+        if status == RecordStatus.migrated:
+            self.cache.set(uw_netid, record)
+        elif status == RecordStatus.stale:
+            if not self.refresh_record_later:
+                return None
+            self.refresh_record_later(record["record_id"])
         return record
 
-    @time_redcap_request()
     def register_participant(self, user_info: dict) -> str:
         """
         Returns the REDCap record ID of the participant newly registered with the
-        given *user_info*
+        given *user_info*. If the participant is already being registered by
+        another request, waits for it to finish and returns its record ID.
         """
+        netid = user_info["uw_netid"]
+        lease = self.get_registration_lease(netid)
+        deadline = time.monotonic() + 2 * REGISTRATION_LOCK_SECONDS
+        while not lease.acquire():
+            record_id = self.get_indexed_record_id(netid)
+            if record_id:
+                return record_id
+            if time.monotonic() > deadline:
+                raise ServiceUnavailable(f"Timed out registering {netid}")
+            time.sleep(REGISTRATION_POLL_SECONDS)
+        try:
+            # Another request may have finished registering the participant
+            # between our cache miss and acquiring the lock
+            record_id = self.get_indexed_record_id(netid)
+            if record_id:
+                return record_id
+            response = self.request(
+                "post",
+                data=self.build_register_participant_data(user_info),
+                log_data={"content"},
+                operation="register_participant",
+            )
+            record_id = response.json()[0]
+            self.index_record_id(netid, record_id)
+            return record_id
+        finally:
+            lease.release()
+
+    def get_registration_lease(self, netid: str) -> Lease:
+        return Lease(self.cache, f"register.{netid}", REGISTRATION_LOCK_SECONDS)
+
+    def build_register_participant_data(self, user_info: dict) -> Dict[str, str]:
         # REDCap enforces that we must provide a non-empty record ID. Because we're
         # using `forceAutoNumber` in the POST request, we do not need to provide a
         # real record ID.
         records = [{**user_info, "record_id": "record ID cannot be blank"}]
-        data = {
+        return {
             "token": self.api_token,
             "content": "record",
             "format": "json",
@@ -212,10 +655,7 @@ class REDCapClient:
             "returnContent": "ids",
             "returnFormat": "json",
         }
-        response = self.request("post", data=data, log_data={"content"})
-        return response.json()[0]
 
-    @time_redcap_request()
     def generate_enrollment_survey_link(
         self, record_id: str, event: str, instrument: str, instance: int = None
     ) -> str:
@@ -225,6 +665,19 @@ class REDCapClient:
 
         Will include the repeat *instance* if provided.
         """
+        response = self.request(
+            "post",
+            data=self.build_enrollment_survey_link_data(
+                record_id, event, instrument, instance
+            ),
+            log_data={"content", "instrument", "event", "record"},
+            operation="generate_enrollment_survey_link",
+        )
+        return response.text
+
+    def build_enrollment_survey_link_data(
+        self, record_id: str, event: str, instrument: str, instance: int = None
+    ) -> Dict[str, str]:
         data = {
             "token": self.api_token,
             "content": "surveyLink",
@@ -237,13 +690,8 @@ class REDCapClient:
 
         if instance:
             data["repeat_instance"] = str(instance)
+        return data
 
-        response = self.request(
-            "post", data=data, log_data={"content", "instrument", "event", "record"}
-        )
-        return response.text
-    
-    @time_redcap_request()
     def generate_surveyqueue_link(
         self, record_id: str
     ) -> str:
@@ -251,7 +699,16 @@ class REDCapClient:
         Returns a generated survey queue link for the given  *record_id*.
        
         """
-        data = {
+        response = self.request(
+            "post",
+            data=self.build_surveyqueue_link_data(record_id),
+            log_data={"content", "record"},
+            operation="generate_surveyqueue_link",
+        )
+        return response.text
+
+    def build_surveyqueue_link_data(self, record_id: str) -> Dict[str, str]:
+        return {
             "token": self.api_token,
             "content": "surveyQueueLink",
             "format": "json",
@@ -259,11 +716,6 @@ class REDCapClient:
             "returnFormat": "json",
         }
 
-        response = self.request(
-            "post", data=data, log_data={"content", "record"}
-        )
-        return response.text
-
     def get_the_current_week(self) -> int:
         """
         Returns the current program week to redirect the user to the correct first weekly event
@@ -308,3 +760,222 @@ class REDCapClient:
         if netid and is_complete_:
             self.cache.set(registration_cache_key, value=True, save_json=True)
         return is_complete_
+
+
+@singleton
+class AsyncREDCapClient:
+    """
+    The asyncio counterpart of `REDCapClient`, used by the ASGI entry point
+    (see husky_musher/asgi.py). Payloads, metrics and logging are shared
+    with the synchronous client; only the I/O differs. Requires httpx.
+    """
+
+    @inject
+    def __init__(self, client: REDCapClient, cache: AsyncCache):
+        import httpx
+
+        self.client = client
+        self.cache = cache
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=REDCAP_POOL_MAXSIZE),
+            timeout=httpx.Timeout(30),
+        )
+
+    async def request(
+        self,
+        data: Dict[str, str],
+        log_data: Optional[Iterable[str]] = None,
+        operation: str = "request",
+        cache_outcome: str = CacheOutcome.bypass,
+        priority: str = Priority.interactive,
+    ):
+        url = self.client.api_url
+        await self.client.rate_limiter.acquire_async(priority)
+        start_time = time.time()
+        with record_network_phases() as phases:
+            try:
+                response = await self.http.post(
+                    url, data=data, extensions={"trace": HttpcoreTrace()}
+                )
+            except Exception:
+                self.client.observe_request(
+                    operation, cache_outcome, time.time() - start_time, phases=phases
+                )
+                raise
+        duration = time.time() - start_time
+        add_download_phase(phases, duration)
+        self.client.observe_request(
+            operation,
+            cache_outcome,
+            duration,
+            status_code=response.status_code,
+            request_bytes=len(response.request.content),
+            response_bytes=len(response.content),
+            phases=phases,
+        )
+        if self.client.recorder:
+            self.client.recorder.record(
+                operation,
+                data,
+                response.status_code,
+                response.text,
+                duration,
+                len(response.request.content),
+                len(response.content),
+            )
+        self.client.log_request(
+            "POST",
+            url,
+            response.status_code,
+            duration,
+            data=data,
+            log_data=log_data,
+            phases=phases,
+        )
+        response.raise_for_status()
+        return response
+
+    async def fetch_participant(self, user_info: Dict) -> Optional[Dict[str, str]]:
+        """See `REDCapClient.fetch_participant`."""
+        uw_netid = user_info["uw_netid"]
+        if not uw_netid:
+            raise BadRequest(f"No uw_netid in user_info: {user_info}")
+
+        start_time = time.time()
+        record = await self.cache.get(uw_netid, load_json=True)
+        if record:
+            record = await self.upgrade_cached_record(uw_netid, record)
+        if record:
+            self.client.observe_request(
+                "fetch_participant", CacheOutcome.hit, time.time() - start_time
+            )
+            return record
+
+        record = await self.fetch_indexed_participant(uw_netid)
+        if record:
+            return record
+
+        response = await self.request(
+            self.client.build_fetch_participant_data(uw_netid),
+            log_data={"content", "fields"},
+            operation="fetch_participant",
+            cache_outcome=CacheOutcome.miss,
+        )
+        record = self.client.select_participant_record(response.json(), uw_netid)
+        if record:
+            await self.index_record_id(uw_netid, record["record_id"])
+        if record and await self.redcap_registration_complete(record):
+            await self.cache.set(uw_netid, tag_record(record))
+        return record
+
+    async def fetch_indexed_participant(
+        self, uw_netid: str
+    ) -> Optional[Dict[str, str]]:
+        """See `REDCapClient.fetch_indexed_participant`."""
+        record_id = await self.get_indexed_record_id(uw_netid)
+        if not record_id:
+            self.client.record_index_lookups.labels(IndexOutcome.miss).inc()
+            return None
+        response = await self.request(
+            self.client.build_fetch_participants_by_record_id_data([record_id]),
+            log_data={"content"},
+            operation="fetch_participant_by_record_id",
+            cache_outcome=CacheOutcome.miss,
+        )
+        record = self.client.select_indexed_record(response.json(), uw_netid)
+        if not record:
+            self.client.record_index_lookups.labels(IndexOutcome.stale).inc()
+            await self.cache.delete(f"{uw_netid}.recordId")
+            return None
+        self.client.record_index_lookups.labels(IndexOutcome.hit).inc()
+        if await self.redcap_registration_complete(record):
+            await self.cache.set(uw_netid, tag_record(record))
+        return record
+
+    async def index_record_id(self, uw_netid: str, record_id: str):
+        await self.cache.set(f"{uw_netid}.recordId", record_id)
+
+    async def get_indexed_record_id(self, uw_netid: str) -> Optional[str]:
+        record_id = await self.cache.get(f"{uw_netid}.recordId")
+        if isinstance(record_id, bytes):
+            return record_id.decode()
+        return record_id
+
+    async def upgrade_cached_record(
+        self, uw_netid: str, record: Dict
+    ) -> Optional[Dict]:
+        """See `REDCapClient.upgrade_cached_record`."""
+        record, status = upgrade_record(record)
+        if status == RecordStatus.migrated:
+            await self.cache.set(uw_netid, record)
+        elif status == RecordStatus.stale:
+            if not self.client.refresh_record_later:
+                return None
+            self.client.refresh_record_later(record["record_id"])
+        return record
+
+    async def register_participant(self, user_info: dict) -> str:
+        """See `REDCapClient.register_participant`."""
+        netid = user_info["uw_netid"]
+        lease = self.client.get_registration_lease(netid)
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + 2 * REGISTRATION_LOCK_SECONDS
+        # The lease uses the synchronous redis client
+        while not await loop.run_in_executor(None, lease.acquire):
+            record_id = await self.get_indexed_record_id(netid)
+            if record_id:
+                return record_id
+            if time.monotonic() > deadline:
+                raise ServiceUnavailable(f"Timed out registering {netid}")
+            await asyncio.sleep(REGISTRATION_POLL_SECONDS)
+        try:
+            record_id = await self.get_indexed_record_id(netid)
+            if record_id:
+                return record_id
+            response = await self.request(
+                self.client.build_register_participant_data(user_info),
+                log_data={"content"},
+                operation="register_participant",
+            )
+            record_id = response.json()[0]
+            await self.index_record_id(netid, record_id)
+            return record_id
+        finally:
+            await loop.run_in_executor(None, lease.release)
+
+    async def generate_enrollment_survey_link(
+        self, record_id: str, event: str, instrument: str, instance: int = None
+    ) -> str:
+        response = await self.request(
+            self.client.build_enrollment_survey_link_data(
+                record_id, event, instrument, instance
+            ),
+            log_data={"content", "instrument", "event", "record"},
+            operation="generate_enrollment_survey_link",
+        )
+        return response.text
+
+    async def generate_surveyqueue_link(self, record_id: str) -> str:
+        response = await self.request(
+            self.client.build_surveyqueue_link_data(record_id),
+            log_data={"content", "record"},
+            operation="generate_surveyqueue_link",
+        )
+        return response.text
+
+    async def redcap_registration_complete(
+        self, redcap_record: dict, netid: Optional[str] = None
+    ) -> bool:
+        """See `REDCapClient.redcap_registration_complete`."""
+        registration_cache_key = f"{netid}.registrationComplete"
+        if netid and await self.cache.get(registration_cache_key, load_json=True):
+            return True
+        is_complete_ = redcap_record and is_complete(
+            "enrollment_questions", redcap_record
+        )
+        if netid and is_complete_:
+            await self.cache.set(registration_cache_key, value=True, save_json=True)
+        return is_complete_
+
+    async def close(self):
+        await self.http.aclose()
@@ -0,0 +1,336 @@
+"""
+A cache backend for single-node deployments without redis, shared by all
+the worker processes on the host: unlike `MockRedis`, an entry cached by
+one worker is a hit for every other, and is stored once.
+
+Entries live in a fixed-size hash table in a memory-mapped file (ideally
+under /dev/shm), so the table never grows: each key may be stored in one
+of PROBE_LIMIT consecutive slots, and when all of those are taken, the
+least recently written entry among them is evicted. Each slot holds at
+most `slot_bytes` of key and value; larger values are not cached.
+
+Reads take no lock: each slot has a version number that writers make odd
+while they write it (a seqlock), and readers retry if it changed while
+they read. Writes are serialized by an exclusive `flock` on the file,
+which is also held between `watch()` and `execute()` of a pipeline, so
+that `Cache.update_if_equal` (and thus `Lease`) stays atomic across
+processes.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from husky_musher.utils.cache import MockPipeline, MockRedis
+
+MAGIC = b"HMCACHE1"
+# The magic, number of slots and slot size, padded to 64 bytes
+HEADER = struct.Struct("<8sII")
+HEADER_BYTES = 64
+# Version, state, key hash, expiry and write times (epoch seconds; 0 for
+# none), key length, value length
+SLOT_HEADER = struct.Struct("<IB3xQddHI")
+
+EMPTY, USED, DELETED = 0, 1, 2
+PROBE_LIMIT = 16
+READ_RETRIES = 8
+
+
+def hash_key(key: bytes) -> int:
+    # Not hash(), which differs between processes
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def to_bytes(value) -> bytes:
+    """Encodes values as redis does."""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    return str(value).encode()
+
+
+class SharedMemoryRedis(MockRedis):
+    """
+    Implements the subset of the redis interface used by `Cache` and
+    `Lease` (as `MockRedis` does) on a hash table shared between processes;
+    see the module docstring.
+    """
+
+    def __init__(self, path: str, slots: int = 65536, slot_bytes: int = 1024):
+        super().__init__()
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._open(slots, slot_bytes)
+        # Locks held through a file descriptor are shared by the processes
+        # that inherit it, so each worker must open its own.
+        os.register_at_fork(after_in_child=self._reopen_lock_file)
+
+    def _open(self, slots: int, slot_bytes: int):
+        self._lock_fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._write_lock():
+            size = os.fstat(self._lock_fd).st_size
+            header = os.pread(self._lock_fd, HEADER.size, 0)
+            if size >= HEADER_BYTES and header[: len(MAGIC)] == MAGIC:
+                # Reuse the table (and its entries) of a previous process
+                _, slots, slot_bytes = HEADER.unpack(header)
+            else:
+                os.ftruncate(self._lock_fd, 0)
+                os.ftruncate(self._lock_fd, HEADER_BYTES + slots * slot_bytes)
+                os.pwrite(self._lock_fd, HEADER.pack(MAGIC, slots, slot_bytes), 0)
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self._map = mmap.mmap(self._lock_fd, HEADER_BYTES + slots * slot_bytes)
+
+    def _reopen_lock_file(self):
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        os.close(self._lock_fd)
+        self._lock_fd = os.open(self.path, os.O_RDWR)
+
+    def _write_lock(self):
+        return _WriteLock(self)
+
+    def lock(self):
+        """
+        Holds the write lock (across processes) for a block of reads and
+        writes, e.g., to update an entry based on its value:
+
+            with redis.lock():
+                redis.set(key, int(redis.get(key)) + 1)
+        """
+        return self._write_lock()
+
+    def _acquire(self):
+        self._thread_lock.acquire()
+        if self._lock_depth == 0:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._lock_depth += 1
+
+    def _release(self):
+        self._lock_depth -= 1
+        if self._lock_depth == 0:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_BYTES + slot * self.slot_bytes
+
+    def _probe(self, key_hash: int) -> Iterator[int]:
+        start = key_hash % self.slots
+        for i in range(min(PROBE_LIMIT, self.slots)):
+            yield (start + i) % self.slots
+
+    def _read_slot(self, slot: int) -> Tuple:
+        """
+        Returns the slot's header fields (without the version), its key and
+        its value, consistently with each other.
+        """
+        offset = self._offset(slot)
+        for _ in range(READ_RETRIES):
+            version = struct.unpack_from("<I", self._map, offset)[0]
+            if version % 2:
+                # Being written
+                time.sleep(0)
+                continue
+            fields = SLOT_HEADER.unpack_from(self._map, offset)
+            key_len, value_len = fields[5], fields[6]
+            start = offset + SLOT_HEADER.size
+            key = self._map[start : start + key_len]
+            value = self._map[start + key_len : start + key_len + value_len]
+            if struct.unpack_from("<I", self._map, offset)[0] == version:
+                return fields[1:] + (key, value)
+        with self._write_lock():
+            return self._read_slot_locked(slot)
+
+    def _read_slot_locked(self, slot: int) -> Tuple:
+        offset = self._offset(slot)
+        fields = SLOT_HEADER.unpack_from(self._map, offset)
+        key_len, value_len = fields[5], fields[6]
+        start = offset + SLOT_HEADER.size
+        key = self._map[start : start + key_len]
+        value = self._map[start + key_len : start + key_len + value_len]
+        return fields[1:] + (key, value)
+
+    def _write_slot(
+        self,
+        slot: int,
+        state: int,
+        key_hash: int = 0,
+        expires_at: float = 0,
+        key: bytes = b"",
+        value: bytes = b"",
+    ):
+        """Must be called with the write lock held."""
+        offset = self._offset(slot)
+        version = struct.unpack_from("<I", self._map, offset)[0]
+        struct.pack_into("<I", self._map, offset, (version + 1) % 2 ** 32)
+        start = offset + SLOT_HEADER.size
+        self._map[start : start + len(key) + len(value)] = key + value
+        SLOT_HEADER.pack_into(
+            self._map,
+            offset,
+            (version + 1) % 2 ** 32,
+            state,
+            key_hash,
+            expires_at,
+            time.time(),
+            len(key),
+            len(value),
+        )
+        struct.pack_into("<I", self._map, offset, (version + 2) % 2 ** 32)
+
+    @staticmethod
+    def _is_live(state: int, expires_at: float, now: float) -> bool:
+        return state == USED and not (expires_at and expires_at <= now)
+
+    def _find(self, key: bytes) -> Tuple[Optional[int], Optional[Tuple]]:
+        """Returns the slot holding *key* (and its contents), if any."""
+        key_hash = hash_key(key)
+        now = time.time()
+        for slot in self._probe(key_hash):
+            contents = self._read_slot(slot)
+            state, slot_hash, expires_at = contents[:3]
+            if state == EMPTY:
+                break
+            if slot_hash == key_hash and contents[-2] == key:
+                if self._is_live(state, expires_at, now):
+                    return slot, contents
+                break
+        return None, None
+
+    def get(self, key):
+        _, contents = self._find(to_bytes(key))
+        return contents[-1] if contents else None
+
+    def set(self, key, value, ex=None, px=None, nx=False, *args, **kwargs):
+        key, value = to_bytes(key), to_bytes(value)
+        expires_at = 0
+        if ex or px:
+            expires_at = time.time() + (px / 1000 if px else ex)
+        key_hash = hash_key(key)
+        with self._write_lock():
+            now = time.time()
+            existing, free, oldest = None, None, None
+            for slot in self._probe(key_hash):
+                state, slot_hash, slot_expires_at, written_at, _, _, slot_key, _ = (
+                    self._read_slot_locked(slot)
+                )
+                live = self._is_live(state, slot_expires_at, now)
+                if state == EMPTY:
+                    free = slot if free is None else free
+                    break
+                if slot_hash == key_hash and slot_key == key:
+                    if nx and live:
+                        return None
+                    existing = slot
+                    break
+                if not live:
+                    free = slot if free is None else free
+                elif oldest is None or written_at < oldest[1]:
+                    oldest = (slot, written_at)
+            if existing is not None:
+                slot = existing
+            else:
+                slot = free if free is not None else oldest[0]
+            if len(key) + len(value) > self.slot_bytes - SLOT_HEADER.size:
+                # Too large to cache; don't leave a previous value behind
+                if existing is not None:
+                    self._write_slot(existing, DELETED)
+                return False
+            self._write_slot(slot, USED, key_hash, expires_at, key, value)
+            return True
+
+    def pexpire(self, key, milliseconds):
+        with self._write_lock():
+            slot, contents = self._find(to_bytes(key))
+            if slot is None:
+                return False
+            _, key_hash, _, _, _, _, slot_key, value = contents
+            self._write_slot(
+                slot, USED, key_hash, time.time() + milliseconds / 1000, slot_key, value
+            )
+            return True
+
+    def pttl(self, key):
+        _, contents = self._find(to_bytes(key))
+        if not contents:
+            return -2
+        expires_at = contents[2]
+        if not expires_at:
+            return -1
+        return int((expires_at - time.time()) * 1000)
+
+    def delete(self, *keys):
+        deleted = 0
+        with self._write_lock():
+            for key in keys:
+                slot, _ = self._find(to_bytes(key))
+                if slot is not None:
+                    self._write_slot(slot, DELETED)
+                    deleted += 1
+        return deleted
+
+    def scan(self, cursor=0, match=None, count=None):
+        # As with MockRedis, *match* is not supported
+        end = min(int(cursor) + (count or 10), self.slots)
+        now = time.time()
+        keys: List[bytes] = []
+        for slot in range(int(cursor), end):
+            state, _, expires_at, _, _, _, key, _ = self._read_slot(slot)
+            if self._is_live(state, expires_at, now):
+                keys.append(key)
+        return (end if end < self.slots else 0), keys
+
+    def dbsize(self):
+        now = time.time()
+        count = 0
+        for slot in range(self.slots):
+            state, _, expires_at = self._read_slot(slot)[:3]
+            count += self._is_live(state, expires_at, now)
+        return count
+
+    def memory_usage(self, key, samples=None):
+        return self.slot_bytes if self.get(key) is not None else None
+
+    def pipeline(self, transaction=True):
+        return SharedMemoryPipeline(self)
+
+
+class _WriteLock:
+    def __init__(self, redis: SharedMemoryRedis):
+        self.redis = redis
+
+    def __enter__(self):
+        self.redis._acquire()
+
+    def __exit__(self, *args):
+        self.redis._release()
+
+
+class SharedMemoryPipeline(MockPipeline):
+    """
+    Holds the write lock from `watch()` until the pipeline is executed or
+    reset, since other processes may change the watched keys otherwise.
+    """
+
+    def __init__(self, redis: SharedMemoryRedis):
+        super().__init__(redis)
+        self._locked = False
+
+    def watch(self, *keys):
+        if not self._locked:
+            self._redis._acquire()
+            self._locked = True
+        super().watch(*keys)
+
+    def reset(self):
+        super().reset()
+        if self._locked:
+            self._locked = False
+            self._redis._release()
@@ -0,0 +1,32 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StartupTimer:
+    """
+    Records how long each phase of application startup takes, so that
+    slow boots can be attributed to a specific phase:
+
+        with startup_timer.phase("connect_redis"):
+            ...
+
+        startup_timer.phases  # {"connect_redis": 0.012}
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = round(seconds, 4)
+
+    @contextmanager
+    def phase(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start_time)
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,222 @@
+"""
+Serves the files in husky_musher/static from memory, ahead of Flask, under
+fingerprinted names (e.g., style.0a1b2c3d.css) that can be cached by
+browsers for as long as they like, and precompressed with gzip (and
+brotli, if the `brotli` package is installed).
+
+The files are fingerprinted and compressed at build time, by running
+
+    python -m husky_musher.utils.static [output_dir]
+
+(see the Dockerfile). When there is no build, e.g., during local
+development, the same is done in memory at startup.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+MANIFEST_NAME = "manifest.json"
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUILD_DIR = os.path.join(PACKAGE_DIR, "static_build")
+
+# Fingerprinted names change whenever their content does
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# For files requested by their original name
+REVALIDATE_CACHE_CONTROL = "public, max-age=300"
+
+# File extensions of the precompressed variants, by content-coding,
+# in order of preference
+ENCODING_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+def fingerprint(filename: str, content: bytes) -> str:
+    """
+    >>> fingerprint('style.css', b'body {}')
+    'style.62368a1a.css'
+    """
+    digest = hashlib.sha256(content).hexdigest()[:8]
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{digest}{ext}"
+
+
+def compress(content: bytes) -> Dict[str, bytes]:
+    """
+    Returns the variants of *content* for each content-coding that makes it
+    smaller; brotli is only used if it is installed.
+    """
+    variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+
+        variants["br"] = brotli.compress(content)
+    except ImportError:
+        pass
+    return {k: v for k, v in variants.items() if len(v) < len(content)}
+
+
+def list_files(source_dir: str) -> Iterable[Tuple[str, str]]:
+    """Yields the name (relative to *source_dir*, with '/'s) and path of each file."""
+    for root, _, files in os.walk(source_dir):
+        for f in sorted(files):
+            path = os.path.join(root, f)
+            yield os.path.relpath(path, source_dir).replace(os.sep, "/"), path
+
+
+def build_static_assets(source_dir: str, output_dir: str) -> Dict[str, str]:
+    """
+    Writes a fingerprinted copy of each file in *source_dir* to *output_dir*,
+    along with its compressed variants and a manifest mapping original to
+    fingerprinted names; returns the manifest.
+    """
+    manifest = {}
+    for name, path in list_files(source_dir):
+        with open(path, "rb") as f:
+            content = f.read()
+        manifest[name] = fingerprint(name, content)
+        destination = os.path.join(output_dir, manifest[name])
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        variants = {"": content, **compress(content)}
+        for encoding, data in variants.items():
+            with open(destination + ENCODING_EXTENSIONS.get(encoding, ""), "wb") as f:
+                f.write(data)
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class StaticAsset:
+    def __init__(self, name: str, variants: Dict[str, bytes], cache_control: str):
+        self.variants = variants
+        self.cache_control = cache_control
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/"):
+            self.content_type += "; charset=utf-8"
+        self.digest = hashlib.sha256(variants[""]).hexdigest()[:16]
+
+    def negotiate(self, accept_encoding: str) -> str:
+        """
+        Returns the best content-coding (or "" for none) that the client
+        accepts, ignoring q-values other than q=0.
+
+        >>> asset = StaticAsset('a.css', {'': b'a', 'gzip': b'b'}, '')
+        >>> asset.negotiate('gzip, deflate, br')
+        'gzip'
+        >>> asset.negotiate('gzip;q=0')
+        ''
+        """
+        accepted = set()
+        for coding in accept_encoding.lower().split(","):
+            coding, _, params = coding.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0"):
+                accepted.add(coding.strip())
+        for encoding in ENCODING_EXTENSIONS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return ""
+
+
+class StaticAssets:
+    """The static files, by the names under which they are served."""
+
+    def __init__(self):
+        # Fingerprinted names, by original name
+        self.manifest: Dict[str, str] = {}
+        self.assets: Dict[str, StaticAsset] = {}
+
+    def add(self, name: str, fingerprinted: str, variants: Dict[str, bytes]):
+        self.manifest[name] = fingerprinted
+        self.assets[fingerprinted] = StaticAsset(
+            name, variants, IMMUTABLE_CACHE_CONTROL
+        )
+        self.assets[name] = StaticAsset(name, variants, REVALIDATE_CACHE_CONTROL)
+
+    @classmethod
+    def from_build(cls, build_dir: str) -> "StaticAssets":
+        with open(os.path.join(build_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        static_assets = cls()
+        for name, fingerprinted in manifest.items():
+            path = os.path.join(build_dir, fingerprinted)
+            variants = {}
+            for encoding, ext in {"": "", **ENCODING_EXTENSIONS}.items():
+                if os.path.exists(path + ext):
+                    with open(path + ext, "rb") as f:
+                        variants[encoding] = f.read()
+            static_assets.add(name, fingerprinted, variants)
+        return static_assets
+
+    @classmethod
+    def from_source(cls, source_dir: str) -> "StaticAssets":
+        static_assets = cls()
+        for name, path in list_files(source_dir):
+            with open(path, "rb") as f:
+                content = f.read()
+            variants = {"": content, **compress(content)}
+            static_assets.add(name, fingerprint(name, content), variants)
+        return static_assets
+
+    @classmethod
+    def load(cls, source_dir: str, build_dir: Optional[str] = None) -> "StaticAssets":
+        build_dir = build_dir or DEFAULT_BUILD_DIR
+        if os.path.exists(os.path.join(build_dir, MANIFEST_NAME)):
+            return cls.from_build(build_dir)
+        return cls.from_source(source_dir)
+
+    def get_url_filename(self, filename: str) -> str:
+        return self.manifest.get(filename, filename)
+
+
+class StaticAssetMiddleware:
+    """
+    A WSGI middleware that answers GET and HEAD requests for static files
+    before they reach Flask, so that they skip the session, the injector and
+    the `Cache-Control: no-store` header that dynamic responses get. Other
+    requests under *url_path* (e.g., for missing files) fall through to
+    Flask.
+    """
+
+    def __init__(self, wsgi_app: Callable, assets: StaticAssets, url_path: str):
+        self.wsgi_app = wsgi_app
+        self.assets = assets
+        self.prefix = url_path.rstrip("/") + "/"
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        method = environ.get("REQUEST_METHOD")
+        if method in ("GET", "HEAD") and path.startswith(self.prefix):
+            asset = self.assets.assets.get(path[len(self.prefix) :])
+            if asset:
+                return self.serve(asset, environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    @staticmethod
+    def serve(asset: StaticAsset, environ, start_response) -> List[bytes]:
+        encoding = asset.negotiate(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        etag = f'"{asset.digest}{"-" + encoding if encoding else ""}"'
+        headers = [
+            ("Cache-Control", asset.cache_control),
+            ("ETag", etag),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if etag in environ.get("HTTP_IF_NONE_MATCH", ""):
+            start_response("304 Not Modified", headers)
+            return []
+        body = asset.variants[encoding]
+        headers += [
+            ("Content-Type", asset.content_type),
+            ("Content-Length", str(len(body))),
+        ]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        start_response("200 OK", headers)
+        return [] if environ["REQUEST_METHOD"] == "HEAD" else [body]
+
+
+if __name__ == "__main__":
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_BUILD_DIR
+    built = build_static_assets(os.path.join(PACKAGE_DIR, "static"), output_dir)
+    print(f"Built {len(built)} static assets into {output_dir}")
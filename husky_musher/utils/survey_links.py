@@ -0,0 +1,146 @@
+"""
+Works out which survey `/` sends each participant to, and starts doing so
+as soon as they sign in.
+
+Signing in ends with a redirect to `/`, which used to be the first time
+the participant's record was looked up, registered if needed, and their
+survey link generated: one REDCap call after another, while they wait.
+Instead, the SAML login starts that work in the background as soon as the
+NetID is known, and caches the resulting link for the redirect that
+follows. The participant is about to wait on it, so the prefetch has
+interactive priority (see husky_musher/utils/rate_limit.py). If the
+prefetch is still running (in this worker or another), `/` waits for it,
+for at most as long as an interactive call may wait for the rate limit,
+rather than starting over. The ASGI entry point's `/` does the same (see
+`ASGIApp.get_prefetched_link`).
+
+The prefetched link is only used once: `/` deletes it as it redirects, so
+later visits look the link up again, and a participant who has since
+finished a survey is sent on to the next one. A link that `/` doesn't use
+expires after `survey_link_cache_seconds`, and is evicted sooner if the
+participant's record changes in REDCap (see `ParticipantSync.update_cache`)
+or is deleted from the cache by an admin.
+"""
+import threading
+import time
+from logging import Logger
+from typing import Dict, Optional
+
+from injector import inject, singleton
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache, Lease
+from husky_musher.utils.redcap import REDCapClient
+
+# Because of REDCap's survey queue logic, we can point a participant to an
+# upstream survey. If they've completed it, REDCap will automatically direct
+# them to the next, uncompleted survey in the queue.
+ENROLLMENT_EVENT = "enrollment_arm_1"
+ENROLLMENT_INSTRUMENT = "enrollment_questions"
+
+# A prefetch that runs longer (e.g., in a worker that died) stops holding
+# up `/`
+PREFETCH_LEASE_SECONDS = 10
+PREFETCH_POLL_SECONDS = 0.05
+
+
+def get_survey_link_key(netid: str) -> str:
+    return f"{netid}.surveyLink"
+
+
+@singleton
+class SurveyLinks:
+    @inject
+    def __init__(
+        self, client: REDCapClient, cache: Cache, settings: AppSettings, logger: Logger
+    ):
+        self.client = client
+        self.cache = cache
+        self.cache_seconds = settings.survey_link_cache_seconds
+        self.max_wait_seconds = settings.redcap_rate_limit_max_wait_seconds
+        self.logger = logger.getChild("survey_links")
+
+    def get_prefetch_lease(self, netid: str) -> Lease:
+        return Lease(self.cache, f"prefetch.{netid}", PREFETCH_LEASE_SECONDS)
+
+    def get_cached(self, netid: str) -> Optional[str]:
+        link = self.cache.get(get_survey_link_key(netid))
+        return link.decode() if isinstance(link, bytes) else link
+
+    def look_up(self, user_info: Dict) -> str:
+        """
+        Returns the link to send the participant with *user_info* to,
+        registering them in REDCap first if needed.
+        """
+        client = self.client
+        netid = user_info["uw_netid"]
+        redcap_record = client.fetch_participant(user_info)
+
+        if not redcap_record:
+            # If not in REDCap project, create new record
+            new_record_id = client.register_participant(user_info)
+            redcap_record = {"record_id": new_record_id}
+
+        record_id = redcap_record.get("record_id")
+
+        # If all enrollment event instruments are complete, point participants
+        # to today's daily attestation instrument.
+        # If the participant has already completed the daily attestation,
+        # REDCap will prevent the participant from filling out the survey again.
+        if client.redcap_registration_complete(redcap_record, netid=netid):
+            return client.generate_surveyqueue_link(record_id)
+        return client.generate_enrollment_survey_link(
+            record_id, ENROLLMENT_EVENT, ENROLLMENT_INSTRUMENT
+        )
+
+    def get(self, user_info: Dict) -> str:
+        """
+        Returns the link prefetched for the participant with *user_info*,
+        and deletes it; waits for it if it is being prefetched, and looks
+        it up otherwise.
+        """
+        netid = user_info["uw_netid"]
+        if not self.cache_seconds:
+            return self.look_up(user_info)
+        link = self.get_cached(netid)
+        lease = self.get_prefetch_lease(netid)
+        deadline = time.monotonic() + self.max_wait_seconds
+        while not link and time.monotonic() < deadline and lease.is_held():
+            time.sleep(PREFETCH_POLL_SECONDS)
+            link = self.get_cached(netid)
+        if not link:
+            return self.look_up(user_info)
+        self.cache.delete(get_survey_link_key(netid))
+        return link
+
+    def prefetch(self, user_info: Dict):
+        """
+        Starts looking up the link for the participant with *user_info* in
+        the background, unless it is cached or already being looked up.
+        """
+        netid = user_info["uw_netid"]
+        if not (self.cache_seconds and netid) or self.get_cached(netid):
+            return
+        lease = self.get_prefetch_lease(netid)
+        if not lease.acquire():
+            return
+        threading.Thread(
+            target=self._prefetch, args=(user_info, lease), daemon=True
+        ).start()
+
+    def _prefetch(self, user_info: Dict, lease: Lease):
+        try:
+            # Interactive priority: the participant's browser is on its way
+            link = self.look_up(user_info)
+            self.cache.set(
+                get_survey_link_key(user_info["uw_netid"]),
+                link,
+                expire_seconds=self.cache_seconds,
+            )
+        except Exception as e:
+            # `/` will look the link up itself
+            self.logger.warning(
+                f"Unable to prefetch the survey link of {user_info['uw_netid']}: {e}"
+            )
+        finally:
+            lease.release()
@@ -0,0 +1,181 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from logging import Logger
+from typing import Any, Dict, List, Optional, Set
+
+from injector import inject, singleton
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache
+from husky_musher.utils.record_schema import tag_record
+from husky_musher.utils.redcap import REDCAP_DATETIME_FORMAT, REDCapClient
+from husky_musher.utils.survey_links import get_survey_link_key
+
+
+def get_redcap_now(timezone: str) -> datetime:
+    """
+    The current time on the REDCap server's clock, which is how REDCap
+    interprets the date ranges of exports.
+    """
+    try:
+        from zoneinfo import ZoneInfo
+    except ImportError:
+        # Python 3.8; assume the REDCap server uses our time zone
+        return datetime.now().replace(microsecond=0)
+    return datetime.now(ZoneInfo(timezone)).replace(tzinfo=None, microsecond=0)
+
+
+@singleton
+class ParticipantSync:
+    """
+    Keeps the cache up to date with changes made in REDCap, instead of only
+    learning about participants when they visit: exports the records that
+    changed since the last sync (the watermark), then caches those who have
+    completed registration, and evicts those who have not, e.g., because an
+    admin reset their record.
+    """
+
+    watermark_key = "sync.watermark"
+
+    @inject
+    def __init__(
+        self,
+        client: REDCapClient,
+        cache: Cache,
+        settings: AppSettings,
+        logger: Logger,
+    ):
+        self.client = client
+        self.cache = cache
+        self.settings = settings
+        self.logger = logger.getChild("sync")
+        # Records modified while a sync is running may be logged with a
+        # slightly earlier time, so each sync starts a bit before the last
+        # one ended; caching a record twice is harmless.
+        self.overlap = timedelta(seconds=settings.redcap_sync_overlap_seconds)
+
+    def get_watermark(self) -> Optional[datetime]:
+        value = self.cache.get(self.watermark_key)
+        if isinstance(value, bytes):
+            value = value.decode()
+        return datetime.strptime(value, REDCAP_DATETIME_FORMAT) if value else None
+
+    def sync(self) -> int:
+        """Returns the number of records that changed."""
+        now = get_redcap_now(self.settings.redcap_timezone)
+        watermark = self.get_watermark() or now - timedelta(
+            seconds=self.settings.redcap_sync_interval_seconds
+        )
+        records = self.client.fetch_participants_modified(watermark - self.overlap, now)
+        self.update_cache(
+            records, f"Synced {len(records)} records modified since {watermark}"
+        )
+        self.cache.set(self.watermark_key, now.strftime(REDCAP_DATETIME_FORMAT))
+        return len(records)
+
+    def refresh(self, record_ids: List[str]) -> int:
+        """
+        Updates the cache for the given records, e.g., when REDCap notifies
+        us that they were saved; returns the number of records found.
+        """
+        records = self.client.fetch_participants_by_record_id(record_ids)
+        self.update_cache(records, f"Refreshed {len(records)} records")
+        return len(records)
+
+    def update_cache(self, records: List[Dict[str, str]], message: str):
+        upserts, evictions = self.get_cache_changes(records)
+        if upserts:
+            self.cache.set_many(upserts, save_json=True)
+        index = self.get_index_entries(records)
+        if index:
+            self.cache.set_many(index)
+        # A participant whose record changed may now belong elsewhere (e.g.,
+        # the survey queue, once they complete enrollment)
+        links = [
+            get_survey_link_key(record["uw_netid"])
+            for record in records
+            if record.get("uw_netid")
+        ]
+        self.cache.delete(*evictions, *links)
+        self.logger.info(
+            message,
+            extra={
+                "cached": len(upserts) // 2,
+                "evicted": len(evictions) // 2,
+                "extra_keys": {"cached", "evicted"},
+            },
+        )
+
+    def get_cache_changes(self, records: List[Dict[str, str]]):
+        """
+        Returns the cache entries to set, and the keys to delete, so that the
+        cache reflects *records*; the entries match those that
+        `REDCapClient.fetch_participant` and `redcap_registration_complete`
+        would set.
+        """
+        upserts: Dict[str, Any] = {}
+        evictions: List[str] = []
+        for record in records:
+            netid = record.get("uw_netid")
+            if not netid:
+                continue
+            if self.client.redcap_registration_complete(record):
+                upserts[netid] = tag_record(record)
+                upserts[f"{netid}.registrationComplete"] = True
+            else:
+                evictions += [netid, f"{netid}.registrationComplete"]
+        return upserts, evictions
+
+    @staticmethod
+    def get_index_entries(records: List[Dict[str, str]]) -> Dict[str, str]:
+        """
+        Returns the record index entries (see `REDCapClient.index_record_id`)
+        for *records*, whether or not they have completed registration.
+        """
+        return {
+            f"{record['uw_netid']}.recordId": record["record_id"]
+            for record in records
+            if record.get("uw_netid")
+        }
+
+
+@singleton
+class RecordRefreshQueue:
+    """
+    Collects the IDs of records to refresh (see `ParticipantSync.refresh`),
+    and refreshes them in batches: the first ID queued starts a countdown
+    of *debounce_seconds*, after which every ID queued so far is refreshed
+    with a single REDCap call. A burst of saves (e.g., a participant
+    completing several instruments in a row) costs one call, not one each.
+    """
+
+    @inject
+    def __init__(self, sync: ParticipantSync, settings: AppSettings, logger: Logger):
+        self.sync = sync
+        self.debounce_seconds = settings.redcap_trigger_debounce_seconds
+        self.logger = logger.getChild("sync")
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def enqueue(self, record_id: str):
+        with self._lock:
+            flush_scheduled = bool(self._pending)
+            self._pending.add(record_id)
+        if not flush_scheduled:
+            threading.Thread(target=self._flush_later, daemon=True).start()
+
+    def _flush_later(self):
+        time.sleep(self.debounce_seconds)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            record_ids, self._pending = sorted(self._pending), set()
+        if not record_ids:
+            return
+        try:
+            self.sync.refresh(record_ids)
+        except Exception as e:
+            # The periodic sync will pick these records up
+            self.logger.exception(f"Unable to refresh records {record_ids}: {e}")
@@ -0,0 +1,31 @@
+import logging
+
+import pytest
+from injector import Injector
+
+from benchmarks.fake_redcap import FakeREDCap, start_server
+from husky_musher.app import AppInjectorModule
+from husky_musher.settings import AppSettings
+from husky_musher.utils.redcap import RedcapInjectorModule
+
+
+@pytest.fixture
+def redcap():
+    """A fake REDCap, served on a local port (at `redcap.url`)."""
+    redcap = FakeREDCap()
+    server = start_server(redcap)
+    redcap.url = f"http://127.0.0.1:{server.server_port}/"
+    yield redcap
+    server.shutdown()
+
+
+@pytest.fixture
+def injector(redcap):
+    """The app's injector, with MockRedis as the cache, calling *redcap*."""
+    settings = AppSettings()
+    settings.redis_host = None
+    settings.redcap_api_url = redcap.url
+    injector = Injector([AppInjectorModule, RedcapInjectorModule])
+    injector.binder.bind(AppSettings, to=settings)
+    injector.binder.bind(logging.Logger, to=logging.getLogger("test"))
+    return injector
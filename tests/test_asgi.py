@@ -0,0 +1,66 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from husky_musher.asgi import ASGIApp, check_asgi_requirements, create_asgi_app
+from husky_musher.settings import AppSettings
+from husky_musher.utils.survey_links import SurveyLinks
+
+
+def test_check_asgi_requirements():
+    settings = AppSettings()
+    settings.redis_host = "redis"
+    with mock.patch(
+        "husky_musher.asgi.is_installed",
+        side_effect=lambda module: module not in ("httpx", "redis.asyncio", "aioredis"),
+    ):
+        with pytest.raises(RuntimeError, match="httpx, redis>=4.2 or aioredis"):
+            check_asgi_requirements(settings)
+        # MockRedis needs no asyncio client
+        settings.redis_host = None
+        with pytest.raises(RuntimeError, match="installed: httpx. "):
+            check_asgi_requirements(settings)
+
+
+async def get_redirect(app: ASGIApp, cookie: str) -> str:
+    """Returns the location that the ASGI app redirects `/` to."""
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"cookie", cookie.encode())],
+    }
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, None, send)
+    assert messages[0]["status"] == 302
+    return dict(messages[0]["headers"])[b"location"].decode()
+
+
+def test_redirect_uses_prefetched_link(redcap, injector):
+    injector.get(AppSettings).use_mock_idp = True
+    app = create_asgi_app(injector)
+    links = injector.get(SurveyLinks)
+    redcap.latency_seconds = 0.1
+
+    # The Flask app signs the participant in, and starts the prefetch
+    response = app.app.test_client().get("/mock-saml/login?uwnetid=dawg")
+    cookie = response.headers["Set-Cookie"].split(";")[0]
+
+    async def visit():
+        try:
+            return await get_redirect(app, cookie)
+        finally:
+            await app.client.close()
+
+    # `/` waits for the prefetch, rather than calling REDCap again
+    location = asyncio.run(visit())
+    assert "enrollment_questions" in location
+    assert redcap.calls["import_record"] == 1
+    assert redcap.calls["surveyLink"] == 1
+    # The link is only used once
+    assert links.get_cached("dawg") is None
@@ -0,0 +1,30 @@
+import csv
+import json
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache, MockRedis
+from husky_musher.utils.cache_export import ParticipantExport
+
+
+def test_participant_export():
+    cache = Cache(MockRedis(), AppSettings())
+    for i in range(5):
+        cache.set(f"netid{i}", {"record_id": str(i)}, save_json=True)
+    cache.set("netid1.registrationComplete", True, save_json=True)
+    cache.set("sessions.abc", "{}")
+    # Entries that aren't participants' records
+    cache.set("test", "ok")
+    cache.set("netid5", "not json")
+    cache.set("netid6", ["not", "a", "record"], save_json=True)
+    cache.set("rate_limits.redcap", "{}")
+    export = ParticipantExport(cache)
+    export.batch_size = 2
+
+    rows = list(csv.DictReader("".join(export.iter_csv()).splitlines()))
+    assert sorted(r["uw_netid"] for r in rows) == [f"netid{i}" for i in range(5)]
+    assert {r["uw_netid"]: r["registration_complete"] for r in rows}["netid1"] == "True"
+
+    lines = "".join(export.iter_ndjson()).splitlines()
+    assert {"uw_netid": "netid3", "record_id": "3", "registration_complete": False} in [
+        json.loads(line) for line in lines
+    ]
@@ -0,0 +1,27 @@
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache, MockRedis
+from husky_musher.utils.cache_stats import CacheAnalyzer
+
+
+def test_cache_analyzer():
+    settings = AppSettings()
+    cache = Cache(MockRedis(), settings)
+    cache.set("dawg", {"record_id": "1"}, save_json=True)
+    cache.set("dawg.registrationComplete", True, save_json=True)
+    cache.set("sessions.abc", "{}", expire_seconds=600)
+    cache.redis.set("other-app:key", "value")
+    # Stands in for the rate limiter's bucket, a hash in redis
+    cache.set("rate_limits.redcap", "10")
+    analyzer = CacheAnalyzer(cache, settings)
+
+    report = analyzer.get_report()
+    assert report["complete"]
+    families = {f["name"]: f for f in report["families"]}
+    assert set(families) == {"records", "completion flags", "sessions", "rate limits"}
+    assert families["sessions"]["ttl_buckets"]["< 1h"] == 1
+    assert families["records"]["ttl_buckets"]["none"] == 1
+
+    # The report is reused until it expires
+    cache.set("husky.registrationComplete", True, save_json=True)
+    assert analyzer.get_report() == report
+    assert analyzer.get_report(refresh=True)["families"] != report["families"]
@@ -0,0 +1,28 @@
+import os
+import runpy
+from types import SimpleNamespace
+from unittest import mock
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+
+
+def load_conf(monkeypatch, tmpdir):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmpdir))
+    # Keeps the test process from being monkey patched
+    with mock.patch("gevent.monkey.patch_all"):
+        return runpy.run_path(CONF_PATH)
+
+
+def test_worker_exit_stops_background_jobs(monkeypatch, tmpdir):
+    conf = load_conf(monkeypatch, tmpdir)
+    jobs = mock.Mock()
+    # gunicorn calls the hook as `cfg.worker_exit(arbiter, worker)`; the
+    # arbiter has no `wsgi`
+    server = SimpleNamespace(pid=1, log=mock.Mock())
+    worker = SimpleNamespace(
+        pid=2,
+        log=mock.Mock(),
+        wsgi=SimpleNamespace(extensions={"background_jobs": jobs}),
+    )
+    conf["worker_exit"](server, worker)
+    jobs.stop.assert_called_once()
@@ -0,0 +1,27 @@
+from unittest import mock
+
+import pytest
+from flask import Request
+from werkzeug.local import LocalProxy
+
+from husky_musher.app import create_app, create_app_injector
+from husky_musher.utils.injection import request_scoped
+from husky_musher.utils.redcap import REDCapClient
+
+
+def test_request_scoped_views():
+    injector = create_app_injector()
+    app = create_app(injector)
+
+    with mock.patch.object(injector, "call_with_injection") as call_with_injection:
+        response = app.test_client().get("/")
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/saml/login")
+    # The view got the session without going through the injector
+    call_with_injection.assert_not_called()
+
+    def view(request: Request, session: LocalProxy, client: REDCapClient):
+        pass
+
+    with pytest.raises(TypeError, match="not request-scoped"):
+        request_scoped(view)
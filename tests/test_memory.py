@@ -0,0 +1,62 @@
+import logging
+import threading
+import time
+from unittest import mock
+
+from prometheus_client import CollectorRegistry
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.memory import (
+    MemoryMonitor,
+    WorkerAllocatedBlocksGauge,
+    WorkerMemoryGauge,
+    WorkerMemoryRecycleCounter,
+    diff_allocations,
+)
+
+
+def test_memory_monitor():
+    settings = AppSettings()
+    settings.worker_memory_limit_mb = 1024
+    settings.worker_memory_limit_jitter = 0.1
+    registry = CollectorRegistry()
+    monitor = MemoryMonitor(
+        settings,
+        logging.getLogger("test"),
+        WorkerMemoryGauge("memory", "", labelnames=["kind"], registry=registry),
+        WorkerAllocatedBlocksGauge("blocks", "", registry=registry),
+        WorkerMemoryRecycleCounter("recycles", "", registry=registry),
+    )
+    assert 0.9 * 1024 ** 3 <= monitor.worker_limit_bytes <= 1024 ** 3
+    monitor.recycle = mock.Mock()
+
+    usage = monitor.check()
+    assert usage["private"] > 0
+    assert registry.get_sample_value("memory", {"kind": "private"}) == usage["private"]
+    monitor.recycle.assert_not_called()
+
+    # Over the limit, the worker is recycled once
+    monitor.worker_limit_bytes = 1
+    monitor.check()
+    monitor.check()
+    monitor.recycle.assert_called_once()
+    assert registry.get_sample_value("recycles_total") == 1
+
+
+def test_diff_allocations():
+    held = []
+
+    def allocate():
+        for _ in range(20):
+            held.append(bytearray(100_000))
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=allocate)
+    thread.start()
+    diff = diff_allocations(0.5)
+    thread.join()
+
+    top = diff.top(1)[0]
+    assert top.traceback[0].filename == __file__
+    assert top.size_diff >= 1_000_000
+    assert "test_memory.py" in diff.to_text()
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, values
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from husky_musher.utils.metrics import compact_multiprocess_files
+
+
+def collect(directory):
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=directory)
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for metric in registry.collect()
+        for sample in metric.samples
+    }
+
+
+def write_metrics(directory, pid, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", directory)
+    monkeypatch.setattr(
+        values, "ValueClass", values.MultiProcessValue(process_identifier=lambda: pid)
+    )
+    registry = CollectorRegistry()
+    counter = Counter("requests", "", labelnames=["status"], registry=registry)
+    histogram = Histogram("latency", "", buckets=(0.1, 1.0), registry=registry)
+    counter.labels("200").inc(pid)
+    histogram.observe(0.05 * pid)
+
+
+def test_compact_multiprocess_files(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    for pid in (1, 2, 3):
+        write_metrics(directory, pid, monkeypatch)
+    expected = collect(directory)
+
+    assert compact_multiprocess_files(directory, live_pids={3}) == 4
+    assert sorted(os.listdir(directory)) == [
+        "compaction.lock",
+        "counter_3.db",
+        "counter_archive.db",
+        "histogram_3.db",
+        "histogram_archive.db",
+    ]
+    assert collect(directory) == pytest.approx(expected)
+
+    # Compacting again folds into the existing archive without losing anything
+    write_metrics(directory, 4, monkeypatch)
+    expected = collect(directory)
+    assert compact_multiprocess_files(directory, live_pids=set()) == 4
+    assert collect(directory) == pytest.approx(expected)
+    assert collect(directory)[("requests_total", (("status", "200"),))] == 10
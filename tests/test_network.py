@@ -0,0 +1,67 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import pytest
+import requests
+
+from husky_musher.utils.network import (
+    DNSCache,
+    NetworkPhase,
+    TimedHTTPAdapter,
+    record_network_phases,
+)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_network_phases(server):
+    dns_cache = DNSCache(ttl_seconds=60)
+    session = requests.Session()
+    session.mount("http://", TimedHTTPAdapter(dns_cache=dns_cache))
+    url = f"http://localhost:{server.server_port}/"
+
+    with mock.patch("socket.getaddrinfo", wraps=socket.getaddrinfo) as getaddrinfo:
+        with record_network_phases() as phases:
+            assert session.get(url).text == "ok"
+        assert set(phases) == {NetworkPhase.dns, NetworkPhase.connect, NetworkPhase.ttfb}
+        # The connection is kept alive
+        with record_network_phases() as phases:
+            session.get(url)
+        assert set(phases) == {NetworkPhase.ttfb}
+        # New connections reuse the resolved addresses
+        session.close()
+        session.get(url)
+    # urllib3 also passes the addresses themselves to getaddrinfo
+    lookups = [c for c in getaddrinfo.call_args_list if c.args[0] == "localhost"]
+    assert len(lookups) == 1
+
+    # Addresses that refuse connections are forgotten
+    server.shutdown()
+    server.server_close()
+    session.close()
+    with pytest.raises(requests.ConnectionError):
+        session.get(url)
+    assert not dns_cache._entries
@@ -0,0 +1,54 @@
+import logging
+import socket
+from types import SimpleNamespace
+from unittest import mock
+
+from flask import Flask
+from redis import Redis
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache, MockRedis
+from husky_musher.utils.probes import ProbeMiddleware, ReadinessChecks
+
+
+def test_probes():
+    settings = AppSettings()
+    settings.readiness_check_interval_seconds = 60
+    cache = Cache(MockRedis(), settings)
+    # No REDCap is configured
+    client = SimpleNamespace(api_url=None)
+    readiness = ReadinessChecks(cache, client, settings, logging.getLogger("test"))
+    app = Flask(__name__)
+    app.wsgi_app = ProbeMiddleware(app.wsgi_app, readiness)
+    test_client = app.test_client()
+
+    assert test_client.get("/healthz").json == {"live": True}
+    with mock.patch.object(
+        cache.redis, "ping", side_effect=ConnectionError
+    ) as ping:
+        for _ in range(3):
+            response = test_client.get("/readyz")
+            assert response.status_code == 503
+            assert response.json["redis"]["error"] == "ConnectionError"
+    # The checks ran once; the other probes reused the results
+    ping.assert_called_once()
+
+
+def test_redis_check_times_out():
+    settings = AppSettings()
+    settings.readiness_timeout_seconds = 0.2
+    # Accepts connections (in its backlog), but never responds
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    redis = Redis(host="127.0.0.1", port=listener.getsockname()[1])
+    client = SimpleNamespace(api_url=None)
+    readiness = ReadinessChecks(
+        Cache(redis, settings), client, settings, logging.getLogger("test")
+    )
+    try:
+        results = readiness.run_checks()
+    finally:
+        listener.close()
+    assert results["redis"]["error"] == "TimeoutError"
+    assert results["redis"]["seconds"] < 1
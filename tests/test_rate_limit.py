@@ -0,0 +1,82 @@
+import logging
+import multiprocessing
+
+import pytest
+from prometheus_client import CollectorRegistry
+from werkzeug.exceptions import ServiceUnavailable
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache, MockRedis
+from husky_musher.utils.rate_limit import (
+    Priority,
+    REDCapRateLimiter,
+    REDCapRateLimitWaitHistogram,
+    REDCapThrottledCounter,
+)
+from husky_musher.utils.shared_cache import SharedMemoryRedis
+
+# Inherited by the test's forked processes
+shared_limiter = None
+
+
+def create_limiter(redis, per_minute: float = 600) -> REDCapRateLimiter:
+    settings = AppSettings()
+    settings.redcap_rate_limit_per_minute = per_minute
+    settings.redcap_rate_limit_burst = 4
+    settings.redcap_rate_limit_max_wait_seconds = 1
+    settings.redcap_rate_limit_background_max_wait_seconds = 0
+    registry = CollectorRegistry()
+    return REDCapRateLimiter(
+        Cache(redis, settings),
+        settings,
+        logging.getLogger("test"),
+        REDCapRateLimitWaitHistogram(
+            "wait_seconds", "", labelnames=["priority"], registry=registry
+        ),
+        REDCapThrottledCounter(
+            "throttled", "", labelnames=["priority", "outcome"], registry=registry
+        ),
+    )
+
+
+@pytest.fixture
+def limiter():
+    return create_limiter(MockRedis())
+
+
+def take_tokens(taken):
+    taken.put(sum(not shared_limiter.take(Priority.interactive) for _ in range(4)))
+
+
+def test_rate_limiter(limiter):
+    # Background calls leave the last token of the burst to interactive calls
+    for _ in range(3):
+        limiter.acquire(Priority.background)
+    with pytest.raises(ServiceUnavailable):
+        limiter.acquire(Priority.background)
+    limiter.acquire(Priority.interactive)
+
+    # Once the bucket is empty, interactive calls wait for it to refill
+    # (at 10 calls per second)
+    limiter.acquire(Priority.interactive)
+    assert limiter.throttled.labels("interactive", "delayed")._value.get() == 1
+    assert limiter.throttled.labels("background", "rejected")._value.get() == 1
+
+
+def test_shared_memory_rate_limit(tmp_path):
+    global shared_limiter
+    # Slow enough not to refill during the test
+    shared_limiter = create_limiter(
+        SharedMemoryRedis(str(tmp_path / "cache"), slots=16, slot_bytes=128),
+        per_minute=0.6,
+    )
+    # Processes on the same host share the burst of 4, rather than each
+    # having its own
+    context = multiprocessing.get_context("fork")
+    taken = context.Queue()
+    processes = [context.Process(target=take_tokens, args=(taken,)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert taken.get() + taken.get() == 4
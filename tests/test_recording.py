@@ -0,0 +1,73 @@
+import json
+
+import requests
+
+from husky_musher.utils.recording import REDCapRecorder, ReplayAdapter, load_captures
+
+
+def test_record_and_replay(tmpdir):
+    path = str(tmpdir.join("capture.jsonl"))
+    recorder = REDCapRecorder(path)
+    recorder.record(
+        "fetch_participant",
+        {
+            "token": "secret",
+            "content": "record",
+            "filterLogic": '[uw_netid] = "husky"',
+        },
+        200,
+        json.dumps([{"uw_netid": "husky", "record_id": "1"}]),
+        elapsed=0.25,
+        request_bytes=50,
+        response_bytes=40,
+    )
+
+    with open(path) as f:
+        captured = f.read()
+    assert "secret" not in captured
+    assert "husky" not in captured
+    [capture] = load_captures(path)
+    assert capture["key"] == "record:export"
+    records = json.loads(capture["response"])
+    # The same value gets the same pseudonym throughout the call
+    assert records[0]["uw_netid"] in capture["request"]["filterLogic"]
+    assert records[0]["record_id"] == "1"
+
+    session = requests.Session()
+    session.mount("https://", ReplayAdapter.from_file(path, speed=0))
+    response = session.post(
+        "https://redcap.example.edu/api/", data={"content": "record", "token": "x"}
+    )
+    assert response.status_code == 200
+    assert response.json() == records
+    response = session.post(
+        "https://redcap.example.edu/api/", data={"content": "surveyLink"}
+    )
+    assert response.status_code == 400
+
+
+def test_survey_links_are_sanitized(tmpdir):
+    path = str(tmpdir.join("capture.jsonl"))
+    recorder = REDCapRecorder(path)
+    for content, link in [
+        ("surveyLink", "https://redcap.example.edu/surveys/?s=ABCD1234EF"),
+        ("surveyQueueLink", "https://redcap.example.edu/surveys/?sq=XYZ987"),
+    ]:
+        recorder.record(
+            content,
+            {"token": "secret", "content": content, "record": "1"},
+            200,
+            link,
+            elapsed=0.1,
+            request_bytes=50,
+            response_bytes=len(link),
+        )
+
+    with open(path) as f:
+        captured = f.read()
+    assert "ABCD1234EF" not in captured
+    assert "XYZ987" not in captured
+    link, queue_link = (capture["response"] for capture in load_captures(path))
+    # Replayed links keep their shape
+    assert link.startswith("https://redcap.example.edu/surveys/?s=anon-")
+    assert queue_link.startswith("https://redcap.example.edu/surveys/?sq=anon-")
@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.cache import Cache, Lease
+from husky_musher.utils.shared_cache import SharedMemoryRedis
+
+
+# Inherited by the test's forked processes
+shared_redis = None
+
+
+def count_open_files(path: str) -> int:
+    return sum(
+        os.path.realpath(f"/proc/self/fd/{fd}") == path
+        for fd in os.listdir("/proc/self/fd")
+    )
+
+
+def acquire_lease(_) -> bool:
+    return Lease(Cache(shared_redis, AppSettings()), "test", ttl_seconds=10).acquire()
+
+
+def test_shared_memory_redis(tmp_path):
+    global shared_redis
+    shared_redis = redis = SharedMemoryRedis(str(tmp_path / "cache"), slots=256, slot_bytes=256)
+    cache = Cache(redis, AppSettings())
+    cache.set("dawg", {"record_id": "1"})
+    assert cache.get("dawg", load_json=True) == {"record_id": "1"}
+    cache.set("flag", True, expire_seconds=60, save_json=True)
+    assert 0 < redis.pttl(cache.sanitize_key("flag")) <= 60_000
+    cache.delete("dawg")
+    assert cache.get("dawg") is None
+    # Too large for a slot
+    cache.set("flag", "x" * 1000)
+    assert cache.get("flag") is None
+
+    # Entries are shared with forked workers, and with processes that open
+    # the same file
+    context = multiprocessing.get_context("fork")
+    with context.Pool(4) as pool:
+        assert sum(pool.map(acquire_lease, range(4))) == 1
+    other = SharedMemoryRedis(str(tmp_path / "cache"))
+    assert other.slots == 256
+    assert other.get(cache.sanitize_key("leases.test"))
+
+
+def test_forked_workers_reopen_the_lock_file(tmp_path):
+    path = str(tmp_path / "cache")
+    redis = SharedMemoryRedis(path, slots=16, slot_bytes=64)  # noqa: F841
+    context = multiprocessing.get_context("fork")
+    with context.Pool(1) as pool:
+        # The worker's own descriptor replaces the one it inherited
+        assert pool.apply(count_open_files, (path,)) == count_open_files(path)
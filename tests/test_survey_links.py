@@ -0,0 +1,49 @@
+import time
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils.shibboleth import extract_user_info
+from husky_musher.utils.survey_links import SurveyLinks
+from husky_musher.utils.sync import ParticipantSync
+
+
+def test_prefetch(redcap, injector):
+    links = injector.get(SurveyLinks)
+    user_info = extract_user_info({"uwnetid": "dawg", "email": "dawg@uw.edu"})
+    redcap.latency_seconds = 0.1
+
+    # Signing in twice (or in two workers) looks the link up once, and `/`
+    # waits for it rather than looking it up again
+    links.prefetch(user_info)
+    links.prefetch(user_info)
+    link = links.get(user_info)
+    assert "enrollment_questions" in link
+    assert redcap.calls["import_record"] == 1
+    assert redcap.calls["surveyLink"] == 1
+
+    # The prefetched link is only used once
+    assert links.get_cached("dawg") is None
+    record_id = link.split("=")[1].split("-")[0]
+    redcap.update_record(record_id, enrollment_questions_complete="2")
+    assert links.get(user_info) == f"https://redcap.example.edu/surveys/?sq={record_id}"
+
+    # A link prefetched before the participant's record changed is evicted
+    redcap.update_record(record_id, enrollment_questions_complete="0")
+    links.prefetch(user_info)
+    while links.get_prefetch_lease("dawg").is_held():
+        time.sleep(0.01)
+    assert links.get_cached("dawg")
+    redcap.update_record(record_id, enrollment_questions_complete="2")
+    injector.get(ParticipantSync).sync()
+    assert links.get_cached("dawg") is None
+
+
+def test_get_waits_for_prefetch_at_most_max_wait(redcap, injector):
+    injector.get(AppSettings).redcap_rate_limit_max_wait_seconds = 0.2
+    links = injector.get(SurveyLinks)
+    user_info = extract_user_info({"uwnetid": "dawg"})
+    # A prefetch that is stuck, e.g., in a worker that died
+    assert links.get_prefetch_lease("dawg").acquire()
+
+    start_time = time.monotonic()
+    assert "enrollment_questions" in links.get(user_info)
+    assert time.monotonic() - start_time < 2
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from husky_musher.settings import AppSettings
+from husky_musher.utils import record_schema
+from husky_musher.utils.cache import Cache
+from husky_musher.utils.redcap import REDCapClient
+from husky_musher.utils.sync import ParticipantSync, RecordRefreshQueue
+
+
+def test_sync(redcap, injector):
+    cache = injector.get(Cache)
+    sync = injector.get(ParticipantSync)
+    enrolled = redcap.add_record(uw_netid="enrolled", enrollment_questions_complete="2")
+    redcap.add_record(uw_netid="registered", enrollment_questions_complete="0")
+    cache.set("registered", {"record_id": "stale"})
+
+    assert sync.sync() == 2
+    assert cache.get("enrolled", load_json=True)["record_id"] == enrolled
+    assert cache.get("enrolled.registrationComplete", load_json=True) is True
+    assert cache.get("registered") is None
+    assert sync.get_watermark()
+
+    # An admin resets the enrolled participant's survey
+    redcap.update_record(enrolled, enrollment_questions_complete="0")
+    sync.sync()
+    assert cache.get("enrolled") is None
+    assert cache.get("enrolled.registrationComplete") is None
+
+
+def test_data_entry_trigger(redcap, injector):
+    settings = injector.get(AppSettings)
+    settings.redcap_project_id = "1234"
+    settings.redcap_trigger_debounce_seconds = 60
+    cache = injector.get(Cache)
+    queue = injector.get(RecordRefreshQueue)
+    client = injector.get(Flask).test_client()
+    enrolled = redcap.add_record(uw_netid="enrolled", enrollment_questions_complete="2")
+    registered = redcap.add_record(uw_netid="registered")
+
+    trigger_url = "/redcap/data-entry-trigger"
+    response = client.post(trigger_url, data={"project_id": "1", "record": enrolled})
+    assert response.status_code == 403
+    for record_id in (enrolled, registered, enrolled):
+        response = client.post(
+            trigger_url, data={"project_id": "1234", "record": record_id}
+        )
+        assert response.status_code == 204
+    assert cache.get("enrolled") is None
+
+    redcap.reset_calls()
+    queue.flush()
+    assert redcap.calls["export_records"] == 1
+    assert cache.get("enrolled", load_json=True)["record_id"] == enrolled
+
+
+def test_concurrent_registration(redcap, injector):
+    redcap.latency_seconds = 0.2
+    client = injector.get(REDCapClient)
+    user_info = {"uw_netid": "newcomer"}
+    with ThreadPoolExecutor(3) as executor:
+        record_ids = list(
+            executor.map(lambda _: client.register_participant(user_info), range(3))
+        )
+    assert len(set(record_ids)) == 1
+    assert redcap.calls["import_record"] == 1
+
+
+def test_upgrade_cached_record(redcap, injector, monkeypatch):
+    cache = injector.get(Cache)
+    client = injector.get(REDCapClient)
+    refreshed = []
+    client.refresh_record_later = refreshed.append
+    user_info = {"uw_netid": "enrolled"}
+    # Cached before records were versioned
+    cache.set("enrolled", {"uw_netid": "enrolled", "record_id": "1"})
+
+    assert client.fetch_participant(user_info)["record_id"] == "1"
+    assert cache.get("enrolled", load_json=True)["_schema"] == 1
+    assert redcap.calls["export_records"] == 0
+
+    # A new version adds a field that only REDCap knows
+    monkeypatch.setattr(record_schema, "RECORD_SCHEMA_VERSION", 2)
+    monkeypatch.setitem(record_schema.MIGRATIONS, 1, lambda record: None)
+    assert client.fetch_participant(user_info)["record_id"] == "1"
+    assert refreshed == ["1"]
+    assert redcap.calls["export_records"] == 0
+
+
+def test_record_index(redcap, injector):
+    client = injector.get(REDCapClient)
+    lookups = client.record_index_lookups
+    record_id = redcap.add_record(uw_netid="registered")
+    user_info = {"uw_netid": "registered"}
+
+    # Found by NetID, then by record ID
+    for _ in range(2):
+        assert client.fetch_participant(user_info)["record_id"] == record_id
+    assert lookups.labels("miss")._value.get() == 1
+    assert lookups.labels("hit")._value.get() == 1
+
+    # The record was given to someone else
+    redcap.update_record(record_id, uw_netid="someone-else")
+    assert client.fetch_participant(user_info) is None
+    assert lookups.labels("stale")._value.get() == 1
+    assert client.get_indexed_record_id("registered") is None